@@ -0,0 +1,159 @@
+"""Hash archive members without extracting them to disk.
+
+Members are streamed from the archive straight into the hasher, so no
+temporary files are written.
+
+    Supported archives:
+
+    - tar, optionally compressed with gzip, bzip2, xz or zstd
+    - zip
+
+Zstandard support requires Python 3.14, or the optional ``zstandard``
+package.
+"""
+
+import tarfile
+import zipfile
+from typing import IO, Callable, Iterator, Optional
+
+import hash_profiles as Hp
+
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                '.tar.xz', '.txz', '.tar.zst', '.tzst')
+ZSTD_SUFFIXES = ('.tar.zst', '.tzst')
+ZIP_SUFFIXES = ('.zip',)
+
+BLOCKSIZE = 1024 * 1024
+
+
+class ArchiveError(Exception):
+    """Raised when an archive cannot be read."""
+
+
+class CountingReader:
+    """File wrapper that counts the bytes read through it.
+
+    Used to report progress through compressed archives.
+    """
+
+    def __init__(self, file_: IO[bytes],
+                 callback: Optional[Callable[[int], None]] = None) -> None:
+        self.file_ = file_
+        self.callback = callback
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the wrapped file."""
+        buf = self.file_.read(size)
+        self.bytes_read += len(buf)
+        if self.callback is not None:
+            self.callback(self.bytes_read)
+        return buf
+
+
+def is_archive(fname: str) -> bool:
+    """Return True if fname has the suffix of a supported archive."""
+    return fname.lower().endswith(TAR_SUFFIXES + ZIP_SUFFIXES)
+
+
+def _zstd_reader(file_) -> IO[bytes]:
+    """Return a decompressing reader for a zstd stream."""
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd.ZstdFile(file_)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError as err:
+        raise ArchiveError('Zstandard archives require Python 3.14 or '
+                           'the "zstandard" package.') from err
+    return zstandard.ZstdDecompressor().stream_reader(file_)
+
+
+def _hash_member(member: IO[bytes], alg_id: int,
+                 stop: Callable[[], bool]) -> 'bytes | None':
+    """Return digest of an open member, or None if stopped."""
+    hasher = Hp.get_hash(alg_id).hasher.copy()
+    while buf := member.read(BLOCKSIZE):
+        if stop():
+            return None
+        hasher.update(buf)
+    return hasher.digest()
+
+
+def _not_stopped() -> bool:
+    return False
+
+
+def iter_tar(fname: str, alg_id: int,
+             progress: Optional[Callable[[int], None]] = None,
+             stop: Callable[[], bool] = _not_stopped
+             ) -> Iterator['tuple[str, bytes]']:
+    """Yield (member name, digest) for each regular file in a tar
+    archive. The archive is read once, sequentially.
+
+    Args:
+        progress: Called with the number of (compressed) bytes read.
+        stop: Returns True when processing should stop.
+    """
+    with open(fname, 'rb') as raw:
+        reader = CountingReader(raw, progress)
+        source: IO[bytes] = reader  # type: ignore[assignment]
+        if fname.lower().endswith(ZSTD_SUFFIXES):
+            source = _zstd_reader(reader)
+        try:
+            with tarfile.open(fileobj=source, mode='r|*') as tar:
+                for info in tar:
+                    if not info.isfile():
+                        continue
+                    member = tar.extractfile(info)
+                    if member is None:
+                        continue
+                    digest = _hash_member(member, alg_id, stop)
+                    if digest is None:
+                        return
+                    yield (info.name, digest)
+        except tarfile.TarError as err:
+            raise ArchiveError(f'Could not read {fname}: {err}') from err
+
+
+def iter_zip(fname: str, alg_id: int,
+             progress: Optional[Callable[[int], None]] = None,
+             stop: Callable[[], bool] = _not_stopped
+             ) -> Iterator['tuple[str, bytes]']:
+    """Yield (member name, digest) for each file in a zip archive.
+
+    Args:
+        progress: Called with the compressed size of members processed.
+        stop: Returns True when processing should stop.
+    """
+    try:
+        with zipfile.ZipFile(fname) as zip_:
+            done = 0
+            for info in zip_.infolist():
+                if info.is_dir():
+                    continue
+                with zip_.open(info) as member:
+                    digest = _hash_member(member, alg_id, stop)
+                if digest is None:
+                    return
+                done += info.compress_size
+                if progress is not None:
+                    progress(done)
+                yield (info.filename, digest)
+    except (zipfile.BadZipFile, RuntimeError) as err:
+        raise ArchiveError(f'Could not read {fname}: {err}') from err
+
+
+def iter_archive(fname: str, alg_id: int,
+                 progress: Optional[Callable[[int], None]] = None,
+                 stop: Callable[[], bool] = _not_stopped
+                 ) -> Iterator['tuple[str, bytes]']:
+    """Yield (member name, digest) for each file in archive fname."""
+    if fname.lower().endswith(ZIP_SUFFIXES):
+        return iter_zip(fname, alg_id, progress, stop)
+    if fname.lower().endswith(TAR_SUFFIXES):
+        return iter_tar(fname, alg_id, progress, stop)
+    raise ArchiveError(f'{fname} is not a supported archive.')
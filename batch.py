@@ -0,0 +1,340 @@
+"""Batched hashing of many files, optimised for trees of small files.
+
+For small files the cost of hashing is dominated by the per-file system
+calls rather than by reading and hashing the data. This module:
+
+    - Avoids a separate stat() per file. Each file is read into a
+      reused per-thread buffer until a read returns no data, which for
+      a small file is one read() of the data and one at end of file. A
+      short read is not taken as end of file, as pipes and network
+      filesystems may return data in pieces.
+    - Hands files to a pool of worker threads in batches, so that each
+      worker wake-up hashes many files. The blocking system calls
+      release the GIL, so the opens and reads of different files
+      overlap.
+    - Walks directories with os.scandir(), which does not stat regular
+      files.
+
+Work runs in a pool of threads or of processes. Processes suit
+algorithms that hold the GIL (see :py:func:`hash_profiles.holds_gil`)
+and trees of very small files, where hashlib's small updates also hold
+the GIL. Only file names are sent to a worker process, and only digests
+are returned.
+
+Results are :py:class:`results.Result` tuples holding the raw digest,
+or an error message for files that could not be read.
+
+:py:func:`hash_unique` hashes each file once, however many hard links
+to it are found. Files are identified by (st_dev, st_ino) from a
+stat() of the directory entry, as the inode number of the entry alone
+does not identify a file on overlay and FUSE filesystems. Only files
+with more than one link are tracked, so memory does not grow with the
+size of the tree.
+
+:py:func:`iter_file_list` reads newline or NUL separated lists of paths
+as a stream, for :py:func:`hash_batches` to hash as they are read.
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, Executor, Future,
+                                ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed, wait)
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Union
+
+import hash_profiles as Hp
+from results import Result
+
+
+# Files up to this size are read with a single read() call.
+SMALL_FILE_LIMIT = 256 * 1024
+# Number of files handed to a worker at a time.
+BATCH_SIZE = 64
+# Bytes read at a time from a file list.
+LIST_CHUNK_SIZE = 64 * 1024
+
+BACKENDS: tuple[str, ...] = ('auto', 'thread', 'process')
+
+# (st_dev, st_ino), or None for a file that is not tracked.
+FileId = Optional[tuple[int, int]]
+
+_local = threading.local()
+
+
+def _buffer() -> bytearray:
+    """Return this thread's read buffer."""
+    buf = getattr(_local, 'buf', None)
+    if buf is None:
+        buf = _local.buf = bytearray(SMALL_FILE_LIMIT)
+    return buf
+
+
+def default_workers(backend: str = 'thread') -> int:
+    """Return default number of workers for backend."""
+    if backend == 'process':
+        return os.cpu_count() or 1
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+def select_backend(alg_id: int, backend: str = 'auto') -> str:
+    """Return 'thread' or 'process'. 'auto' selects processes for
+    algorithms that hold the GIL."""
+    if backend not in BACKENDS:
+        raise ValueError(f'"{backend}" is not a valid backend.')
+    if backend == 'auto':
+        return 'process' if Hp.holds_gil(alg_id) else 'thread'
+    return backend
+
+
+def make_pool(backend: str, workers: int) -> Executor:
+    """Return executor for backend 'thread' or 'process'."""
+    if backend == 'process':
+        # Forking a process with running threads (such as the GUI) is
+        # unsafe, so use a fork server where available.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in methods else 'spawn')
+        return ProcessPoolExecutor(workers, mp_context=context)
+    return ThreadPoolExecutor(workers, thread_name_prefix='ezchecksum-batch')
+
+
+def hash_path(fname: str, alg_id: int) -> bytes:
+    """Return digest of file fname.
+
+    Small files are read with no stat(), and one read() before the
+    read at end of file.
+    """
+    hasher = Hp.get_hash(alg_id).hasher.copy()
+    buf = _buffer()
+    view = memoryview(buf)
+    fd = os.open(fname, os.O_RDONLY)
+    try:
+        while (length := os.readv(fd, [buf])) > 0:
+            hasher.update(view[:length])
+    finally:
+        os.close(fd)
+    return hasher.digest()
+
+
+def hash_batch(fnames: 'list[str]', alg_id: int) -> 'list[Result]':
+    """Return a Result for each of a batch of files."""
+    results = []
+    for fname in fnames:
+        try:
+            results.append(Result(fname, hash_path(fname, alg_id)))
+        except OSError as err:
+            results.append(Result(fname, error=f'{err.strerror}.'))
+    return results
+
+
+def hash_files(fnames: Iterable[str], alg_id: int,
+               workers: Optional[int] = None,
+               batch_size: int = BATCH_SIZE,
+               backend: str = 'auto',
+               ordered: bool = False) -> Iterator[Result]:
+    """Hash files with a pool of worker threads or processes.
+
+    fnames is consumed lazily, with at most two batches per worker in
+    flight, so memory use does not grow with the number of files.
+    Results are yielded as batches complete, or with ordered, in the
+    order of fnames.
+
+    Args:
+        backend: Str. One of BACKENDS. See: select_backend().
+        ordered: Bool. Yield results in input order. A slow batch
+        delays the results of later batches, and no further batches
+        are started until it completes.
+    """
+    source = iter(fnames)
+    batches = iter(lambda: list(islice(source, batch_size)), [])
+    return hash_batches(batches, alg_id, workers, backend, ordered)
+
+
+def hash_batches(batches: Iterable['list[str]'], alg_id: int,
+                 workers: Optional[int] = None,
+                 backend: str = 'auto',
+                 ordered: bool = False) -> Iterator[Result]:
+    """hash_files() for files already divided into batches, such as by
+    iter_file_list()."""
+    backend = select_backend(alg_id, backend)
+    workers = workers or default_workers(backend)
+    source = iter(batches)
+    with make_pool(backend, workers) as pool:
+        if ordered:
+            queue: 'deque[Future]' = deque()
+            for chunk in source:
+                queue.append(pool.submit(hash_batch, chunk, alg_id))
+                if len(queue) >= workers * 2:
+                    yield from queue.popleft().result()
+                # Before the next batch, which may wait on a slow source.
+                while queue and queue[0].done():
+                    yield from queue.popleft().result()
+            for future in queue:
+                yield from future.result()
+            return
+        pending: 'set[Future]' = set()
+        for chunk in source:
+            pending.add(pool.submit(hash_batch, chunk, alg_id))
+            timeout = None if len(pending) >= workers * 2 else 0
+            done, pending = wait(pending, timeout, FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+        for future in as_completed(pending):
+            yield from future.result()
+
+
+def hash_unique(entries: Iterable['tuple[str, FileId]'], alg_id: int,
+                workers: Optional[int] = None,
+                batch_size: int = BATCH_SIZE,
+                backend: str = 'auto') -> Iterator[Result]:
+    """hash_files() for (path, file id) pairs, as yielded by
+    iter_tree_ids(). Each file id is hashed once, and further links to
+    the file are given its result. Files with the id None are hashed
+    without tracking.
+
+    The result of each file id is kept until hashing is complete.
+    """
+    # {file id: first path while hashing, then its result}
+    known: 'dict[tuple[int, int], Union[str, Result]]' = {}
+    # {first path: [file id, ...]} for files being hashed.
+    hashing: 'dict[str, list[tuple[int, int]]]' = {}
+    # {file id: further links found while hashing}
+    links: 'dict[tuple[int, int], list[str]]' = {}
+    ready: 'list[Result]' = []
+
+    def unique() -> Iterator[str]:
+        for path, ident in entries:
+            if ident is None:
+                yield path
+                continue
+            seen = known.get(ident)
+            if seen is None:
+                known[ident] = path
+                hashing.setdefault(path, []).append(ident)
+                yield path
+            elif isinstance(seen, Result):
+                ready.append(seen._replace(fname=path))
+            else:
+                links.setdefault(ident, []).append(path)
+
+    for result in hash_files(unique(), alg_id, workers, batch_size,
+                             backend):
+        yield result
+        ids = hashing.get(result.fname)
+        if ids:
+            ident = ids.pop(0)
+            if not ids:
+                del hashing[result.fname]
+            known[ident] = result
+            for path in links.pop(ident, ()):
+                yield result._replace(fname=path)
+        yield from ready
+        ready.clear()
+    yield from ready
+
+
+def file_id(info: os.stat_result) -> FileId:
+    """Return the file id of a file with stat() info: (st_dev, st_ino)
+    if it has other links, otherwise None."""
+    if info.st_nlink < 2:
+        return None
+    return (info.st_dev, info.st_ino)
+
+
+def _entry_id(entry: os.DirEntry,
+              onerror: Optional[Callable[[OSError], None]]) -> FileId:
+    """Return the file id of the target of a directory entry."""
+    try:
+        info = entry.stat()
+    except OSError as err:
+        if onerror is not None:
+            onerror(err)
+        # The error is reported again when hashing.
+        return None
+    return file_id(info)
+
+
+def _iter_entries(root: str,
+                  onerror: Optional[Callable[[OSError], None]]
+                  ) -> Iterator[os.DirEntry]:
+    """Yield directory entries of regular files below root."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError as err:
+            if onerror is not None:
+                onerror(err)
+
+
+def iter_tree_ids(root: str,
+                  onerror: Optional[Callable[[OSError], None]] = None
+                  ) -> Iterator['tuple[str, FileId]']:
+    """Yield (path, file id) for regular files below root. See:
+    file_id(). Symbolic links to directories are not followed.
+
+    Unlike iter_tree(), each file is stat()ed.
+
+    Args:
+        onerror: Called with the OSError for each directory that cannot
+        be read, and each file that cannot be stat()ed.
+    """
+    for entry in _iter_entries(root, onerror):
+        yield (entry.path, _entry_id(entry, onerror))
+
+
+def iter_tree(root: str,
+              onerror: Optional[Callable[[OSError], None]] = None
+              ) -> Iterator[str]:
+    """Yield paths of regular files below root. Symbolic links to
+    directories are not followed.
+
+    Args:
+        onerror: Called with the OSError for each directory that cannot
+        be read.
+    """
+    for entry in _iter_entries(root, onerror):
+        yield entry.path
+
+
+def iter_file_list(file: BinaryIO, separator: bytes = b'\n',
+                   batch_size: int = BATCH_SIZE) -> Iterator['list[str]']:
+    """Yield batches of paths from a list of paths separated by
+    separator (such as b'\\0' for the output of find -print0), read from
+    binary file. For hash_batches().
+
+    The list is read as it is consumed, and a batch is yielded as soon
+    as its paths have been read, so that hashing starts before a long
+    list (or a pipe) has been read to the end. Empty entries are
+    skipped. With the newline separator, a carriage return before the
+    newline is removed, so that lists with CRLF line endings can be
+    read. Use the NUL separator for file names that end with one.
+    """
+    crlf = separator == b'\n'
+
+    def decode(names: 'list[bytes]') -> 'list[str]':
+        if crlf:
+            names = [name[:-1] if name.endswith(b'\r') else name
+                     for name in names]
+        return [os.fsdecode(name) for name in names if name]
+
+    # Return what is available from a pipe, rather than a full chunk.
+    read = getattr(file, 'read1', file.read)
+    tail = b''
+    while chunk := read(LIST_CHUNK_SIZE):
+        names = (tail + chunk).split(separator)
+        tail = names.pop()
+        decoded = decode(names)
+        for idx in range(0, len(decoded), batch_size):
+            yield decoded[idx:idx + batch_size]
+    if last := decode([tail]):
+        yield last
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""Benchmark the page cache modes of readers.iter_blocks().
+
+For each cache mode, the test file is evicted from the page cache,
+hashed, and then the proportion of the file left resident in the page
+cache is measured with mincore(2). Linux only.
+
+Usage::
+
+    python benchmarks/bench_cache.py [--size MIB] [FILE]
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import hash_profiles as Hp  # noqa: E402
+import calc  # noqa: E402
+import readers  # noqa: E402
+
+
+def evict(fname: str) -> None:
+    """Drop fname from the page cache."""
+    fd = os.open(fname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def resident_fraction(fname: str) -> float:
+    """Return the fraction of fname's pages in the page cache."""
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                          ctypes.c_int, ctypes.c_int, ctypes.c_long)
+    libc.munmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+    libc.mincore.argtypes = (ctypes.c_void_p, ctypes.c_size_t,
+                             ctypes.c_void_p)
+    size = os.path.getsize(fname)
+    pages = -(-size // mmap.PAGESIZE)
+    vec = (ctypes.c_ubyte * pages)()
+    with open(fname, 'rb') as file_:
+        ptr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED,
+                        file_.fileno(), 0)
+    if ptr in (None, ctypes.c_void_p(-1).value):
+        raise OSError(ctypes.get_errno(), 'mmap failed')
+    try:
+        if libc.mincore(ptr, size, vec) != 0:
+            raise OSError(ctypes.get_errno(), 'mincore failed')
+    finally:
+        libc.munmap(ptr, size)
+    return sum(byte & 1 for byte in vec) / pages
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file', nargs='?',
+                        help='File to hash (default: temporary file).')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Size of temporary file in MiB (default: 512).')
+    parser.add_argument('-a', '--algorithm', default='SHA256')
+    args = parser.parse_args()
+
+    fname = args.file
+    if fname is None:
+        fd, fname = tempfile.mkstemp(prefix='bench_cache-', dir='.')
+        with os.fdopen(fd, 'wb') as file_:
+            for _ in range(args.size):
+                file_.write(os.urandom(1024 * 1024))
+    alg_id = Hp.get_hash_index(args.algorithm)
+    size = os.path.getsize(fname)
+    try:
+        print(f'{"mode":<10}{"seconds":>10}{"MiB/s":>10}{"cached":>10}')
+        for mode in readers.CACHE_MODES:
+            evict(fname)
+            start = time.perf_counter()
+            calc.hash_file(fname, alg_id, calc.STREAM_BLOCKSIZE, mode)
+            elapsed = time.perf_counter() - start
+            cached = resident_fraction(fname)
+            print(f'{mode:<10}{elapsed:>10.2f}'
+                  f'{size / 1048576 / elapsed:>10.1f}{cached:>10.0%}')
+    finally:
+        if args.file is None:
+            os.remove(fname)
+
+
+if __name__ == '__main__':
+    main()
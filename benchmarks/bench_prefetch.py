@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Benchmark serial reads against the prefetching reader thread.
+
+The test file is evicted from the page cache before each run, so that
+each run includes real disk reads. Linux only.
+
+Usage::
+
+    python benchmarks/bench_prefetch.py [--size MIB] [FILE]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import hash_profiles as Hp  # noqa: E402
+import calc  # noqa: E402
+from bench_cache import evict  # noqa: E402
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file', nargs='?',
+                        help='File to hash (default: temporary file).')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Size of temporary file in MiB (default: 512).')
+    parser.add_argument('-a', '--algorithm', default='SHA256')
+    args = parser.parse_args()
+
+    fname = args.file
+    if fname is None:
+        fd, fname = tempfile.mkstemp(prefix='bench_prefetch-', dir='.')
+        with os.fdopen(fd, 'wb') as file_:
+            for _ in range(args.size):
+                file_.write(os.urandom(1024 * 1024))
+    alg_id = Hp.get_hash_index(args.algorithm)
+    size = os.path.getsize(fname)
+    try:
+        print(f'{"prefetch":<10}{"seconds":>10}{"MiB/s":>10}')
+        for prefetch in (0, 1, 2, 3, 4):
+            evict(fname)
+            start = time.perf_counter()
+            calc.hash_file(fname, alg_id, calc.STREAM_BLOCKSIZE,
+                           prefetch=prefetch)
+            elapsed = time.perf_counter() - start
+            print(f'{prefetch:<10}{elapsed:>10.2f}'
+                  f'{size / 1048576 / elapsed:>10.1f}')
+    finally:
+        if args.file is None:
+            os.remove(fname)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Benchmark batched hashing of many small files.
+
+Compares one stat() + open() + read loop per file in the calling
+thread, as ChecksumThread.get_hash() does, with batch.hash_files()
+using thread and process workers.
+
+Usage::
+
+    python benchmarks/bench_small_files.py [--files N] [DIRECTORY]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import hash_profiles as Hp  # noqa: E402
+import batch  # noqa: E402
+import calc  # noqa: E402
+
+
+def make_tree(root: str, count: int) -> None:
+    """Create count small files below root."""
+    for idx in range(count):
+        directory = os.path.join(root, f'{idx // 1000:03d}')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{idx}.dat'), 'wb') as file_:
+            file_.write(os.urandom(512 + (idx * 37) % 8192))
+
+
+def serial(root: str, alg_id: int) -> int:
+    """Hash files one at a time. Return number of files."""
+    count = 0
+    for fname in batch.iter_tree(root):
+        os.stat(fname)
+        calc.hash_file(fname, alg_id)
+        count += 1
+    return count
+
+
+def threads(root: str, alg_id: int) -> int:
+    """Hash files with batch.hash_files() using threads.
+    Return number of files."""
+    return sum(1 for _ in batch.hash_files(batch.iter_tree(root), alg_id,
+                                           backend='thread'))
+
+
+def processes(root: str, alg_id: int) -> int:
+    """Hash files with batch.hash_files() using processes.
+    Return number of files."""
+    return sum(1 for _ in batch.hash_files(batch.iter_tree(root), alg_id,
+                                           backend='process'))
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?',
+                        help='Tree to hash (default: temporary tree).')
+    parser.add_argument('--files', type=int, default=20000,
+                        help='Files in temporary tree (default: 20000).')
+    parser.add_argument('-a', '--algorithm', default='SHA256')
+    args = parser.parse_args()
+
+    root = args.directory
+    if root is None:
+        root = tempfile.mkdtemp(prefix='bench_small_files-', dir='.')
+        make_tree(root, args.files)
+    alg_id = Hp.get_hash_index(args.algorithm)
+    try:
+        print(f'{"method":<10}{"seconds":>10}{"files/s":>12}')
+        for name, method in (('serial', serial), ('threads', threads),
+                             ('processes', processes)):
+            start = time.perf_counter()
+            count = method(root, alg_id)
+            elapsed = time.perf_counter() - start
+            print(f'{name:<10}{elapsed:>10.2f}{count / elapsed:>12.0f}')
+    finally:
+        if args.directory is None:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""Measure start up time of the GUI against a budget.
+
+Reports the slowest imports (from ``python -X importtime``) and the
+time from interpreter start until the main window has been shown and
+the first events processed. Uses the Qt 'offscreen' platform, so no
+display is required.
+
+Usage::
+
+    python benchmarks/bench_startup.py [--runs N] [--budget MS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Start up budget, in milliseconds, for showing the main window.
+STARTUP_BUDGET_MS = 250
+
+SHOW_WINDOW = '''
+from PyQt6.QtWidgets import QApplication
+import ezchecksum
+app = QApplication([])
+window = ezchecksum.ShaApp()
+window.show()
+app.processEvents()
+'''
+
+
+def environment() -> 'dict[str, str]':
+    """Return environment for child interpreters."""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, (ROOT, env.get('PYTHONPATH'))))
+    return env
+
+
+def import_times(count: int) -> 'list[tuple[int, str]]':
+    """Return the count slowest (cumulative microseconds, module) of
+    importing ezchecksum."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ezchecksum'],
+        env=environment(), cwd=ROOT, capture_output=True, text=True,
+        check=True)
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times.append((int(cumulative), module.rstrip()))
+    times.sort(reverse=True)
+    return times[:count]
+
+
+def time_to_window() -> float:
+    """Return milliseconds from launch until window shown."""
+    # Timed in the parent so that interpreter start up is included.
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', SHOW_WINDOW], env=environment(),
+                   cwd=ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> int:
+    """Run the benchmark. Return 1 if over budget."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_MS,
+                        help='Budget in ms (default: %(default)s).')
+    parser.add_argument('--top', type=int, default=15,
+                        help='Number of imports to list.')
+    args = parser.parse_args()
+
+    print('Slowest imports (cumulative):')
+    for micros, module in import_times(args.top):
+        print(f'{micros / 1000:>9.1f} ms  {module}')
+
+    times = [time_to_window() for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f'\nTime to window: median {median:.0f} ms, '
+          f'min {min(times):.0f} ms over {args.runs} runs.')
+    within = median <= args.budget
+    print(f'Budget {args.budget:.0f} ms: {"OK" if within else "EXCEEDED"}')
+    return 0 if within else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,29 @@
 """Main class for calculating checksums"""
 
+import os
+import stat
+from functools import partial
+from typing import IO, Callable, Iterable, Iterator, Optional
+
 from PyQt6.QtCore import QThread, QFileInfo, pyqtSignal
 from PyQt6.QtWidgets import QLineEdit
 
 import hash_profiles as Hp
 
-import dialogs
+import archive
+import calibrate
+import profiler
+import readers
+import throttle
+
+
+# Quick pre-check settings.
+QUICK_PREFIX = 'quick:'
+QUICK_SAMPLES = 8
+QUICK_BLOCKSIZE = 65536
+
+# Block size for streams of unknown length.
+STREAM_BLOCKSIZE = 1024 * 1024
 
 
 class ChecksumThread(QThread):
@@ -15,16 +33,48 @@ class ChecksumThread(QThread):
         algorithm: Int. Index number of selected algorithm.
         data: A QListWidget or QLineEdit containing the file names
         to be processed.
+        quick: Bool. Emit a sampled quick fingerprint instead of the
+        full checksum. See: quick_fingerprint().
+        members: Bool. Hash each member of a supported archive file
+        instead of the archive file itself.
+        cache_mode: Str. Page cache handling. See: readers.CACHE_MODES.
+        storage: Str. One of readers.STORAGE_PROFILES. 'network' uses
+        large reads, several in flight, and retries transient errors.
+        limits: throttle.Limits on bandwidth, CPU and priority, for
+        background verification.
+        blocksize: Int. Minimum block size for local files. See:
+        calibrate.py.
+
+    Errors are reported with error_sig rather than raised, so that one
+    unreadable file does not abort a job.
 
     """
 
     updateProgressBar = pyqtSignal(int)
-    checksum_sig = pyqtSignal(str, str)
+    # Bytes read from a source of unknown length (may exceed 32 bits).
+    updateBytesRead = pyqtSignal(object)
+    # File name and raw digest. Converted to hex only for display.
+    checksum_sig = pyqtSignal(str, bytes)
+    # File name and error message.
+    error_sig = pyqtSignal(str, str)
+    # File name and quick fingerprint. See: quick_fingerprint().
+    fingerprint_sig = pyqtSignal(str, str)
 
-    def __init__(self, alg_id: int, data: QLineEdit) -> None:
+    def __init__(self, alg_id: int, data: QLineEdit,
+                 quick: bool = False, members: bool = False,
+                 cache_mode: str = 'normal',
+                 storage: str = 'local',
+                 limits: throttle.Limits = throttle.Limits(),
+                 blocksize: int = 65536) -> None:
         QThread.__init__(self)
         self.alg_id = alg_id
         self.data = data
+        self.quick = quick
+        self.members = members
+        self.cache_mode = cache_mode
+        self.storage = storage
+        self.limits = limits
+        self.blocksize = blocksize
         # Set stop_flag to True when we want to stop processing.
         self.stop_flag = False
         self.file_list_item = None
@@ -42,42 +92,285 @@ class ChecksumThread(QThread):
         info = QFileInfo(fname)
         size = info.size()
 
-        # Test for zero byte file
-        if size == 0:
-            self.checksum_sig.emit(fname, 'Error: Empty file.')
-            return  # just bail
+        # Pipes, devices and /proc files do not have a known size.
+        if size == 0 or not info.isFile():
+            self.get_stream_hash(fname)
+            return
 
-        # Process in blocks of at least 64k
-        blocksize = max(65536, size // 100)
+        # Process in (page aligned) blocks of at least 64k (or the
+        # calibrated size), up to readers.MAX_BLOCKSIZE, or in much
+        # larger blocks over a network.
+        if self.storage == 'network':
+            blocksize = readers.NETWORK_BLOCKSIZE
+        else:
+            blocksize = readers.aligned_size(
+                min(max(self.blocksize, size // 100),
+                    readers.MAX_BLOCKSIZE))
         progress_step = min(1.0, blocksize / float(size)) * 100
         progress = 0.0
         step = max(1.0, progress_step)
         percent = int(step)
 
+        try:
+            blocks: 'Iterator[readers.Block]'
+            if self.storage == 'network':
+                blocks = readers.iter_network(fname, blocksize)
+            else:
+                # Overlap reading with hashing unless the file fits in
+                # a single block.
+                prefetch = readers.PREFETCH_DEPTH if size > blocksize else 0
+                blocks = readers.iter_blocks(fname, blocksize,
+                                             self.cache_mode, prefetch)
+            for buf in throttle.throttled(blocks, self.limits):
+                if self.stop_flag:
+                    break
+                hasher.update(buf)
+                # Update progress bar when there's an
+                # integer increase in progress
+                progress += progress_step
+                if progress >= percent:
+                    self.updateProgressBar.emit(min(100, percent))
+                    percent = int(progress + step)
+            if not self.stop_flag:
+                self.checksum_sig.emit(fname, hasher.digest())
+            else:
+                self.updateProgressBar.emit(0)
+
+        except (OSError, ValueError) as err:
+            self.error_sig.emit(fname, error_message(err))
+
+    def get_stream_hash(self, fname: str) -> None:
+        """Calculate the checksum of a source with unknown length.
+        Progress is reported as bytes read."""
         try:
             with open(fname, 'rb') as file_:
-                buf = file_.read(blocksize)
-                while (len(buf) > 0) and not self.stop_flag:
-                    hasher.update(buf)
-                    buf = file_.read(blocksize)
-                    # Update progress bar when there's an
-                    # integer increase in progress
-                    progress += progress_step
-                    if progress >= percent:
-                        self.updateProgressBar.emit(min(100, percent))
-                        percent = int(progress + step)
-                if not self.stop_flag:
-                    self.checksum_sig.emit(fname, str(hasher.hexdigest()))
-                else:
-                    self.updateProgressBar.emit(0)
-
-        except (IOError, ValueError):
-            dialogs.warning(self, 'An I/O error or a ValueError occurred')
+                blocks = iter(partial(file_.read, STREAM_BLOCKSIZE), b'')
+                digest, bytes_read = hash_blocks(
+                    throttle.throttled(blocks, self.limits), self.alg_id,
+                    progress=self.updateBytesRead.emit,
+                    stop=lambda: self.stop_flag)
+        except (OSError, ValueError) as err:
+            self.error_sig.emit(fname, error_message(err))
+            return
+        if digest is None:
+            self.updateProgressBar.emit(0)
+        elif bytes_read == 0:
+            self.error_sig.emit(fname, 'Empty file.')
+        else:
+            self.checksum_sig.emit(fname, digest)
+
+    def get_quick_fingerprint(self, fname: str) -> None:
+        """Calculate the quick (sampled) fingerprint."""
+        info = QFileInfo(fname)
+        # Sources of unknown size cannot be sampled, so hash in full.
+        if info.size() == 0 or not info.isFile():
+            self.get_stream_hash(fname)
+            return
+        try:
+            fingerprint = quick_fingerprint(fname, self.alg_id)
+        except (OSError, ValueError) as err:
+            self.error_sig.emit(fname, error_message(err))
+            return
+        self.updateProgressBar.emit(100)
+        self.fingerprint_sig.emit(fname, fingerprint)
+
+    def get_archive_hashes(self, fname: str) -> None:
+        """Calculate the checksum of each member of archive fname."""
+        size = QFileInfo(fname).size()
+        percent = 0
+
+        def progress(bytes_read: int) -> None:
+            nonlocal percent
+            new_percent = min(100, (bytes_read * 100) // max(1, size))
+            if new_percent > percent:
+                percent = new_percent
+                self.updateProgressBar.emit(percent)
+
+        try:
+            for member, digest in archive.iter_archive(
+                    fname, self.alg_id, progress, lambda: self.stop_flag):
+                self.checksum_sig.emit(f'{fname}/{member}', digest)
+        except archive.ArchiveError as err:
+            self.error_sig.emit(fname, str(err))
+        except (OSError, ValueError) as err:
+            self.error_sig.emit(fname, error_message(err))
+        if self.stop_flag:
+            self.updateProgressBar.emit(0)
 
     def run(self) -> None:
         """Override of QThread run."""
-        self.get_hash(self.data.text())
+        throttle.apply_priority(self.limits)
+        with profiler.profile_thread():
+            if self.members and archive.is_archive(self.data.text()):
+                self.get_archive_hashes(self.data.text())
+            elif self.quick:
+                self.get_quick_fingerprint(self.data.text())
+            else:
+                self.get_hash(self.data.text())
 
     def stop(self) -> None:
         """Stop thread gracefully."""
         self.stop_flag = True
+
+
+class CalibrateThread(QThread):
+    """Worker thread to benchmark this machine, and save the tuned
+    settings for the GUI and the command line tools. See: calibrate.py.
+
+    Args:
+        directory: Str. Directory on the storage to benchmark.
+        path: Str. Config file to save to.
+    """
+
+    # calibrate.Calibration when saved.
+    calibrated_sig = pyqtSignal(object)
+    # Details of the error.
+    error_sig = pyqtSignal(str)
+
+    def __init__(self, directory: str,
+                 path: str = calibrate.CONFIG_PATH) -> None:
+        QThread.__init__(self)
+        self.directory = directory
+        self.path = path
+
+    # Override the destructor:
+    def __del__(self) -> None:
+        self.wait()
+
+    def run(self) -> None:
+        """Override of QThread run."""
+        try:
+            result = calibrate.calibrate(self.directory)
+            calibrate.save(result, self.path)
+        except OSError as err:
+            self.error_sig.emit(f'I/O error: {err.errno}\n{err.strerror}')
+            return
+        self.calibrated_sig.emit(result)
+
+
+def error_message(err: Exception) -> str:
+    """Return a message for an error hashing a file."""
+    if isinstance(err, OSError) and err.strerror:
+        return f'{err.strerror}.'
+    return str(err) or err.__class__.__name__
+
+
+def hash_blocks(blocks: Iterable[readers.Block], alg_id: int,
+                progress: Optional[Callable[[int], None]] = None,
+                stop: Optional[Callable[[], bool]] = None
+                ) -> 'tuple[bytes | None, int]':
+    """Hash a sequence of blocks of data.
+
+    Args:
+        progress: Called with the total number of bytes read after
+        each block.
+        stop: Returns True when processing should stop.
+
+    Returns
+    -------
+        tuple
+            (digest or None if stopped, number of bytes read)
+    """
+    hasher = Hp.get_hash(alg_id).hasher.copy()
+    bytes_read = 0
+    for buf in blocks:
+        if stop is not None and stop():
+            return (None, bytes_read)
+        hasher.update(buf)
+        bytes_read += len(buf)
+        if progress is not None:
+            progress(bytes_read)
+    return (hasher.digest(), bytes_read)
+
+
+def hash_stream(stream: IO[bytes], alg_id: int,
+                blocksize: int = STREAM_BLOCKSIZE,
+                progress: Optional[Callable[[int], None]] = None,
+                stop: Optional[Callable[[], bool]] = None
+                ) -> 'tuple[bytes | None, int]':
+    """Hash a binary stream of any (or unknown) length.
+    See: hash_blocks()."""
+    return hash_blocks(iter(partial(stream.read, blocksize), b''),
+                       alg_id, progress, stop)
+
+
+def hash_file(fname: str, alg_id: int, blocksize: int = 65536,
+              cache_mode: str = 'normal', prefetch: int = 0,
+              storage: str = 'local') -> bytes:
+    """Return the digest of fname.
+    See: readers.iter_blocks() for cache_mode and prefetch. With storage
+    'network', see: readers.iter_network()."""
+    blocks: 'Iterator[readers.Block]'
+    if storage == 'network':
+        blocks = readers.iter_network(
+            fname, max(blocksize, readers.NETWORK_BLOCKSIZE))
+    else:
+        blocks = readers.iter_blocks(fname, blocksize, cache_mode, prefetch)
+    digest, _ = hash_blocks(blocks, alg_id)
+    assert digest is not None  # Cannot be stopped.
+    return digest
+
+
+def sample_offsets(size: int, samples: int = QUICK_SAMPLES,
+                   blocksize: int = QUICK_BLOCKSIZE) -> 'list[int]':
+    """Return evenly spaced offsets of the blocks sampled by
+    quick_fingerprint(). The first block and the last block of the
+    file are always included."""
+    if samples < 2 or size <= samples * blocksize:
+        return [0]
+    last = size - blocksize
+    return [(last * n) // (samples - 1) for n in range(samples)]
+
+
+def quick_fingerprint(fname: str, alg_id: int,
+                      samples: int = QUICK_SAMPLES,
+                      blocksize: int = QUICK_BLOCKSIZE) -> str:
+    """Return a sampled fingerprint of fname.
+
+    The fingerprint covers the file size plus `samples` blocks spread
+    evenly across the file. It is NOT a checksum: different fingerprints
+    prove that files differ, but matching fingerprints do not prove that
+    they are the same.
+
+    Raises ValueError if fname is not a regular file, as sources such as
+    pipes and devices have no size to sample.
+
+    Returns
+    -------
+        str
+            In the form: 'quick:<size>:<hex digest>'
+    """
+    # Checked before opening, which would wait for the writer of a pipe.
+    info = os.stat(fname)
+    if not stat.S_ISREG(info.st_mode):
+        raise ValueError('Not a regular file.')
+    size = info.st_size
+    hasher = Hp.get_hash(alg_id).hasher.copy()
+    hasher.update(str(size).encode('ascii'))
+    with open(fname, 'rb') as file_:
+        if size <= samples * blocksize:
+            hasher.update(file_.read(size))
+        else:
+            for offset in sample_offsets(size, samples, blocksize):
+                file_.seek(offset)
+                hasher.update(file_.read(blocksize))
+    return f'{QUICK_PREFIX}{size}:{hasher.hexdigest()}'
+
+
+def quick_compare(fname: str, reference: str,
+                  alg_id: int) -> 'tuple[bool, bool]':
+    """Compare fname with reference file using quick fingerprints.
+
+    Fingerprints that differ are conclusive. When the fingerprints
+    match the result is ambiguous, so both files are fully hashed.
+
+    Returns
+    -------
+        tuple
+            (files_match, escalated) where escalated is True if a full
+            hash of both files was required.
+    """
+    if (quick_fingerprint(fname, alg_id) !=
+            quick_fingerprint(reference, alg_id)):
+        return (False, False)
+    return (hash_file(fname, alg_id) == hash_file(reference, alg_id), True)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""Calibrate engine settings for this machine.
+
+Benchmarks each algorithm in :py:mod:`hash_profiles`, and reads from
+the storage device of a directory, to find:
+
+    - The block size with the highest read throughput.
+    - The number of worker threads that hashes a tree of small files
+      fastest.
+    - The fastest algorithm, for uses where any algorithm will do, such
+      as comparing two trees.
+
+The results are stored in a plain config file, read by the GUI and by
+the command line tools. Calibrate without the GUI::
+
+    python calibrate.py /data
+"""
+
+import argparse
+import configparser
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import NamedTuple, Optional
+
+import hash_profiles as Hp
+import batch
+import readers
+
+
+BLOCKSIZES: tuple[int, ...] = tuple(1024 * kib for kib in
+                                    (64, 256, 1024, 4096, 8192))
+TEST_FILE_SIZE = 64 * 1024 * 1024
+SMALL_FILES = 512
+SMALL_FILE_SIZE = 16 * 1024
+CONFIG_PATH = os.path.join(
+    os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config')),
+    'ezchecksum', 'calibration.ini')
+
+
+class Calibration(NamedTuple):
+    """Calibrated engine settings."""
+    blocksize: int = 1024 * 1024
+    workers: int = batch.default_workers()
+    fast_algorithm: str = 'SHA256'
+
+
+def bench_algorithms(duration: float = 0.2) -> 'dict[str, float]':
+    """Return {algorithm name: MB/s} hashing in memory data."""
+    buf = os.urandom(1024 * 1024)
+    speeds = {}
+    for profile in Hp.HASH_TYPES:
+        hasher = profile.hasher.copy()
+        count = 0
+        start = time.perf_counter()
+        while (elapsed := time.perf_counter() - start) < duration:
+            hasher.update(buf)
+            count += 1
+        speeds[profile.name] = count * len(buf) / elapsed / 1e6
+    return speeds
+
+
+def _drop_cache(fname: str) -> None:
+    fd = os.open(fname, os.O_RDONLY)
+    try:
+        readers.drop_cache(fd)
+    finally:
+        os.close(fd)
+
+
+def bench_blocksizes(directory: str) -> 'dict[int, float]':
+    """Return {block size: MB/s} reading a test file in directory,
+    uncached where the OS allows."""
+    speeds = {}
+    with tempfile.NamedTemporaryFile(dir=directory) as test_file:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(TEST_FILE_SIZE // len(chunk)):
+            test_file.write(chunk)
+        test_file.flush()
+        os.fsync(test_file.fileno())
+        for blocksize in BLOCKSIZES:
+            _drop_cache(test_file.name)
+            start = time.perf_counter()
+            for _ in readers.iter_blocks(test_file.name, blocksize,
+                                         'dontneed'):
+                pass
+            speeds[blocksize] = (TEST_FILE_SIZE /
+                                 (time.perf_counter() - start) / 1e6)
+    return speeds
+
+
+def bench_workers(directory: str, alg_id: int) -> 'dict[int, float]':
+    """Return {workers: files per second} hashing a tree of small files
+    in directory."""
+    counts = sorted({1, 2, 4, 8, 16, batch.default_workers()})
+    speeds = {}
+    tree = tempfile.mkdtemp(dir=directory)
+    try:
+        data = os.urandom(SMALL_FILE_SIZE)
+        for idx in range(SMALL_FILES):
+            with open(os.path.join(tree, f'{idx}'), 'wb') as file_:
+                file_.write(data)
+        for workers in counts:
+            start = time.perf_counter()
+            for _ in batch.hash_files(batch.iter_tree(tree), alg_id,
+                                      workers, backend='thread'):
+                pass
+            speeds[workers] = SMALL_FILES / (time.perf_counter() - start)
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+    return speeds
+
+
+def calibrate(directory: Optional[str] = None) -> Calibration:
+    """Benchmark this machine, and the storage of directory (default:
+    the temporary directory). Takes a few seconds."""
+    directory = directory or tempfile.gettempdir()
+    algorithms = bench_algorithms()
+    blocksizes = bench_blocksizes(directory)
+    workers = bench_workers(directory, Hp.get_hash_index('SHA256'))
+    return Calibration(max(blocksizes, key=blocksizes.__getitem__),
+                       max(workers, key=workers.__getitem__),
+                       max(algorithms, key=algorithms.__getitem__))
+
+
+def save(calibration: Calibration, path: str = CONFIG_PATH) -> None:
+    """Write calibration to config file path."""
+    config = configparser.ConfigParser()
+    config['calibration'] = {key: str(value) for key, value in
+                             calibration._asdict().items()}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf8') as file_:
+        config.write(file_)
+
+
+def load(path: str = CONFIG_PATH) -> Optional[Calibration]:
+    """Return calibration from config file path, or None if the machine
+    has not been calibrated."""
+    config = configparser.ConfigParser()
+    if not config.read(path, encoding='utf8'):
+        return None
+    try:
+        section = config['calibration']
+        calibration = Calibration(int(section['blocksize']),
+                                  int(section['workers']),
+                                  section['fast_algorithm'])
+    except (KeyError, ValueError):
+        return None
+    # Saved by a version with other algorithms.
+    if calibration.fast_algorithm not in (alg.name
+                                          for alg in Hp.HASH_TYPES):
+        return None
+    return calibration
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Calibrate and save to the config file. Return the exit status."""
+    parser = argparse.ArgumentParser(
+        prog='ezchecksum-calibrate',
+        description='Benchmark this machine and save tuned settings.')
+    parser.add_argument('directory', nargs='?', default=None,
+                        help='Directory on the storage to benchmark '
+                        '(default: the temporary directory).')
+    parser.add_argument('--config', default=CONFIG_PATH,
+                        help='Config file (default: %(default)s).')
+    args = parser.parse_args(argv)
+    try:
+        calibration = calibrate(args.directory)
+        save(calibration, args.config)
+    except OSError as err:
+        sys.stderr.write(f'{err}\n')
+        return 2
+    print(f'Block size: {calibration.blocksize // 1024} KiB\n'
+          f'Workers: {calibration.workers}\n'
+          f'Fast algorithm: {calibration.fast_algorithm}\n'
+          f'Saved to {args.config}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
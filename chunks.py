@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+
+"""Chunk level (Merkle) sidecar manifests for large files.
+
+A whole file digest only shows that something differs. A sidecar holds
+a digest for each chunk of the file (64 MiB by default) and a Merkle
+root over the chunk digests. Verification hashes the chunks in
+parallel, and reports the byte ranges of the chunks that differ. After
+part of a file is rewritten, only the chunks that overlap the rewritten
+ranges are hashed again.
+
+The sidecar is a text file, written next to the file as
+``<file>.ezchunks``::
+
+    ezchunks 2
+    algorithm SHA256
+    chunk_size 67108864
+    size 214748364800
+    root <hex digest>
+    <hex digest of chunk 0>
+    <hex digest of chunk 1>
+    ...
+
+Leaves and parents of the Merkle tree are hashed with different
+prefixes (0x00 and 0x01), so that a list of chunk digests cannot be
+passed off as a parent node of a different tree. Version 1 sidecars,
+which did not do this, must be built again.
+
+Build, verify or update a sidecar::
+
+    python chunks.py build disk.img
+    python chunks.py verify disk.img
+    python chunks.py update disk.img 1048576+4096
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, NamedTuple, Optional
+
+import hash_profiles as Hp
+import batch
+import manifest
+
+
+CHUNK_SIZE = 64 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+SUFFIX = '.ezchunks'
+_MAGIC = 'ezchunks 2'
+_OLD_MAGIC = 'ezchunks 1'
+# Merkle tree domain separation prefixes.
+_LEAF = b'\x00'
+_NODE = b'\x01'
+
+
+class ChunkManifestError(Exception):
+    """Raised for a missing or invalid sidecar."""
+
+
+class ChunkManifest(NamedTuple):
+    """Chunk digests of one file."""
+    alg_id: int
+    chunk_size: int
+    size: int
+    digests: 'list[bytes]'
+
+    @property
+    def root(self) -> bytes:
+        """Merkle root of the chunk digests."""
+        return merkle_root(self.digests, self.alg_id)
+
+    def chunk_range(self, idx: int) -> 'tuple[int, int]':
+        """Return (start, end) byte offsets of chunk idx."""
+        start = idx * self.chunk_size
+        return (start, min(start + self.chunk_size, self.size))
+
+
+def sidecar_path(fname: str) -> str:
+    """Return path of the sidecar of fname."""
+    return fname + SUFFIX
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    """Return number of chunks in a file of size bytes. An empty file
+    has one (empty) chunk."""
+    return max(1, -(-size // chunk_size))
+
+
+def merkle_root(digests: 'list[bytes]', alg_id: int) -> bytes:
+    """Return the Merkle root of digests. Each leaf is the hash of
+    0x00 and a chunk digest, and each parent the hash of 0x01 and its
+    two children concatenated. An odd node is carried up a level
+    unchanged."""
+    profile = Hp.get_hash(alg_id)
+
+    def node_hash(*parts: bytes) -> bytes:
+        hasher = profile.hasher.copy()
+        for part in parts:
+            hasher.update(part)
+        return hasher.digest()
+
+    level = [node_hash(_LEAF, digest) for digest in digests]
+    while len(level) > 1:
+        parents = []
+        for idx in range(0, len(level) - 1, 2):
+            parents.append(node_hash(_NODE, level[idx], level[idx + 1]))
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0]
+
+
+def hash_chunk(fname: str, alg_id: int, idx: int,
+               chunk_size: int = CHUNK_SIZE) -> bytes:
+    """Return digest of chunk idx of fname."""
+    hasher = Hp.get_hash(alg_id).hasher.copy()
+    buf = bytearray(min(READ_SIZE, chunk_size))
+    view = memoryview(buf)
+    offset = idx * chunk_size
+    end = offset + chunk_size
+    fd = os.open(fname, os.O_RDONLY)
+    try:
+        while offset < end:
+            length = os.preadv(fd, [view[:min(len(buf), end - offset)]],
+                               offset)
+            if length == 0:
+                break
+            hasher.update(view[:length])
+            offset += length
+    finally:
+        os.close(fd)
+    return hasher.digest()
+
+
+def hash_chunks(fname: str, alg_id: int, indexes: Iterable[int],
+                chunk_size: int = CHUNK_SIZE,
+                workers: Optional[int] = None) -> 'dict[int, bytes]':
+    """Hash chunks of fname in parallel. Return {index: digest}."""
+    indexes = list(indexes)
+    workers = workers or batch.default_workers()
+    with ThreadPoolExecutor(workers, 'ezchecksum-chunk') as pool:
+        digests = pool.map(lambda idx: hash_chunk(fname, alg_id, idx,
+                                                  chunk_size), indexes)
+        return dict(zip(indexes, digests))
+
+
+def build(fname: str, alg_id: int, chunk_size: int = CHUNK_SIZE,
+          workers: Optional[int] = None) -> ChunkManifest:
+    """Return the chunk manifest of fname."""
+    size = os.path.getsize(fname)
+    count = chunk_count(size, chunk_size)
+    digests = hash_chunks(fname, alg_id, range(count), chunk_size, workers)
+    return ChunkManifest(alg_id, chunk_size, size,
+                         [digests[idx] for idx in range(count)])
+
+
+def write_sidecar(path: str, chunks: ChunkManifest) -> None:
+    """Write chunk manifest to path."""
+    lines = [_MAGIC,
+             f'algorithm {Hp.get_hash_name(chunks.alg_id)}',
+             f'chunk_size {chunks.chunk_size}',
+             f'size {chunks.size}',
+             f'root {chunks.root.hex()}']
+    lines.extend(digest.hex() for digest in chunks.digests)
+    with manifest.atomic_open(path) as out:
+        out.write(('\n'.join(lines) + '\n').encode('ascii'))
+
+
+def read_sidecar(path: str) -> ChunkManifest:
+    """Return the chunk manifest in sidecar path."""
+    try:
+        with open(path, 'rt', encoding='ascii') as fp:
+            lines = fp.read().splitlines()
+        if lines and lines[0] == _OLD_MAGIC:
+            raise ValueError('old format, build it again')
+        if len(lines) < 6 or lines[0] != _MAGIC:
+            raise ValueError('bad header')
+        fields = dict(line.split(' ', 1) for line in lines[1:5])
+        if fields['algorithm'] not in [alg.name for alg in Hp.HASH_TYPES]:
+            raise ValueError(f'unknown algorithm "{fields["algorithm"]}"')
+        alg_id = Hp.get_hash_index(fields['algorithm'])
+        if int(fields['chunk_size']) <= 0:
+            raise ValueError(f'bad chunk_size {fields["chunk_size"]}')
+        length = Hp.get_hash(alg_id).length
+        for line in lines[5:]:
+            if len(line) != length:
+                raise ValueError(f'"{line}" is not a {fields["algorithm"]} '
+                                 f'digest')
+        chunks = ChunkManifest(alg_id, int(fields['chunk_size']),
+                               int(fields['size']),
+                               [bytes.fromhex(line) for line in lines[5:]])
+        root = bytes.fromhex(fields['root'])
+    except (OSError, ValueError, KeyError) as err:
+        raise ChunkManifestError(
+            f'{path} is not a valid chunk manifest: {err}') from err
+    if (len(chunks.digests) != chunk_count(chunks.size, chunks.chunk_size)
+            or chunks.root != root):
+        raise ChunkManifestError(f'{path} is damaged.')
+    return chunks
+
+
+def merge_ranges(ranges: Iterable['tuple[int, int]']
+                 ) -> 'list[tuple[int, int]]':
+    """Return sorted (start, end) ranges with adjacent and overlapping
+    ranges merged."""
+    merged: 'list[tuple[int, int]]' = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def verify(fname: str, chunks: ChunkManifest,
+           workers: Optional[int] = None) -> 'list[tuple[int, int]]':
+    """Verify fname against chunks. Return the (start, end) byte ranges
+    that differ, or [] if the file matches.
+
+    A change of size is reported as the range between the two sizes.
+    """
+    size = os.path.getsize(fname)
+    count = chunk_count(min(size, chunks.size), chunks.chunk_size)
+    digests = hash_chunks(fname, chunks.alg_id, range(count),
+                          chunks.chunk_size, workers)
+    bad = [chunks.chunk_range(idx) for idx, digest in digests.items()
+           if digest != chunks.digests[idx]]
+    if size != chunks.size:
+        # The last common chunk was also compared with its old length.
+        bad.append((min(size, chunks.size), max(size, chunks.size)))
+    return merge_ranges(bad)
+
+
+def update(fname: str, chunks: ChunkManifest,
+           ranges: Iterable['tuple[int, int]'],
+           workers: Optional[int] = None) -> ChunkManifest:
+    """Return chunks updated for rewrites of the (start, end) byte
+    ranges of fname. Only chunks that overlap the ranges, or that the
+    file has grown into, are hashed."""
+    size = os.path.getsize(fname)
+    count = chunk_count(size, chunks.chunk_size)
+    old_count = len(chunks.digests)
+    changed = set(range(min(count, old_count) - 1, count)
+                  if size != chunks.size else ())
+    for start, end in ranges:
+        first = start // chunks.chunk_size
+        last = (max(start, end - 1)) // chunks.chunk_size
+        changed.update(range(first, min(last, count - 1) + 1))
+    digests = chunks.digests[:count]
+    for idx, digest in hash_chunks(fname, chunks.alg_id, sorted(changed),
+                                   chunks.chunk_size, workers).items():
+        if idx < len(digests):
+            digests[idx] = digest
+        else:
+            digests.append(digest)
+    return ChunkManifest(chunks.alg_id, chunks.chunk_size, size, digests)
+
+
+def _parse_range(text: str) -> 'tuple[int, int]':
+    """Parse 'OFFSET+LENGTH' for the command line."""
+    try:
+        offset, length = (int(part) for part in text.split('+'))
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(
+            f'"{text}" is not OFFSET+LENGTH.') from err
+    return (offset, offset + length)
+
+
+def _positive_int(text: str) -> int:
+    """Return text as an int greater than 0, for argparse."""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        raise argparse.ArgumentTypeError(
+            f'"{text}" is not a positive integer.')
+    return value
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Command line for chunk manifests. Return the exit status."""
+    parser = argparse.ArgumentParser(
+        prog='ezchecksum-chunks',
+        description='Build, verify or update chunk sidecar manifests.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_cmd = commands.add_parser('build', help='Write sidecar.')
+    build_cmd.add_argument('-a', '--algorithm', default='SHA256',
+                           choices=[alg.name for alg in Hp.HASH_TYPES],
+                           help='Hash algorithm (default: SHA256).')
+    build_cmd.add_argument('--chunk-mib', type=_positive_int,
+                           default=CHUNK_SIZE // 1048576, metavar='MIB',
+                           help='Chunk size (default: %(default)s).')
+    verify_cmd = commands.add_parser(
+        'verify', help='Report byte ranges that differ from sidecar.')
+    update_cmd = commands.add_parser(
+        'update', help='Rehash chunks that overlap rewritten ranges.')
+    for command in (build_cmd, verify_cmd, update_cmd):
+        command.add_argument('file')
+        command.add_argument('--workers', type=int, default=None,
+                             metavar='N', help='Chunks hashed at once.')
+    update_cmd.add_argument('ranges', nargs='*', type=_parse_range,
+                            metavar='OFFSET+LENGTH')
+    args = parser.parse_args(argv)
+    path = sidecar_path(args.file)
+    try:
+        if args.command == 'build':
+            chunks = build(args.file, Hp.get_hash_index(args.algorithm),
+                           args.chunk_mib * 1048576, args.workers)
+        else:
+            chunks = read_sidecar(path)
+            if args.command == 'verify':
+                bad = verify(args.file, chunks, args.workers)
+                for start, end in bad:
+                    print(f'{args.file}: bytes {start}-{end - 1} differ.')
+                if not bad:
+                    print(f'{args.file}: OK')
+                return 1 if bad else 0
+            chunks = update(args.file, chunks, args.ranges, args.workers)
+        write_sidecar(path, chunks)
+        print(f'{path}: {len(chunks.digests)} chunks, root '
+              f'{chunks.root.hex()}')
+        return 0
+    except (ChunkManifestError, OSError) as err:
+        sys.stderr.write(f'{err}\n')
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
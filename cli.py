@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+"""Command line interface for calculating checksums without the GUI.
+
+Results are written to stdout in GNU coreutils format. A file name of
+``-`` reads from stdin, so that checksums can be calculated within a
+pipeline without staging data on disk::
+
+    curl -s https://example.com/file.iso | python cli.py -a SHA256 -
+
+With ``--watch``, directories are watched and files hashed as they are
+written::
+
+    python cli.py --watch --append incoming.sha256 incoming/
+
+With ``--files-from``, a list of paths is read as a stream, from a file
+or stdin, and hashed by a pool of workers as it is read::
+
+    find /data -type f -print0 | python cli.py -0 --files-from -
+"""
+
+import argparse
+import os
+import stat
+import sys
+import threading
+from functools import partial
+from typing import Iterator
+
+import hash_profiles as Hp
+import batch
+import calc
+import calibrate
+import manifest
+import profiler
+import readers
+import throttle
+import watch
+from results import Result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the command line argument parser."""
+    parser = argparse.ArgumentParser(
+        prog='ezchecksum-cli',
+        description='Calculate checksums of files, pipes or stdin.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='Files to hash. "-" (default) reads stdin.')
+    parser.add_argument('-a', '--algorithm', default='SHA256',
+                        choices=[alg.name for alg in Hp.HASH_TYPES],
+                        help='Hash algorithm (default: SHA256).')
+    parser.add_argument('--progress', action='store_true',
+                        help='Show bytes read on stderr.')
+    parser.add_argument('--cache', default='normal',
+                        choices=readers.CACHE_MODES,
+                        help='Page cache handling for files. "dontneed" '
+                        'and "direct" avoid filling the page cache '
+                        '(default: normal).')
+    parser.add_argument('--prefetch', type=int,
+                        default=readers.PREFETCH_DEPTH, metavar='N',
+                        help='Buffers read ahead by a reader thread, 0 to '
+                        'disable (default: %(default)s).')
+    parser.add_argument('--storage', default='local',
+                        choices=readers.STORAGE_PROFILES,
+                        help='"network" reads large blocks, several at '
+                        'once, and retries transient errors, for NFS and '
+                        'SMB mounts (default: local).')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Hash all files below directories, using a '
+                        'pool of worker threads.')
+    parser.add_argument('--files-from', metavar='LIST',
+                        help='Hash the files listed in LIST, one per line, '
+                        'using a pool of worker threads. "-" reads the '
+                        'list from stdin.')
+    parser.add_argument('-0', '--null', action='store_true',
+                        help='Paths in --files-from are separated by NUL '
+                        'characters rather than newlines.')
+    parser.add_argument('--order', default='completion',
+                        choices=('completion', 'input'),
+                        help='Order of --files-from results (default: '
+                        'completion).')
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='Worker threads for --recursive and '
+                        '--files-from (default: as calibrated, or 4 per '
+                        'CPU, up to 32; 1 per CPU for processes).')
+    parser.add_argument('--backend', default='auto', choices=batch.BACKENDS,
+                        help='Workers for --recursive and --files-from. '
+                        '"auto" uses processes for algorithms that hold '
+                        'the GIL (default: auto).')
+    parser.add_argument('--limit', type=float, default=0.0, metavar='MB/S',
+                        help='Limit read bandwidth of each file. Not '
+                        'applied with worker pools.')
+    parser.add_argument('--cpu-share', type=int, default=100,
+                        metavar='PERCENT',
+                        help='Limit CPU use to a share of one CPU. Not '
+                        'applied with worker pools.')
+    parser.add_argument('--ionice', default='normal',
+                        choices=throttle.IO_CLASSES,
+                        help='I/O priority (default: normal).')
+    parser.add_argument('--nice', type=int, default=0, metavar='N',
+                        help='CPU priority, 0 to 19 (default: 0).')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='Profile the run, including worker threads, '
+                        'and write a report to REPORT (and REPORT.prof).')
+    parser.add_argument('--watch', action='store_true',
+                        help='Watch directories and hash files as they '
+                        'are written, until interrupted (Linux only).')
+    parser.add_argument('--append', metavar='MANIFEST',
+                        help='Append --watch results to MANIFEST rather '
+                        'than writing them to stdout.')
+    return parser
+
+
+def show_progress(bytes_read: int) -> None:
+    """Write bytes read so far to stderr."""
+    sys.stderr.write(f'\r{bytes_read / 1048576:.1f} MiB read.')
+    sys.stderr.flush()
+
+
+def hash_source(fname: str, alg_id: int, progress: bool = False,
+                cache_mode: str = 'normal', prefetch: int = 0,
+                storage: str = 'local',
+                limits: throttle.Limits = throttle.Limits(),
+                blocksize: int = calc.STREAM_BLOCKSIZE) -> bytes:
+    """Return digest of file fname, or of stdin if fname is '-'."""
+    callback = show_progress if progress else None
+    if fname == '-':
+        blocks = iter(partial(sys.stdin.buffer.read, blocksize), b'')
+    elif storage == 'network':
+        blocks = readers.iter_network(fname)
+    else:
+        blocks = readers.iter_blocks(fname, blocksize, cache_mode,
+                                     prefetch)
+    digest, _ = calc.hash_blocks(throttle.throttled(blocks, limits), alg_id,
+                                 progress=callback)
+    if progress:
+        sys.stderr.write('\n')
+    assert digest is not None  # Cannot be stopped.
+    return digest
+
+
+def report_error(err: OSError) -> None:
+    """Write error to stderr."""
+    sys.stderr.write(f'{err.filename}: {err.strerror}\n')
+
+
+def iter_paths(names: 'list[str]') -> Iterator['tuple[str, batch.FileId]']:
+    """Yield (path, file id) for files, and the files below
+    directories, in names. See: batch.iter_tree_ids()."""
+    for name in names:
+        try:
+            info = os.stat(name)
+        except OSError:
+            # Reported when hashed.
+            yield (name, None)
+            continue
+        if stat.S_ISDIR(info.st_mode):
+            yield from batch.iter_tree_ids(name, report_error)
+        else:
+            yield (name, batch.file_id(info))
+
+
+def hash_recursive(names: 'list[str]', alg_id: int,
+                   workers: 'int | None', backend: str = 'auto') -> int:
+    """Hash files and directory trees with batch.hash_unique(), so that
+    hard linked files are read once. Return the exit status."""
+    status = 0
+    for result in batch.hash_unique(iter_paths(names), alg_id, workers,
+                                    backend=backend):
+        if result.error:
+            sys.stderr.write(f'{result.fname}: {result.error}\n')
+            status = 1
+        else:
+            sys.stdout.write(manifest.format_line(result.hexdigest,
+                                                  result.fname))
+    return status
+
+
+def hash_file_list(list_name: str, alg_id: int, workers: 'int | None',
+                   backend: str = 'auto', separator: bytes = b'\n',
+                   ordered: bool = False) -> int:
+    """Hash the files listed in file list_name, or stdin if '-', as
+    the list is read. Return the exit status."""
+    status = 0
+    with (open(list_name, 'rb') if list_name != '-' else
+          open(sys.stdin.fileno(), 'rb', closefd=False)) as file_list:
+        for result in batch.hash_batches(
+                batch.iter_file_list(file_list, separator), alg_id,
+                workers, backend, ordered):
+            if result.error:
+                sys.stderr.write(f'{result.fname}: {result.error}\n')
+                status = 1
+            else:
+                sys.stdout.write(manifest.format_line(result.hexdigest,
+                                                      result.fname))
+    return status
+
+
+def watch_dirs(names: 'list[str]', alg_id: int, output: 'str | None',
+               limits: throttle.Limits = throttle.Limits(),
+               blocksize: int = calc.STREAM_BLOCKSIZE) -> int:
+    """Hash files written below directories names, until interrupted.
+    Results are appended to the manifest output, or written to stdout.
+    Return the exit status."""
+    try:
+        out = (sys.stdout if output is None else
+               open(output, 'at', encoding='utf8', newline='\n'))
+    except OSError as err:
+        report_error(err)
+        return 2
+
+    def write(result: Result) -> None:
+        if result.error:
+            sys.stderr.write(f'{result.fname}: {result.error}\n')
+            return
+        out.write(manifest.format_line(result.hexdigest, result.fname))
+        out.flush()
+
+    def report(err: OSError) -> None:
+        if err.filename is None:
+            sys.stderr.write(f'{err.strerror}\n')
+        else:
+            report_error(err)
+
+    try:
+        watch.watch(names, alg_id, write, threading.Event(),
+                    onerror=report, limits=limits, blocksize=blocksize)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Run the command line interface. Return the exit status."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.files_from is not None and args.files:
+        parser.error('FILE arguments cannot be used with --files-from.')
+    if args.profile is None:
+        return run(args)
+    profiler.start()
+    try:
+        return run(args)
+    finally:
+        # A failure to write the report must not replace the status.
+        try:
+            if profiler.stop(args.profile) is not None:
+                sys.stderr.write(f'Profile written to {args.profile}\n')
+        except OSError as err:
+            sys.stderr.write(f'{args.profile}: {err.strerror}\n')
+
+
+def run(args: argparse.Namespace) -> int:
+    """Hash as parsed command line args. Return the exit status."""
+    alg_id = Hp.get_hash_index(args.algorithm)
+    limits = throttle.Limits(args.limit, args.ionice, args.nice,
+                             args.cpu_share)
+    # Inherited by worker threads and processes.
+    throttle.apply_priority(limits)
+    # Settings saved by calibrate.py, if any.
+    tuned = calibrate.load()
+    blocksize = tuned.blocksize if tuned else calc.STREAM_BLOCKSIZE
+    workers = args.workers or (tuned.workers if tuned else None)
+    if args.files_from is not None:
+        return hash_file_list(args.files_from, alg_id, workers,
+                              args.backend, b'\0' if args.null else b'\n',
+                              args.order == 'input')
+    files = args.files or ['-']
+    if args.watch:
+        return watch_dirs(files, alg_id, args.append, limits, blocksize)
+    if args.recursive:
+        return hash_recursive(files, alg_id, workers,
+                              args.backend)
+    status = 0
+    for fname in files:
+        try:
+            digest = hash_source(fname, alg_id, args.progress,
+                                 args.cache, args.prefetch, args.storage,
+                                 limits, blocksize)
+        except OSError as err:
+            sys.stderr.write(f'{fname}: {err.strerror}\n')
+            status = 1
+            continue
+        sys.stdout.write(manifest.format_line(digest.hex(), fname))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
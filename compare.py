@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""Compare two directory trees.
+
+Files are paired by their path relative to each root. Pairs are first
+compared by size (and optionally by modification time), which needs
+no reads. The remaining pairs are compared by hashing both files in
+parallel, or with ``bytes`` mode, by reading both files in step and
+stopping at the first chunk that differs. Byte comparison reports the
+offset of the first difference, and never reads past it. With ``quick``
+mode, pairs are first compared by sampled fingerprint (see:
+:py:func:`calc.quick_fingerprint`), and only pairs whose fingerprints
+match are hashed in full.
+
+Compare two trees::
+
+    python compare.py -a SHA256 release/ mirror/
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import hash_profiles as Hp
+import batch
+import calc
+import calibrate
+
+
+MODES: tuple[str, ...] = ('hash', 'bytes', 'quick')
+CHUNK_SIZE = 1024 * 1024
+
+# Comparison statuses.
+SAME = 'same'
+DIFFERENT = 'different'
+LEFT_ONLY = 'left only'
+RIGHT_ONLY = 'right only'
+ERROR = 'error'
+
+
+class Comparison(NamedTuple):
+    """Result of comparing one relative path across two trees."""
+    relpath: str
+    status: str
+    detail: str = ''
+
+
+def pair_trees(left: str, right: str
+               ) -> Iterator['tuple[str, str | None, str | None]']:
+    """Yield (relative path, left path, right path) for each file in
+    either tree. The path is None for a file missing from one tree."""
+    left_files = {os.path.relpath(path, left): path
+                  for path in batch.iter_tree(left)}
+    for path in batch.iter_tree(right):
+        relpath = os.path.relpath(path, right)
+        yield (relpath, left_files.pop(relpath, None), path)
+    for relpath, path in left_files.items():
+        yield (relpath, path, None)
+
+
+def first_difference(left: str, right: str,
+                     chunk_size: int = CHUNK_SIZE) -> Optional[int]:
+    """Return offset of the first byte that differs between files left
+    and right, or None if they are identical. Reading stops at the
+    first chunk that differs."""
+    with open(left, 'rb') as lfile, open(right, 'rb') as rfile:
+        offset = 0
+        while True:
+            lbuf = lfile.read(chunk_size)
+            rbuf = rfile.read(chunk_size)
+            if lbuf != rbuf:
+                for idx, (lbyte, rbyte) in enumerate(zip(lbuf, rbuf)):
+                    if lbyte != rbyte:
+                        return offset + idx
+                return offset + min(len(lbuf), len(rbuf))
+            if not lbuf:
+                return None
+            offset += len(lbuf)
+
+
+def _compare_hashes(relpath: str, left: str, right: str, alg_id: int,
+                    pool: ThreadPoolExecutor) -> Comparison:
+    """Compare a pair by hashing both files in parallel."""
+    right_future = pool.submit(calc.hash_file, right, alg_id,
+                               calc.STREAM_BLOCKSIZE)
+    left_digest = calc.hash_file(left, alg_id, calc.STREAM_BLOCKSIZE)
+    right_digest = right_future.result()
+    if left_digest == right_digest:
+        return Comparison(relpath, SAME)
+    return Comparison(relpath, DIFFERENT,
+                      f'{left_digest.hex()} != {right_digest.hex()}')
+
+
+def _compare_pair(relpath: str, left: str, right: str, alg_id: int,
+                  mode: str, trust_mtime: bool,
+                  pool: ThreadPoolExecutor) -> Comparison:
+    """Compare files present in both trees."""
+    try:
+        lstat = os.stat(left)
+        rstat = os.stat(right)
+        if lstat.st_size != rstat.st_size:
+            return Comparison(relpath, DIFFERENT,
+                              f'size {lstat.st_size} != {rstat.st_size}')
+        if trust_mtime and lstat.st_mtime_ns == rstat.st_mtime_ns:
+            return Comparison(relpath, SAME, 'size and mtime')
+        if mode == 'bytes':
+            offset = first_difference(left, right)
+            if offset is None:
+                return Comparison(relpath, SAME)
+            return Comparison(relpath, DIFFERENT,
+                              f'first difference at byte {offset}')
+        if mode == 'quick':
+            same, escalated = calc.quick_compare(left, right, alg_id)
+            if same:
+                return Comparison(relpath, SAME)
+            return Comparison(relpath, DIFFERENT,
+                              'full hash' if escalated
+                              else 'quick fingerprint')
+        return _compare_hashes(relpath, left, right, alg_id, pool)
+    except (OSError, ValueError) as err:
+        return Comparison(relpath, ERROR, calc.error_message(err))
+
+
+def compare_trees(left: str, right: str, alg_id: int,
+                  mode: str = 'hash', trust_mtime: bool = False,
+                  workers: Optional[int] = None) -> Iterator[Comparison]:
+    """Compare the files of two directory trees.
+
+    Comparisons are yielded as they complete.
+
+    Args:
+        mode: Str. One of MODES.
+        trust_mtime: Bool. Treat files of the same size and
+        modification time as the same, without reading them.
+        workers: Int. Number of pairs compared at once.
+    """
+    if mode not in MODES:
+        raise ValueError(f'"{mode}" is not a valid compare mode.')
+    workers = workers or batch.default_workers()
+    # Each hash comparison hashes its right file in a second pool, so
+    # that a pair cannot wait for a thread held by another pair.
+    with ThreadPoolExecutor(workers, 'ezchecksum-compare') as pairs, \
+            ThreadPoolExecutor(workers, 'ezchecksum-hash') as hashers:
+        pending: 'set[Future]' = set()
+        for relpath, lpath, rpath in pair_trees(left, right):
+            if lpath is None:
+                yield Comparison(relpath, RIGHT_ONLY)
+                continue
+            if rpath is None:
+                yield Comparison(relpath, LEFT_ONLY)
+                continue
+            pending.add(pairs.submit(_compare_pair, relpath, lpath, rpath,
+                                     alg_id, mode, trust_mtime, hashers))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def report(comparisons: Iterable[Comparison], show_same: bool = False
+           ) -> int:
+    """Write comparisons to stdout. Return the number of differences."""
+    differences = 0
+    for item in comparisons:
+        if item.status == SAME:
+            if not show_same:
+                continue
+        else:
+            differences += 1
+        detail = f' ({item.detail})' if item.detail else ''
+        sys.stdout.write(f'{item.status}: {item.relpath}{detail}\n')
+    return differences
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Command line for comparing trees. Return the exit status: 0 if
+    the trees match, 1 if they differ."""
+    # Any algorithm will do, so use the fastest if calibrated.
+    tuned = calibrate.load()
+    parser = argparse.ArgumentParser(
+        prog='ezchecksum-compare',
+        description='Compare files in two directory trees.')
+    parser.add_argument('left')
+    parser.add_argument('right')
+    parser.add_argument('-a', '--algorithm',
+                        default=tuned.fast_algorithm if tuned else 'SHA256',
+                        choices=[alg.name for alg in Hp.HASH_TYPES],
+                        help='Hash algorithm (default: the fastest if '
+                        'calibrated, otherwise SHA256).')
+    parser.add_argument('--mode', default='hash', choices=MODES,
+                        help='"bytes" compares contents directly, '
+                        'stopping at the first difference. "quick" '
+                        'compares sampled fingerprints, and hashes only '
+                        'files whose fingerprints match (default: hash).')
+    parser.add_argument('--trust-mtime', action='store_true',
+                        help='Treat files with the same size and '
+                        'modification time as the same.')
+    parser.add_argument('--workers', type=int,
+                        default=tuned.workers if tuned else None,
+                        metavar='N', help='Pairs compared at once.')
+    parser.add_argument('--all', action='store_true',
+                        help='Also list files that are the same.')
+    args = parser.parse_args(argv)
+    for root in (args.left, args.right):
+        if not os.path.isdir(root):
+            sys.stderr.write(f'{root}: Not a directory.\n')
+            return 2
+    differences = report(
+        compare_trees(args.left, args.right,
+                      Hp.get_hash_index(args.algorithm), args.mode,
+                      args.trust_mtime, args.workers),
+        args.all)
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
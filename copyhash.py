@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Copy files, calculating their checksums in the same pass.
+
+Copying and then verifying reads the source twice: once to copy it and
+once to hash it, and then reads the copy to check it. Here the source
+is hashed as it is copied, so it is read once. The copy may then be
+read back, bypassing the page cache so that the data comes from the
+destination device rather than from memory, and its checksum compared.
+
+Copy files to removable media and verify the copies::
+
+    python copyhash.py --verify -a SHA256 *.iso /media/usb/
+"""
+
+import argparse
+import errno
+import os
+import shutil
+import sys
+from typing import Callable, NamedTuple, Optional
+
+import hash_profiles as Hp
+import calc
+import manifest
+import readers
+
+
+BLOCKSIZE = 1024 * 1024
+
+
+class CopyResult(NamedTuple):
+    """Result of copying one file.
+
+    verified is None if the copy was not read back.
+    """
+    source: str
+    destination: str
+    digest: bytes
+    verified: Optional[bool] = None
+
+
+def copy_and_hash(source: str, destination: str, alg_id: int,
+                  verify: bool = False, blocksize: int = BLOCKSIZE,
+                  prefetch: int = readers.PREFETCH_DEPTH,
+                  progress: Optional[Callable[[int], None]] = None
+                  ) -> CopyResult:
+    """Copy file source to destination, and return the digest of the
+    data copied.
+
+    The copy is written to a temporary file in the destination
+    directory, with fsync(), and with verify, read back with the page
+    cache bypassed (see: readers.CACHE_MODES) and its digest compared.
+    The copy then replaces destination atomically. A copy that fails,
+    or that fails verification, is removed and destination is left
+    unchanged. Permissions and times are copied as shutil.copy2().
+
+    Args:
+        progress: Called with the number of bytes copied.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise shutil.SameFileError(
+            errno.EINVAL, 'Source and destination are the same file',
+            destination)
+    hasher = Hp.get_hash(alg_id).hasher.copy()
+    copied = 0
+    with manifest.temp_file(destination) as (fd, tmp_path):
+        with os.fdopen(fd, 'wb') as out:
+            for buf in readers.iter_blocks(source, blocksize, 'normal',
+                                           prefetch):
+                hasher.update(buf)
+                out.write(buf)
+                copied += len(buf)
+                if progress is not None:
+                    progress(copied)
+            out.flush()
+            os.fsync(out.fileno())
+            # Written pages are now clean, and can be dropped, so that
+            # a read back comes from the device.
+            readers.drop_cache(out.fileno())
+        shutil.copystat(source, tmp_path)
+        digest = hasher.digest()
+        verified = None
+        if verify:
+            verified = calc.hash_file(tmp_path, alg_id, blocksize,
+                                      'direct') == digest
+        if verified is False:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, destination)
+    return CopyResult(source, destination, digest, verified)
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Command line for copying files. Checksums of the copies are
+    written to stdout in GNU format. Return the exit status."""
+    parser = argparse.ArgumentParser(
+        prog='ezchecksum-copy',
+        description='Copy files, calculating checksums while copying.')
+    parser.add_argument('sources', nargs='+', metavar='SOURCE')
+    parser.add_argument('destination', metavar='DEST',
+                        help='Destination file, or directory for several '
+                        'sources.')
+    parser.add_argument('-a', '--algorithm', default='SHA256',
+                        choices=[alg.name for alg in Hp.HASH_TYPES],
+                        help='Hash algorithm (default: SHA256).')
+    parser.add_argument('--verify', action='store_true',
+                        help='Read back each copy, bypassing the page '
+                        'cache, and compare checksums.')
+    args = parser.parse_args(argv)
+    alg_id = Hp.get_hash_index(args.algorithm)
+    to_dir = os.path.isdir(args.destination)
+    if len(args.sources) > 1 and not to_dir:
+        sys.stderr.write(f'{args.destination}: Not a directory.\n')
+        return 2
+    status = 0
+    for source in args.sources:
+        destination = args.destination
+        if to_dir:
+            destination = os.path.join(destination, os.path.basename(source))
+        try:
+            result = copy_and_hash(source, destination, alg_id, args.verify)
+        except OSError as err:
+            sys.stderr.write(f'{source}: {calc.error_message(err)}\n')
+            status = 1
+            continue
+        if result.verified is False:
+            sys.stderr.write(f'{destination}: Verification FAILED. The copy '
+                             'did not match the source, and was removed.\n')
+            status = 1
+            continue
+        sys.stdout.write(manifest.format_line(result.digest.hex(),
+                                              destination))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,14 @@
 """Additional dialogs used by the application"""
 
+import os
+
 from PyQt6.QtWidgets import QMessageBox
 from PyQt6.QtWidgets import QFileDialog
 from PyQt6.QtWidgets import QDialog
+from PyQt6.QtWidgets import (QComboBox, QDialogButtonBox, QDoubleSpinBox,
+                             QFormLayout, QSpinBox)
+
+import throttle
 
 
 def critical(parent, message) -> None:
@@ -72,3 +78,73 @@ def save_results(parent, text) -> None:
         except IOError as err:
             detail_msg = f'I/O error: {err.errno}\n{err.strerror}'
             dialog('File write error.', title='Error', details=detail_msg)
+
+
+def export_file(parent, formats) -> 'tuple[str, str] | None':
+    """Select file and format for exporting results.
+
+    Args:
+        formats: dict {format name: (exporter, default suffix)}
+
+    Returns
+    -------
+        tuple or None
+            (file name, format name), or None if cancelled.
+    """
+    filters = {f'{name} (*.{suffix})': (name, suffix)
+               for name, (_, suffix) in formats.items()}
+    dlog = QFileDialog()
+    dlog.setAcceptMode(QFileDialog.AcceptMode.AcceptSave)
+    dlog.setNameFilter(';;'.join(filters))
+    dlog.setFileMode(QFileDialog.FileMode.AnyFile)
+    dlog.setDirectory(parent.save_dir)
+    if dlog.exec() != QDialog.DialogCode.Accepted:
+        return None
+    parent.save_dir = dlog.directory().path()
+    fmt, suffix = filters[dlog.selectedNameFilter()]
+    fname = dlog.selectedFiles()[0]
+    # Add suffix of selected format if none provided.
+    if not os.path.splitext(fname)[1]:
+        fname = f'{fname}.{suffix}'
+    return (fname, fmt)
+
+
+def limits(parent, current: throttle.Limits) -> 'throttle.Limits | None':
+    """Edit limits for background verification.
+
+    Returns
+    -------
+        throttle.Limits or None
+            The new limits, or None if cancelled.
+    """
+    dlog = QDialog(parent)
+    dlog.setWindowTitle('Background Limits')
+    layout = QFormLayout(dlog)
+    bandwidth = QDoubleSpinBox()
+    bandwidth.setRange(0, 100000)
+    bandwidth.setSuffix(' MB/s')
+    bandwidth.setSpecialValueText('Unlimited')
+    bandwidth.setValue(current.bandwidth)
+    layout.addRow('Read bandwidth:', bandwidth)
+    io_class = QComboBox()
+    io_class.addItems(throttle.IO_CLASSES)
+    io_class.setCurrentText(current.io_class)
+    layout.addRow('I/O priority:', io_class)
+    nice = QSpinBox()
+    nice.setRange(0, 19)
+    nice.setValue(current.nice)
+    layout.addRow('Nice:', nice)
+    cpu_share = QSpinBox()
+    cpu_share.setRange(1, 100)
+    cpu_share.setSuffix(' %')
+    cpu_share.setValue(current.cpu_share)
+    layout.addRow('CPU share:', cpu_share)
+    buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok |
+                               QDialogButtonBox.StandardButton.Cancel)
+    buttons.accepted.connect(dlog.accept)
+    buttons.rejected.connect(dlog.reject)
+    layout.addRow(buttons)
+    if dlog.exec() != QDialog.DialogCode.Accepted:
+        return None
+    return throttle.Limits(bandwidth.value(), io_class.currentText(),
+                           nice.value(), cpu_share.value())
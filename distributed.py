@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+
+"""Hash files with worker processes on several machines.
+
+A coordinator splits a job list into shards, and sends them to worker
+nodes over TCP. Each node hashes its shards with the same engine as
+the rest of EZ Checksum (:py:func:`batch.hash_files`), reading from its
+own disks, and the coordinator merges the results into one manifest.
+Shards are handed out as nodes finish, so faster nodes take more of the
+work. A shard sent to a node that fails, rejects it, or does not return
+it in time, is sent to another node.
+
+Paths are sent relative to a root that each node sets for itself, such
+as the mount point of a shared artifact store. A node does not hash a
+path that is absolute, or that resolves to outside its root.
+
+Messages are JSON, over :py:mod:`multiprocessing.connection` sockets
+authenticated with the key in the environment variable
+``EZCHECKSUM_AUTHKEY``, which must be the same on every node.
+
+Start a worker on each node, then run the coordinator::
+
+    python distributed.py worker --listen 0.0.0.0:7700 --root /store
+    python distributed.py run --node host1:7700 --node host2:7700 \\
+        --output store.sha256 builds/41 builds/42
+
+With ``--local N``, the coordinator starts N worker processes on
+localhost, which is useful for testing.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import contextmanager
+from itertools import islice
+from multiprocessing.connection import Client, Connection, Listener, wait
+from typing import Any, Iterable, Iterator
+
+import hash_profiles as Hp
+import batch
+import manifest
+from results import Result
+
+
+SHARD_SIZE = 256
+# Shards sent to a node before it returns results, so that it is not
+# left idle while the coordinator sends more.
+SHARDS_PER_NODE = 2
+# Seconds within which a node must return each shard.
+SHARD_TIMEOUT = 600.0
+AUTHKEY_VARIABLE = 'EZCHECKSUM_AUTHKEY'
+
+Address = tuple[str, int]
+
+
+class DistributedError(Exception):
+    """Raised when the work cannot be completed by the nodes."""
+
+
+def _send(conn: Connection, message: Any) -> None:
+    conn.send_bytes(json.dumps(message).encode('utf8'))
+
+
+def _recv(conn: Connection) -> Any:
+    return json.loads(conn.recv_bytes().decode('utf8'))
+
+
+def parse_address(text: str) -> Address:
+    """Return (host, port) from 'HOST:PORT'."""
+    host, _, port = text.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def authkey() -> bytes:
+    """Return the shared key from the environment."""
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    if not key:
+        raise DistributedError(f'Set {AUTHKEY_VARIABLE} to the same secret '
+                               'on every node.')
+    return key.encode('utf8')
+
+
+def is_below(root: str, fname: str) -> bool:
+    """Return True if relative path fname resolves to a path below
+    root (default: the current directory), following symbolic links."""
+    if os.path.isabs(fname):
+        return False
+    base = os.path.realpath(root or os.curdir)
+    path = os.path.realpath(os.path.join(base, fname))
+    return os.path.commonpath([path, base]) == base
+
+
+def hash_shard(files: 'list[str]', alg_id: int,
+               root: str = '') -> 'list[list[str]]':
+    """Hash files relative to root. Return [[file, hex digest, error],
+    ...] in the order of files. Files outside root are not read, and
+    returned with an error."""
+    # Joined path of each file, or None if it is outside root.
+    paths = [os.path.join(root, fname) if is_below(root, fname) else None
+             for fname in files]
+    # Each path is hashed once, though it may be listed more than once.
+    hashed = {result.fname: result for result in batch.hash_files(
+        dict.fromkeys(path for path in paths if path is not None), alg_id,
+        backend='thread')}
+    results: 'list[list[str]]' = []
+    for fname, path in zip(files, paths):
+        if path is None:
+            results.append([fname, '', 'Not below the root directory.'])
+        else:
+            results.append([fname, hashed[path].hexdigest,
+                            hashed[path].error])
+    return results
+
+
+def _parse_request(request: Any) -> 'tuple[int, list[str]]':
+    """Return (algorithm id, files) of a request. Raise ValueError
+    if it is not valid."""
+    if not isinstance(request, dict) or not isinstance(request.get('id'),
+                                                       int):
+        raise ValueError('no shard id')
+    algorithm = request.get('algorithm')
+    if algorithm not in [alg.name for alg in Hp.HASH_TYPES]:
+        raise ValueError(f'unknown algorithm {algorithm!r}')
+    files = request.get('files')
+    if (not isinstance(files, list)
+            or not all(isinstance(fname, str) for fname in files)):
+        raise ValueError('files must be a list of paths')
+    return (Hp.get_hash_index(algorithm), files)
+
+
+def _reply(request: Any, root: str) -> 'dict[str, Any]':
+    """Return the reply to a request: its results, or an error."""
+    try:
+        alg_id, files = _parse_request(request)
+    except ValueError as err:
+        shard_id = request.get('id') if isinstance(request, dict) else None
+        return {'id': shard_id if isinstance(shard_id, int) else None,
+                'error': f'Invalid request: {err}.'}
+    return {'id': request['id'], 'results': hash_shard(files, alg_id, root)}
+
+
+def serve(listener: Listener, root: str = '') -> None:
+    """Hash shards for coordinators connecting to listener, one
+    coordinator at a time, until interrupted. Invalid requests are
+    answered with an error."""
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError,
+                multiprocessing.AuthenticationError) as err:
+            sys.stderr.write(f'Connection refused: {err}\n')
+            continue
+        with conn:
+            while True:
+                try:
+                    try:
+                        request = _recv(conn)
+                    except ValueError:
+                        request = None  # Not JSON.
+                    _send(conn, _reply(request, root))
+                except (EOFError, OSError):
+                    break
+
+
+def _check_reply(reply: Any, shards: 'dict[int, list[str]]') -> str:
+    """Return why reply is not the results of one of shards, or ''
+    if it is."""
+    if not isinstance(reply, dict):
+        return 'Invalid reply.'
+    if 'error' in reply:
+        return str(reply['error'])
+    if (not isinstance(reply.get('id'), int) or reply['id'] not in shards
+            or not isinstance(reply.get('results'), list)):
+        return 'Invalid reply.'
+    return ''
+
+
+class _Coordinator:
+    """Shards sent to each node, and the time by which each busy node
+    must return its next shard. See: hash_distributed()."""
+
+    def __init__(self, fnames: Iterable[str], alg_id: int,
+                 shard_size: int, timeout: float) -> None:
+        self.source = iter(fnames)
+        self.algorithm = Hp.get_hash_name(alg_id)
+        self.shard_size = shard_size
+        self.timeout = timeout
+        # {connection: 'HOST:PORT'} for messages.
+        self.names: 'dict[Connection, str]' = {}
+        # {shard id: files} sent to each connection.
+        self.outstanding: 'dict[Connection, dict[int, list[str]]]' = {}
+        # Time by which each busy node must return its next shard.
+        self.deadlines: 'dict[Connection, float]' = {}
+        # Shards returned by failed nodes.
+        self.retry: 'list[list[str]]' = []
+        self.next_id = 0
+
+    def connect(self, nodes: 'list[Address]', key: bytes) -> None:
+        """Connect to nodes. Nodes that cannot be reached are
+        reported, and not used."""
+        for address in nodes:
+            name = f'{address[0]}:{address[1]}'
+            try:
+                conn = Client(address, authkey=key)
+            except (OSError, multiprocessing.AuthenticationError) as err:
+                sys.stderr.write(f'{name}: {err}\n')
+                continue
+            self.names[conn] = name
+            self.outstanding[conn] = {}
+
+    def close(self) -> None:
+        """Close the connections to the remaining nodes."""
+        for conn in self.outstanding:
+            conn.close()
+
+    def _next_shard(self) -> 'list[str]':
+        if self.retry:
+            return self.retry.pop()
+        return list(islice(self.source, self.shard_size))
+
+    def send_shards(self) -> bool:
+        """Send shards until each node has SHARDS_PER_NODE. Return
+        False if no work remains."""
+        for conn, shards in list(self.outstanding.items()):
+            while len(shards) < SHARDS_PER_NODE:
+                shard = self._next_shard()
+                if not shard:
+                    break
+                if not shards:
+                    self.deadlines[conn] = time.monotonic() + self.timeout
+                shard_id = self.next_id
+                self.next_id += 1
+                shards[shard_id] = shard
+                try:
+                    _send(conn, {'id': shard_id,
+                                 'algorithm': self.algorithm,
+                                 'files': shard})
+                except OSError:
+                    break  # Found on wait().
+        return any(self.outstanding.values())
+
+    def drop(self, conn: Connection, reason: str) -> None:
+        """Stop using node conn, and send its work elsewhere."""
+        sys.stderr.write(f'{self.names[conn]}: {reason}\n')
+        self.retry.extend(self.outstanding.pop(conn).values())
+        self.deadlines.pop(conn, None)
+        conn.close()
+
+    def ready(self) -> 'list[Connection]':
+        """Drop nodes that are past their deadline. Wait until the
+        deadline of a node, and return the nodes with a reply."""
+        now = time.monotonic()
+        for conn, deadline in list(self.deadlines.items()):
+            if deadline <= now:
+                self.drop(conn, f'No result within {self.timeout:g} '
+                          'seconds.')
+        if not self.deadlines:
+            return []
+        conns = wait(list(self.deadlines), min(self.deadlines.values()) - now)
+        return [conn for conn in conns if isinstance(conn, Connection)]
+
+    def receive(self, conn: Connection) -> 'list[Result]':
+        """Return the results in the reply from conn. A node that has
+        failed, or sent an invalid reply, is dropped."""
+        try:
+            reply = _recv(conn)
+        except (EOFError, OSError):
+            self.drop(conn, 'Connection lost.')
+            return []
+        except ValueError:
+            reply = None  # Not JSON.
+        shards = self.outstanding[conn]
+        error = _check_reply(reply, shards)
+        if error:
+            self.drop(conn, error)
+            return []
+        del shards[reply['id']]
+        if shards:
+            self.deadlines[conn] = time.monotonic() + self.timeout
+        else:
+            del self.deadlines[conn]
+        return [Result(fname, bytes.fromhex(digest) if digest else None,
+                       error)
+                for fname, digest, error in reply['results']]
+
+
+def hash_distributed(fnames: Iterable[str], alg_id: int,
+                     nodes: 'list[Address]', key: bytes,
+                     shard_size: int = SHARD_SIZE,
+                     timeout: float = SHARD_TIMEOUT) -> Iterator[Result]:
+    """Hash fnames (relative to the root of each node) on nodes.
+
+    fnames is consumed lazily, as shards are sent. Results are yielded
+    as shards complete. A node that fails, rejects a shard, or does not
+    return a shard within timeout seconds of starting it, is dropped and
+    its shards sent to other nodes. Raises DistributedError if no node
+    remains to complete the work.
+    """
+    coordinator = _Coordinator(fnames, alg_id, shard_size, timeout)
+    try:
+        coordinator.connect(nodes, key)
+        while coordinator.outstanding:
+            if not coordinator.send_shards():
+                return
+            for conn in coordinator.ready():
+                yield from coordinator.receive(conn)
+        raise DistributedError('No worker node is available.')
+    finally:
+        coordinator.close()
+
+
+def _local_worker(pipe: Connection, key: bytes, root: str) -> None:
+    """Process target for local_cluster()."""
+    with Listener(('127.0.0.1', 0), authkey=key) as listener:
+        pipe.send(listener.address)
+        pipe.close()
+        try:
+            serve(listener, root)
+        except KeyboardInterrupt:
+            pass
+
+
+@contextmanager
+def local_cluster(count: int, key: bytes,
+                  root: str = '') -> Iterator['list[Address]']:
+    """Run count worker processes on localhost. Yield their
+    addresses."""
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        'forkserver' if 'forkserver' in methods else 'spawn')
+    processes = []
+    addresses = []
+    try:
+        for _ in range(count):
+            parent, child = context.Pipe()
+            process = context.Process(target=_local_worker,
+                                      args=(child, key, root), daemon=True)
+            process.start()
+            processes.append(process)
+            addresses.append(parent.recv())
+        yield addresses
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+def _iter_jobs(args: argparse.Namespace) -> Iterator[str]:
+    """Yield files to hash, relative to the node roots."""
+    if args.verify:
+        yield from args.expected
+    for name in args.files:
+        local = os.path.join(args.root, name)
+        if os.path.isdir(local):
+            for path in batch.iter_tree(local):
+                yield os.path.relpath(path, args.root or None)
+        else:
+            yield name
+
+
+def _run(args: argparse.Namespace, nodes: 'list[Address]',
+         key: bytes) -> int:
+    """Coordinate a run. Return the exit status."""
+    alg_id = Hp.get_hash_index(args.algorithm)
+    status = 0
+    out = manifest.ManifestWriter(args.output) if args.output else None
+    try:
+        for result in hash_distributed(_iter_jobs(args), alg_id, nodes,
+                                       key, timeout=args.timeout):
+            if result.error:
+                sys.stderr.write(f'{result.fname}: {result.error}\n')
+                status = 1
+                continue
+            expected = args.expected.get(result.fname)
+            if expected is not None and expected != result.hexdigest:
+                sys.stdout.write(f'{result.fname}: FAILED\n')
+                status = 1
+            if out is not None:
+                assert result.digest is not None  # Not an error.
+                out.add_digest(result.fname, result.digest)
+            elif not args.verify:
+                sys.stdout.write(manifest.format_line(result.hexdigest,
+                                                      result.fname))
+    except BaseException:
+        if out is not None:
+            out.abort()
+        raise
+    if out is not None:
+        out.close()
+    return status
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Command line for workers and coordinators."""
+    parser = argparse.ArgumentParser(
+        prog='ezchecksum-distributed',
+        description='Hash files on several machines.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='Serve hashing requests.')
+    worker.add_argument('--listen', type=parse_address,
+                        default=('127.0.0.1', 7700), metavar='HOST:PORT')
+    run = commands.add_parser('run', help='Coordinate hashing on nodes.')
+    run.add_argument('files', nargs='*', metavar='FILE',
+                     help='Files or directories, relative to --root.')
+    run.add_argument('--node', type=parse_address, action='append',
+                     default=[], metavar='HOST:PORT')
+    run.add_argument('--local', type=int, default=0, metavar='N',
+                     help='Start N worker processes on localhost.')
+    run.add_argument('-a', '--algorithm', default='SHA256',
+                     choices=[alg.name for alg in Hp.HASH_TYPES],
+                     help='Hash algorithm (default: SHA256).')
+    run.add_argument('--verify', metavar='MANIFEST',
+                     help='Hash the files in a GNU format manifest, and '
+                     'report those that do not match.')
+    run.add_argument('--output', metavar='MANIFEST',
+                     help='Write merged results to MANIFEST rather than '
+                     'stdout.')
+    run.add_argument('--timeout', type=float, default=SHARD_TIMEOUT,
+                     metavar='SECONDS',
+                     help='Time a node may take to return each shard '
+                     'before its work is sent to other nodes (default: '
+                     '%(default)g).')
+    for command in (worker, run):
+        command.add_argument('--root', default='',
+                             help='Directory that paths are relative to.')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'worker':
+            with Listener(args.listen, authkey=authkey()) as listener:
+                serve(listener, args.root)
+            return 0
+        args.expected = {}
+        if args.verify:
+            # Imported here, as only the coordinator reads manifests.
+            import refindex  # pylint: disable=import-outside-toplevel
+            with open(args.verify, 'rt', encoding='utf8') as fp:
+                for line in fp:
+                    entry = refindex.parse_manifest_line(line)
+                    if entry is not None:
+                        args.expected[entry[1]] = entry[0]
+        if bool(args.local) == bool(args.node):
+            parser.error('one of --node or --local is required.')
+        if args.local:
+            key = os.urandom(32)
+            with local_cluster(args.local, key, args.root) as nodes:
+                return _run(args, nodes, key)
+        return _run(args, args.node, authkey())
+    except (DistributedError, OSError) as err:
+        sys.stderr.write(f'{err}\n')
+        return 2
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
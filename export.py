@@ -0,0 +1,121 @@
+"""Streaming exporters for checksum results.
+
+Each exporter writes results to its stream as they arrive, so that
+exporting never requires the complete set of results to be held in
+memory.
+
+    Supported formats:
+
+    - JSON Lines
+    - CSV
+    - GNU (md5sum / sha256sum style)
+    - BSD tag (``SHA256 (file) = ...``)
+
+"""
+
+import abc
+import csv
+import json
+from typing import IO, Callable
+
+import manifest
+
+
+class Exporter(abc.ABC):
+    """Base class for streaming exporters.
+
+    Args:
+        stream: A writable text stream.
+        flush: Bool. Flush the stream after each result so that results
+        are available to readers of the file immediately.
+    """
+
+    def __init__(self, stream: IO[str], flush: bool = False) -> None:
+        self.stream = stream
+        self.flush = flush
+        self.count = 0
+
+    def __enter__(self) -> 'Exporter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def write(self, fname: str, algorithm: str, checksum: str) -> None:
+        """Write one result."""
+        self.write_result(fname, algorithm, checksum)
+        self.count += 1
+        if self.flush:
+            self.stream.flush()
+
+    @abc.abstractmethod
+    def write_result(self, fname: str, algorithm: str,
+                     checksum: str) -> None:
+        """Format one result."""
+
+    def close(self) -> None:
+        """Flush and close the stream."""
+        if not self.stream.closed:
+            self.stream.flush()
+            self.stream.close()
+
+
+class JsonLinesExporter(Exporter):
+    """One JSON object per line."""
+
+    def write_result(self, fname: str, algorithm: str,
+                     checksum: str) -> None:
+        record = {'file': fname, 'algorithm': algorithm,
+                  'checksum': checksum}
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class CsvExporter(Exporter):
+    """CSV with a header row: file,algorithm,checksum."""
+
+    def __init__(self, stream: IO[str], flush: bool = False) -> None:
+        super().__init__(stream, flush)
+        self._writer = csv.writer(stream, lineterminator='\n')
+        self._writer.writerow(('file', 'algorithm', 'checksum'))
+
+    def write_result(self, fname: str, algorithm: str,
+                     checksum: str) -> None:
+        self._writer.writerow((fname, algorithm, checksum))
+
+
+class GnuExporter(Exporter):
+    """GNU coreutils format: <checksum>  <file>."""
+
+    def write_result(self, fname: str, algorithm: str,
+                     checksum: str) -> None:
+        self.stream.write(manifest.format_line(checksum, fname))
+
+
+class BsdExporter(Exporter):
+    """BSD tag format: <ALGORITHM> (<file>) = <checksum>."""
+
+    def write_result(self, fname: str, algorithm: str,
+                     checksum: str) -> None:
+        name, escaped = manifest.escape_name(fname)
+        prefix = '\\' if escaped else ''
+        self.stream.write(f'{prefix}{algorithm} ({name}) = {checksum}\n')
+
+
+# {format name: (exporter class, default file suffix)}
+FORMATS: 'dict[str, tuple[Callable[..., Exporter], str]]' = {
+    'JSON Lines': (JsonLinesExporter, 'jsonl'),
+    'CSV': (CsvExporter, 'csv'),
+    'GNU': (GnuExporter, 'txt'),
+    'BSD': (BsdExporter, 'txt'),
+}
+
+
+def open_exporter(fname: str, fmt: str, flush: bool = False) -> Exporter:
+    """Open fname for writing and return an Exporter for format fmt."""
+    try:
+        exporter_class = FORMATS[fmt][0]
+    except KeyError as err:
+        raise ValueError(f'"{fmt}" is not a supported export format.') from err
+    # newline='' as recommended for the csv module.
+    stream = open(fname, 'w', encoding='utf8', newline='')
+    return exporter_class(stream, flush)
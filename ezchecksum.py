@@ -3,22 +3,70 @@
 
 """EZchecksum is a GUI application for calculating and testing checksums."""
 
+import importlib.util
 import os
 import sys
 
 from pathlib import PurePath, Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Optional
 
-from PyQt6.QtCore import QDir, Qt, QRegularExpression
+from PyQt6.QtCore import QDir, Qt, QRegularExpression, QUrl
 from PyQt6.QtWidgets import (QMainWindow, QApplication, QFileDialog)
-from PyQt6.QtGui import QIcon, QRegularExpressionValidator
+from PyQt6.QtGui import (QIcon, QRegularExpressionValidator, QAction,
+                         QDesktopServices)
 
 import gui
 import hash_profiles as Hp
 import prefs
-import dialogs
-import calc
+import throttle
 import validate
 
+
+def lazy_import(name: str) -> ModuleType:
+    """Return module that is not loaded until first attribute access.
+
+    Used for modules that are not needed to show the main window, to
+    reduce start up time.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# Not required until the user acts. Type checkers see the modules.
+if TYPE_CHECKING:
+    import calc
+    import calibrate
+    # ShaApp.calibrate() hides the module in method annotations.
+    from calibrate import Calibration
+    import dialogs
+    import export
+    import manifest
+    import profiler
+    import refindex
+else:
+    calc = lazy_import('calc')
+    calibrate = lazy_import('calibrate')
+    dialogs = lazy_import('dialogs')
+    export = lazy_import('export')
+    manifest = lazy_import('manifest')
+    profiler = lazy_import('profiler')
+    refindex = lazy_import('refindex')
+
+# Maximum number of reference index matches shown per result.
+MAX_MATCHES = 5
+# Block size until the machine is calibrated.
+DEFAULT_BLOCKSIZE = 65536
+
 VERSION = '0.3.0'
 
 
@@ -61,12 +109,30 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
         self.open_dir: str = QDir.homePath()
         self.save_dir: str = QDir.homePath()
         self.has_validator: bool = False
+        # Digest of validateLineEdit when has_validator.
+        self.expected_digest: bytes = b''
+        # Path of reference index of known checksums, if any.
+        self.index_path: str = ''
+        # Limits for background verification.
+        self.limits = throttle.Limits()
+        # Block size found by calibrate.py. 0 until read from the
+        # calibration file. See: engine_blocksize().
+        self.blocksize: int = 0
+        # Report file while profiling. See: toggle_profiling().
+        self.profile_path: str = ''
         self.alg_id: int = Hp.get_hash_index('SHA256')
 
         # Other attributes
         self.hash_thread: calc.ChecksumThread
+        self.calibrate_thread: Optional[calc.CalibrateThread] = None
         # dict {files-to process: expected-checksums, ...}
         self.jobs: dict[str, str] = {}
+        # Output file for the current run.
+        self.manifest: Optional[manifest.ManifestWriter] = None
+        # Streaming export of results, when enabled.
+        self.exporter: Optional[export.Exporter] = None
+        # Opened from self.index_path on first use.
+        self.reference_index: Optional[refindex.ReferenceIndex] = None
 
         # Widget properties
         self.resultTextBrowser.setStyleSheet("background-color: white;")
@@ -86,11 +152,77 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
         self.validateLineEdit.dragEnterEvent = line_validate_enter_event
         self.validateLineEdit.dropEvent = self.line_validate_drop_event
 
+        # Quick pre-check (sampled fingerprint) mode.
+        self.actionQuick_Check = QAction('Quick Pre-check', self)
+        self.actionQuick_Check.setCheckable(True)
+        self.actionQuick_Check.setStatusTip(
+                'Sampled fingerprint only. Not a checksum.')
+        self.menuFile.insertAction(self.actionQuit, self.actionQuick_Check)
+        self.actionArchive_Members = QAction('Hash Archive Members', self)
+        self.actionArchive_Members.setCheckable(True)
+        self.actionArchive_Members.setStatusTip(
+                'Hash each file in a tar or zip archive without extracting.')
+        self.menuFile.insertAction(self.actionQuit,
+                                   self.actionArchive_Members)
+        self.actionBypass_Cache = QAction('Bypass Page Cache', self)
+        self.actionBypass_Cache.setCheckable(True)
+        self.actionBypass_Cache.setStatusTip(
+                'Read with O_DIRECT so that files are not cached.')
+        self.menuFile.insertAction(self.actionQuit, self.actionBypass_Cache)
+        self.actionNetwork_Storage = QAction('Network Storage Profile', self)
+        self.actionNetwork_Storage.setCheckable(True)
+        self.actionNetwork_Storage.setStatusTip(
+                'Large parallel reads, retrying transient errors, for NFS '
+                'and SMB.')
+        self.menuFile.insertAction(self.actionQuit,
+                                   self.actionNetwork_Storage)
+        self.actionLimits = QAction('Background Limits...', self)
+        self.actionLimits.setStatusTip(
+                'Limit bandwidth, CPU and priority of checksum '
+                'calculation.')
+        self.menuFile.insertAction(self.actionQuit, self.actionLimits)
+        self.actionCalibrate = QAction('Calibrate', self)
+        self.actionCalibrate.setStatusTip(
+                'Benchmark this machine to tune block size and workers.')
+        self.menuFile.insertAction(self.actionQuit, self.actionCalibrate)
+        # Hidden action, not in a menu, for capturing bug reports.
+        self.actionProfile = QAction('Profile', self)
+        self.actionProfile.setShortcut('Ctrl+Alt+Shift+P')
+        self.addAction(self.actionProfile)
+        self.actionPaste_Checksums = QAction('Paste Checksums', self)
+        self.actionPaste_Checksums.setShortcut('Ctrl+Shift+V')
+        self.actionPaste_Checksums.setStatusTip(
+                'Find the expected checksum in pasted text.')
+        self.menuFile.insertAction(self.actionSave_Result,
+                                   self.actionPaste_Checksums)
+        self.actionExport_Results = QAction('Export Results To...', self)
+        self.actionExport_Results.setStatusTip(
+                'Write results to JSON Lines, CSV, GNU or BSD file.')
+        self.menuFile.insertAction(self.actionQuick_Check,
+                                   self.actionExport_Results)
+        self.actionReference_Index = QAction('Reference Index...', self)
+        self.actionReference_Index.setStatusTip(
+                'Identify results from an index of known checksums.')
+        self.menuFile.insertAction(self.actionQuick_Check,
+                                   self.actionReference_Index)
+        self.menuFile.insertSeparator(self.actionQuit)
+
         # Menu actions
         self.actionSelect_File.triggered.connect(self.file_browser)
         self.actionSave_Result.triggered.connect(self.save_result)
+        self.actionExport_Results.triggered.connect(self.start_export)
+        self.actionReference_Index.triggered.connect(
+                self.select_reference_index)
+        self.actionPaste_Checksums.triggered.connect(
+                self.paste_validation_text)
+        self.actionLimits.triggered.connect(self.set_limits)
+        self.actionCalibrate.triggered.connect(self.calibrate)
+        # Not connected directly, as triggered passes checked as path.
+        self.actionProfile.triggered.connect(
+                lambda _checked=False: self.toggle_profiling())
         self.actionQuit.triggered.connect(self.quit)
         self.actionAbout.triggered.connect(self.about)
+        self.actionUser_Manual.triggered.connect(self.manual)
         self.actionAbout_Qt.triggered.connect(QApplication.aboutQt)
 
         # Button actions
@@ -113,14 +245,83 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
 
     def run_checksum(self) -> None:
         """Checksum calculation."""
+        # A quick fingerprint cannot be compared with a published
+        # checksum, so escalate to a full hash when validating.
+        quick: bool = self.actionQuick_Check.isChecked()
+        if quick and self.has_validator:
+            quick = False
+            self.statusbar.showMessage(
+                'Validation requires a full checksum.', 2000)
+        # Compare raw digests, rather than hex strings.
+        self.expected_digest = (bytes.fromhex(self.validateLineEdit.text())
+                                if self.has_validator else b'')
+        self.open_manifest()
         # Create checksum processing QThread.
-        self.hash_thread = calc.ChecksumThread(self.alg_id,
-                                               self.fileSelectLineEdit)
+        cache_mode = ('direct' if self.actionBypass_Cache.isChecked()
+                      else 'normal')
+        storage = ('network' if self.actionNetwork_Storage.isChecked()
+                   else 'local')
+        self.hash_thread = calc.ChecksumThread(
+                self.alg_id, self.fileSelectLineEdit, quick,
+                self.actionArchive_Members.isChecked(), cache_mode,
+                storage, self.limits, self.engine_blocksize())
         self.hash_thread.checksum_sig.connect(self.handle_result)
+        self.hash_thread.error_sig.connect(self.handle_error)
+        self.hash_thread.fingerprint_sig.connect(self.handle_fingerprint)
+        self.hash_thread.finished.connect(self.finish_run)
         self.hash_thread.updateProgressBar.connect(self.progressBar.setValue)
+        self.hash_thread.updateBytesRead.connect(self.show_bytes_read)
         self.hash_thread.start()
         self.update_gui()
 
+    def open_manifest(self) -> None:
+        """Open the output file, if any, for the results of this run."""
+        self.manifest = None
+        output = self.outputLineEdit.text()
+        if not output:
+            return
+        if not PurePath(output).is_absolute():
+            self.resultTextBrowser.append(
+                        f'<font color="red">Could not write to {output}\n'
+                        'Output path is not fully qualified.</font>\n')
+            return
+        try:
+            self.manifest = manifest.ManifestWriter(output)
+        except OSError:
+            self.resultTextBrowser.append(
+                f'<font color="red">{output} '
+                'is not writeable.</font>')
+
+    def show_bytes_read(self, bytes_read: int) -> None:
+        """Show progress of a source with unknown length."""
+        if self.progressBar.maximum() != 0:
+            # Busy indicator.
+            self.progressBar.setRange(0, 0)
+        self.statusbar.showMessage(f'{bytes_read / 1048576:.1f} MiB read.')
+
+    def finish_run(self) -> None:
+        """Publish the output file when ChecksumThread finishes."""
+        if self.progressBar.maximum() == 0:
+            self.progressBar.setRange(0, 100)
+            self.progressBar.setValue(0 if self.hash_thread.stop_flag
+                                      else 100)
+        if self.manifest is not None:
+            output = self.manifest.path
+            try:
+                if self.manifest.count and not self.hash_thread.stop_flag:
+                    self.manifest.close()
+                    self.resultTextBrowser.append(
+                        f'<font color="black">Result written to '
+                        f'{output}</font>\n')
+                else:
+                    self.manifest.abort()
+            except OSError:
+                self.resultTextBrowser.append(
+                    f'<font color="red">{output} '
+                    'is not writeable.</font>')
+            self.manifest = None
+        self.update_gui()
+
     def update_gui(self) -> None:
         """Update buttons and menus when calculations
         starts or stops, and on Reset."""
@@ -149,15 +350,17 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
             self.hashChoiceButton.setEnabled(not self.has_validator)
         self.set_reset_state()
 
-    def handle_result(self, name: str, checksum: str) -> None:
+    def handle_result(self, name: str, digest: bytes) -> None:
         """Handle results and output."""
         alg_name: str = Hp.get_hash_name(self.alg_id)
+        # Hex is only required for display and export.
+        checksum: str = digest.hex()
         txt = (f'<font color="black">File name: {name}\n'
                f'{alg_name} checksum: {checksum}</font>\n')
         self.resultTextBrowser.append(txt)
 
         if self.has_validator:
-            if checksum == self.validateLineEdit.text().lower():
+            if digest == self.expected_digest:
                 self.resultTextBrowser.append(
                     '<font color="green"><b>Success. '
                     'Checksum matches the expected value.'
@@ -170,27 +373,41 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
             self.resultTextBrowser.append(
                 '<font color="orange"><b>Warning</b>. The \'Validation\' '
                 'text is not a recognised checksum.</font>')
-        if len(self.outputLineEdit.text()) > 0:
-            output = self.outputLineEdit.text()
-            fname = PurePath(name).name  # Name of the processed file
-            if PurePath(output).is_absolute():
-                try:
-                    with open(output, 'wt', encoding='utf8') as fp:
-                        fp.write(f'{checksum} {fname}')
-                        self.resultTextBrowser.append(
-                            f'<font color="black">Result written to '
-                            f'{output}</font>\n')
-                except FileNotFoundError:
-                    self.resultTextBrowser.append(
-                        f'<font color="red">{output} '
-                        'is not writeable.</font>')
-            else:
+        if self.index_path:
+            self.show_reference_matches(digest)
+        if self.exporter is not None:
+            try:
+                self.exporter.write(name, alg_name, checksum)
+            except OSError as err:
                 self.resultTextBrowser.append(
-                            f'<font color="red">Could not write to {output}\n'
-                            'Output path is not fully qualified.</font>\n')
+                    f'<font color="red">Export failed: {err.strerror}'
+                    '</font>')
+                self.stop_export()
+        if self.manifest is not None:
+            # Name of the processed file relative to the selected file.
+            fname = os.path.relpath(
+                name, os.path.dirname(self.fileSelectLineEdit.text()))
+            self.manifest.add_digest(fname, digest)
         # Update UI on completion.
         self.update_gui()
 
+    def handle_error(self, name: str, message: str) -> None:
+        """Show a file that could not be hashed."""
+        self.resultTextBrowser.append(
+            f'<font color="black">File name: {name}</font>\n'
+            f'<font color="red">Error: {message}</font>\n')
+        self.update_gui()
+
+    def handle_fingerprint(self, name: str, fingerprint: str) -> None:
+        """Show a quick fingerprint result."""
+        alg_name: str = Hp.get_hash_name(self.alg_id)
+        self.resultTextBrowser.append(
+            f'<font color="black">File name: {name}\n'
+            f'{alg_name} quick fingerprint: {fingerprint}</font>\n'
+            '<font color="orange"><b>Note</b>. A quick fingerprint '
+            'samples part of the file. It is not a checksum.</font>')
+        self.update_gui()
+
     def save_result(self) -> None:
         """Save results to file"""
         text = self.resultTextBrowser.toPlainText()
@@ -200,8 +417,136 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
             msg: str = 'No results to print.\nCalculate checksum first.'
             dialogs.critical(self, msg)
 
+    def show_reference_matches(self, digest: bytes) -> None:
+        """Report known files in the reference index with digest."""
+        try:
+            if self.reference_index is None:
+                self.reference_index = refindex.ReferenceIndex(
+                    self.index_path)
+            matches = self.reference_index.lookup(digest)
+        except refindex.ReferenceIndexError as err:
+            self.resultTextBrowser.append(f'<font color="red">{err}</font>')
+            return
+        if not matches:
+            self.resultTextBrowser.append(
+                '<font color="orange">Not found in reference index.</font>')
+            return
+        for label in matches[:MAX_MATCHES]:
+            self.resultTextBrowser.append(
+                f'<font color="green">Matches {label}</font>')
+        if len(matches) > MAX_MATCHES:
+            self.resultTextBrowser.append(
+                f'<font color="green">... and {len(matches) - MAX_MATCHES}'
+                ' more.</font>')
+
+    def select_reference_index(self) -> None:
+        """Select the reference index of known checksums."""
+        fname, _ = QFileDialog.getOpenFileName(
+            self, 'Reference Index', self.open_dir,
+            'Reference Index (*.idx);;All Files (*)')
+        if fname:
+            self.set_reference_index(fname)
+
+    def set_reference_index(self, fname: str) -> None:
+        """Use index fname. An empty string disables lookups."""
+        if self.reference_index is not None:
+            self.reference_index.close()
+            self.reference_index = None
+        self.index_path = fname
+        if fname:
+            self.statusbar.showMessage(f'Reference index: {fname}', 2000)
+
+    def set_limits(self) -> None:
+        """Edit limits for subsequent checksum calculations."""
+        limits = dialogs.limits(self, self.limits)
+        if limits is not None:
+            self.limits = limits
+
+    def engine_blocksize(self) -> int:
+        """Return the block size found by calibrate.py, or the default
+        if the machine has not been calibrated. The calibration file is
+        read on first use, rather than at start up."""
+        if not self.blocksize:
+            tuned = calibrate.load()
+            self.blocksize = tuned.blocksize if tuned else DEFAULT_BLOCKSIZE
+        return self.blocksize
+
+    def calibrate(self) -> None:
+        """Benchmark this machine, and the storage of the open
+        directory, in a worker thread. The tuned settings are saved for
+        the GUI and the command line tools."""
+        self.actionCalibrate.setEnabled(False)
+        self.statusbar.showMessage('Calibrating...')
+        self.calibrate_thread = calc.CalibrateThread(self.open_dir)
+        self.calibrate_thread.calibrated_sig.connect(self.finish_calibration)
+        self.calibrate_thread.error_sig.connect(self.calibration_failed)
+        self.calibrate_thread.finished.connect(
+                lambda: self.actionCalibrate.setEnabled(True))
+        self.calibrate_thread.start()
+
+    def finish_calibration(self, result: 'Calibration') -> None:
+        """Use the settings found by CalibrateThread."""
+        self.blocksize = result.blocksize
+        self.statusbar.showMessage(
+            f'Block size: {result.blocksize // 1024} KiB. '
+            f'Workers: {result.workers}. '
+            f'Fastest algorithm: {result.fast_algorithm}.', 5000)
+
+    def calibration_failed(self, details: str) -> None:
+        """Report an error from CalibrateThread."""
+        self.statusbar.clearMessage()
+        dialogs.dialog('Calibration failed.', title='Error',
+                       details=details)
+
+    def toggle_profiling(self, path: str = '') -> None:
+        """Start profiling, writing the report to path (default: in the
+        save directory) when called again or on quitting."""
+        if self.profile_path:
+            try:
+                if profiler.stop(self.profile_path) is not None:
+                    self.statusbar.showMessage(
+                        f'Profile written to {self.profile_path}', 5000)
+            except OSError as err:
+                self.statusbar.showMessage(
+                    f'Profile not written: {err.strerror}', 5000)
+            self.profile_path = ''
+            return
+        self.profile_path = path or os.path.join(self.save_dir,
+                                                 'ezchecksum-profile.txt')
+        profiler.start()
+        self.statusbar.showMessage('Profiling. Press Ctrl+Alt+Shift+P to '
+                                   'write the report.')
+
+    def start_export(self) -> None:
+        """Stream subsequent results to an export file."""
+        selected = dialogs.export_file(self, export.FORMATS)
+        if selected is None:
+            return
+        fname, fmt = selected
+        self.stop_export()
+        try:
+            self.exporter = export.open_exporter(fname, fmt, flush=True)
+        except OSError as err:
+            detail_msg = f'I/O error: {err.errno}\n{err.strerror}'
+            dialogs.dialog('File write error.', title='Error',
+                           details=detail_msg)
+            return
+        self.statusbar.showMessage(f'Exporting results to {fname}.')
+
+    def stop_export(self) -> None:
+        """Close the export file, if any."""
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
     def quit(self) -> None:
         """Shutdown application."""
+        if self.calibrate_thread is not None:
+            # Let a calibration in progress finish and save.
+            self.calibrate_thread.wait()
+        self.stop_export()
+        if self.profile_path:
+            self.toggle_profiling()
         prefs.write_settings(self)
         sys.exit()
 
@@ -209,6 +554,12 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
         """Show :py:mod:`'About' <dialogs.about>` dialog"""
         dialogs.about(self, VERSION)
 
+    def manual(self) -> None:
+        """Open the user manual in the default web browser."""
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'help', 'index.html')
+        QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
     def file_line_drop_event(self, event) -> None:
         """Handle fileSelectLineEdit drop events"""
         etype = event.mimeData()
@@ -235,10 +586,40 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
         if etype.hasText() and len(etype.text()) > 1:
             event.setDropAction(Qt.DropAction.CopyAction)
             event.accept()
-            self.validateLineEdit.setText(etype.text())
+            self.set_validation_text(etype.text())
         else:
             event.ignore()
 
+    def paste_validation_text(self) -> None:
+        """Extract checksum for validateLineEdit from clipboard text."""
+        clipboard = QApplication.clipboard()
+        if clipboard is not None:
+            self.set_validation_text(clipboard.text())
+
+    def set_validation_text(self, text: str) -> None:
+        """Set validateLineEdit from text that may contain any number
+        of checksums and file names."""
+        text = text.strip()
+        if validate.is_valid_hash(text):
+            self.validateLineEdit.setText(text)
+            return
+        candidates = validate.find_hashes(text)
+        fname = os.path.basename(self.fileSelectLineEdit.text())
+        best = validate.select_hash(candidates, fname, self.alg_id)
+        if best is None:
+            self.statusbar.showMessage('No checksum found.', 2000)
+            return
+        if len(candidates) > 1:
+            self.resultTextBrowser.append(
+                f'<font color="black">{len(candidates)} checksums found:'
+                '</font>')
+            for candidate in candidates:
+                self.resultTextBrowser.append(
+                    f'<font color="black">'
+                    f'{Hp.get_hash_name(candidate.index)} '
+                    f'{candidate.checksum} {candidate.fname}</font>')
+        self.validateLineEdit.setText(best.checksum)
+
     def file_select_changed(self) -> None:
         """QLineEdit handler for changed fileSelectLineEdit."""
         has_text: bool = len(self.fileSelectLineEdit.text()) > 0
@@ -248,12 +629,16 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
         if file_select != Path(self.fileSelectLineEdit.text()):
             self.fileSelectLineEdit.setText(str(file_select))
         # Set goButton state
-        is_valid_file = validate.file_exists(self.fileSelectLineEdit.text())
+        is_valid_file = (validate.file_exists(self.fileSelectLineEdit.text())
+                         or validate.is_stream(self.fileSelectLineEdit.text()))
         self.goButton.setEnabled(is_valid_file)
         # Set StatusTips
         if is_valid_file:
             # TODO: Process checksum text file.
-            if self.is_checksum_file(file_select):
+            # Reading would consume a pipe, or never end for a device.
+            if validate.is_stream(str(file_select)):
+                msg = 'Stream selected.'
+            elif self.is_checksum_file(file_select):
                 msg = 'Checksum file selected'
             else:
                 msg = 'File selected.'
@@ -310,10 +695,8 @@ class ShaApp(QMainWindow, gui.Ui_MainWindow):
         validate.set_validator(self, self.validateLineEdit.text())
         self.hashChoiceButton.setEnabled(not self.has_validator)
         if self.has_validator:
-            hash_from_line: 'tuple[int, str] | None' = (
-                validate.hash_from_line(self.validateLineEdit.text()))
-            if hash_from_line:  # MyPy doesn't know this must be True.
-                msg = f'Auto-selected {Hp.get_hash_name(hash_from_line[0])}'
+            msg = ('Auto-selected '
+                   f'{Hp.get_hash_name(self.hashChoiceButton.currentIndex())}')
         elif len(self.validateLineEdit.text()) == 0:
             msg = 'No validation text entered.'
         else:
@@ -422,6 +805,12 @@ def main() -> None:
     """Create window"""
     app = QApplication(sys.argv)
     window = ShaApp()
+    # --profile [REPORT] profiles the session until quit. Without
+    # REPORT, the report is written in the save directory.
+    args = app.arguments()
+    if '--profile' in args:
+        idx = args.index('--profile') + 1
+        window.toggle_profiling(args[idx] if idx < len(args) else '')
     window.show()
     sys.exit(app.exec())
 
@@ -48,6 +48,11 @@ HASH_TYPES: tuple[HashProfile, ...] = (MD5, SHA1, SHA224, SHA256,
                                        SHA384, SHA512, XXH32, XXH64,)
 
 
+# Algorithms that hold the GIL while hashing, so do not scale across
+# threads. hashlib releases the GIL for buffers over 2 KiB.
+_GIL_BOUND: tuple[str, ...] = ('XXH32', 'XXH64')
+
+
 _HASH_NAMES: tuple[str, ...] = tuple(alg.name for alg in HASH_TYPES)
 _HASH_LENGTHS: tuple[int, ...] = tuple(alg.length for alg in HASH_TYPES)
 
@@ -71,6 +76,12 @@ def get_hash_name(idx):
         sys.exit(msg)
 
 
+def holds_gil(idx: int) -> bool:
+    """Return True if hash at HASH_TYPES[index] holds the GIL while
+    hashing."""
+    return HASH_TYPES[idx].name in _GIL_BOUND
+
+
 def is_valid_hash_length(val: int) -> bool:
     """Return True if val is a valid checksum length."""
     return val in _HASH_LENGTHS
@@ -0,0 +1,186 @@
+"""Buffered writer for GNU compatible checksum manifests.
+
+Manifest lines are in the format used by GNU coreutils (md5sum,
+sha256sum, ...)::
+
+    <checksum>  <file name>
+
+File names that contain a backslash or a newline are escaped, and the
+line prefixed with a backslash, as GNU coreutils does.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+from results import Result, ResultStore
+
+
+# Buffer size for the manifest stream.
+BUFFER_SIZE = 1024 * 1024
+
+
+def escape_name(fname: str) -> 'tuple[str, bool]':
+    """Return (escaped file name, True if escaping was required)."""
+    if '\\' in fname or '\n' in fname or '\r' in fname:
+        escaped = (fname.replace('\\', '\\\\')
+                   .replace('\n', '\\n')
+                   .replace('\r', '\\r'))
+        return (escaped, True)
+    return (fname, False)
+
+
+def unescape_name(fname: str) -> str:
+    """Reverse escape_name()."""
+    chars = []
+    escapes = {'\\': '\\', 'n': '\n', 'r': '\r'}
+    idx = 0
+    while idx < len(fname):
+        char = fname[idx]
+        if char == '\\' and idx + 1 < len(fname):
+            idx += 1
+            char = escapes.get(fname[idx], '\\' + fname[idx])
+        chars.append(char)
+        idx += 1
+    return ''.join(chars)
+
+
+def make_temp(path: str) -> 'tuple[int, str]':
+    """Create temporary file in the directory of path.
+    Return (file descriptor, temporary path)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix='.ezchecksum-', suffix='.tmp', dir=directory)
+    # mkstemp() creates the file private. Use normal permissions.
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o666 & ~umask)
+    return (fd, tmp_path)
+
+
+@contextmanager
+def temp_file(path: str) -> Iterator['tuple[int, str]']:
+    """Create temporary file in the directory of path, as make_temp().
+    Yield (file descriptor, temporary path). The temporary file is
+    removed if the block raises."""
+    fd, tmp_path = make_temp(path)
+    try:
+        yield (fd, tmp_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def atomic_open(path: str) -> Iterator[IO[bytes]]:
+    """Open a binary file that replaces path atomically on success.
+    On error, path is left unchanged."""
+    with temp_file(path) as (fd, tmp_path):
+        with os.fdopen(fd, 'wb', buffering=BUFFER_SIZE) as file_:
+            yield file_
+            file_.flush()
+            os.fsync(file_.fileno())
+        os.replace(tmp_path, path)
+
+
+def format_line(checksum: str, fname: str) -> str:
+    """Return a GNU format manifest line, including the line ending."""
+    name, escaped = escape_name(fname)
+    prefix = '\\' if escaped else ''
+    return f'{prefix}{checksum}  {name}\n'
+
+
+class ManifestWriter:
+    """Write checksums to a manifest file.
+
+    Results are written to a temporary file in the same directory as
+    the manifest through a large buffer, and the completed manifest
+    replaces `path` atomically when the writer is closed. Readers never
+    see a partly written manifest.
+
+    Args:
+        path: Str. Path of the manifest file.
+        sort: Bool. Write entries sorted by file name. When False,
+        entries are written in the order that they are added.
+
+    Example::
+
+        with ManifestWriter('/tmp/files.sha256') as manifest:
+            manifest.add('file.txt', checksum)
+    """
+
+    def __init__(self, path: str, sort: bool = True) -> None:
+        self.path = path
+        self.sort = sort
+        self.count = 0
+        # Entries are held as raw digests until written.
+        self._entries = ResultStore()
+        fd, self._tmp_path = make_temp(path)
+        self._file: Optional[IO[str]] = os.fdopen(
+            fd, 'w', encoding='utf8', newline='\n', buffering=BUFFER_SIZE)
+
+    def __enter__(self) -> 'ManifestWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, fname: str, checksum: str) -> None:
+        """Add one hex checksum to the manifest."""
+        self.add_digest(fname, bytes.fromhex(checksum))
+
+    def add_digest(self, fname: str, digest: bytes) -> None:
+        """Add one raw digest to the manifest."""
+        if self._file is None:
+            raise ValueError('ManifestWriter is closed.')
+        if self.sort:
+            self._entries.append(Result(fname, digest))
+        else:
+            self._file.write(format_line(digest.hex(), fname))
+        self.count += 1
+
+    def close(self) -> None:
+        """Write remaining entries and publish the manifest."""
+        if self._file is None:
+            return
+        try:
+            if self.sort:
+                entries = self._entries
+                self._file.writelines(
+                    format_line(entries[idx].hexdigest, entries.name(idx))
+                    for idx in entries.sorted_indexes())
+                entries.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.path)
+        except OSError:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Discard the manifest without replacing `path`."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._entries.clear()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def write_manifest(path: str, results: 'dict[str, str]',
+                   sort: bool = True) -> None:
+    """Write {file name: checksum} results to manifest at path."""
+    with ManifestWriter(path, sort) as manifest:
+        for fname, checksum in results.items():
+            manifest.add(fname, checksum)
@@ -5,6 +5,7 @@ from pathlib import Path
 from PyQt6.QtCore import QSettings
 
 import hash_profiles as Hp
+import throttle
 
 
 def read_settings(self) -> None:
@@ -34,6 +35,24 @@ def read_settings(self) -> None:
     if Path(save_dir).exists() and Path(save_dir).is_dir():
         self.save_dir = save_dir
 
+    # Reference index of known checksums
+    index_path: str = self.settings.value('ReferenceIndex', '')
+    if index_path and Path(index_path).is_file():
+        self.index_path = index_path
+
+    # Limits for background verification
+    defaults = throttle.Limits()
+    try:
+        limits = throttle.Limits(
+            float(self.settings.value('BandwidthLimit', defaults.bandwidth)),
+            str(self.settings.value('IOClass', defaults.io_class)),
+            int(self.settings.value('Nice', defaults.nice)),
+            int(self.settings.value('CPUShare', defaults.cpu_share)))
+    except (TypeError, ValueError):
+        limits = defaults
+    if limits.io_class in throttle.IO_CLASSES:
+        self.limits = limits
+
 
 def write_settings(self) -> None:
     """Write last used settings as human readable strings"""
@@ -42,4 +61,9 @@ def write_settings(self) -> None:
     self.settings.setValue('Algorithm', Hp.get_hash_name(self.alg_id))
     self.settings.setValue('OpenDirectory', self.open_dir)
     self.settings.setValue('SaveDirectory', self.save_dir)
+    self.settings.setValue('ReferenceIndex', self.index_path)
+    self.settings.setValue('BandwidthLimit', str(self.limits.bandwidth))
+    self.settings.setValue('IOClass', self.limits.io_class)
+    self.settings.setValue('Nice', str(self.limits.nice))
+    self.settings.setValue('CPUShare', str(self.limits.cpu_share))
     self.settings.sync()
@@ -0,0 +1,126 @@
+"""Profile hashing runs, to find where the time goes in a slow run.
+
+While a session is active, the calling (GUI or main) thread is profiled
+with cProfile, as is each thread that the threading module starts,
+such as reader and pool worker threads. A QThread is not started by the
+threading module, so :py:class:`calc.ChecksumThread` profiles itself
+with :py:func:`profile_thread`. When no session is active, that is a
+single check per run, and no profiler is installed.
+
+:py:func:`stop` merges the profiles of all threads and writes a text
+report, and a ``.prof`` file for tools such as snakeviz, to attach to
+bug reports. Work in pool processes is not profiled.
+
+Start a session with ``--profile FILE`` (CLI or GUI), or in the GUI
+with the hidden shortcut Ctrl+Alt+Shift+P, which writes the report when
+pressed again.
+"""
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+REPORT_LINES = 60
+
+
+class Session:
+    """Profiles of the threads in one profiling session."""
+
+    def __init__(self) -> None:
+        self.profiles: 'list[cProfile.Profile]' = []
+        self._lock = threading.Lock()
+
+    def start_profile(self) -> Optional[cProfile.Profile]:
+        """Profile the calling thread. Return the profile, or None if
+        this Python profiles all threads with one profiler (3.12+)."""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # Another profiler is active.
+        with self._lock:
+            self.profiles.append(profile)
+        return profile
+
+
+_session: Optional[Session] = None
+
+
+def active() -> bool:
+    """Return True if a profiling session is active."""
+    return _session is not None
+
+
+def _bootstrap(frame, event, arg) -> None:
+    """Profile function for new threads: replace itself with a profile
+    of the thread."""
+    # pylint: disable=unused-argument
+    sys.setprofile(None)
+    session = _session
+    if session is not None:
+        session.start_profile()
+
+
+def start() -> None:
+    """Start a session, profiling the calling thread and new threads."""
+    global _session  # pylint: disable=global-statement
+    if _session is not None:
+        return
+    _session = Session()
+    threading.setprofile(_bootstrap)
+    _session.start_profile()
+
+
+@contextmanager
+def profile_thread() -> Iterator[None]:
+    """Profile the body of the with statement if a session is active.
+    For threads not started by the threading module."""
+    session = _session
+    if session is None:
+        yield
+        return
+    profile = session.start_profile()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+
+
+def stop(path: str) -> Optional[str]:
+    """End the session, and write the merged report to path, and the
+    raw statistics to path + '.prof'. Return the report, or None if no
+    session was active."""
+    global _session  # pylint: disable=global-statement
+    session = _session
+    if session is None:
+        return None
+    _session = None
+    threading.setprofile(None)
+    stats: Optional[pstats.Stats] = None
+    for profile in session.profiles:
+        profile.disable()  # Takes effect in the calling thread only.
+        try:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        except TypeError:
+            pass  # Thread ended before any calls were recorded.
+    if stats is None:
+        return None
+    stats.dump_stats(path + '.prof')
+    stream = io.StringIO()
+    stats.stream = stream  # type: ignore[attr-defined]
+    stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+    stats.sort_stats('tottime').print_stats(REPORT_LINES)
+    report = stream.getvalue()
+    with open(path, 'w', encoding='utf8') as file_:
+        file_.write(f'{len(session.profiles)} threads profiled.\n')
+        file_.write(report)
+    return report
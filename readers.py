@@ -0,0 +1,401 @@
+"""Block readers used by the hashing engine.
+
+The cache mode controls how file data interacts with the OS page cache:
+
+    - ``normal``: Ordinary buffered reads.
+    - ``dontneed``: Drop each block from the page cache once it has
+      been hashed (``POSIX_FADV_DONTNEED``).
+    - ``direct``: Bypass the page cache with ``O_DIRECT`` and page
+      aligned buffers. Falls back to ``dontneed`` where ``O_DIRECT`` is
+      not supported, such as on tmpfs.
+
+Bulk verification with ``dontneed`` or ``direct`` leaves the page cache,
+and so the working set of other processes, undisturbed.
+
+With ``prefetch`` enabled, a reader thread fills a small ring of
+preallocated buffers while the caller hashes the previous block. As
+hashlib releases the GIL while hashing large buffers, reading and
+hashing overlap, so the time taken approaches the larger of the I/O
+time and the CPU time rather than their sum.
+
+:py:func:`iter_network` is a profile for NFS and SMB mounts, where each
+read is a round trip to the server. It reads large aligned blocks with
+several reads in flight at once, and retries reads that fail with a
+transient error, with exponential backoff.
+
+Sparse files, such as VM images, are read with ``SEEK_DATA`` and
+``SEEK_HOLE``. Only the data regions are read from disk, and blocks of
+zeros are generated for the holes, so the digest is unchanged.
+"""
+
+import errno
+import mmap
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Optional, Union
+
+
+CACHE_MODES: tuple[str, ...] = ('normal', 'dontneed', 'direct')
+
+# O_DIRECT requires offsets and buffer sizes to be multiples of the
+# device block size. Page size is a safe choice.
+ALIGNMENT = mmap.PAGESIZE
+
+# Default number of buffers in the prefetch ring.
+PREFETCH_DEPTH = 3
+# Largest block size for reading local files. Larger blocks gain
+# nothing, and PREFETCH_DEPTH of them are held in memory.
+MAX_BLOCKSIZE = 32 * 1024 * 1024
+
+# Network storage profile.
+STORAGE_PROFILES: tuple[str, ...] = ('local', 'network')
+NETWORK_BLOCKSIZE = 8 * 1024 * 1024
+NETWORK_IN_FLIGHT = 4
+# Attempts after the first, and the delay before the first retry in
+# seconds. The delay doubles with each retry.
+RETRIES = 4
+RETRY_DELAY = 0.5
+TRANSIENT_ERRNOS = frozenset(
+    getattr(errno, name) for name in (
+        'EIO', 'EAGAIN', 'EBUSY', 'ETIMEDOUT', 'ECONNRESET',
+        'ECONNABORTED', 'EHOSTDOWN', 'EHOSTUNREACH', 'ENETDOWN',
+        'ENETRESET', 'ENETUNREACH', 'ENOLINK', 'ECOMM')
+    if hasattr(errno, name))
+
+Block = Union[bytes, memoryview]
+
+
+def aligned_size(size: int, alignment: int = ALIGNMENT) -> int:
+    """Return size rounded up to a multiple of alignment."""
+    return max(alignment, -(-size // alignment) * alignment)
+
+
+def _fadvise(fd: int, offset: int, length: int, advice_name: str) -> None:
+    """posix_fadvise() where available. Advice is only a hint, so
+    failures are ignored."""
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def drop_cache(fd: int) -> None:
+    """Ask the OS to drop clean cached pages of open file fd."""
+    _fadvise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+
+
+def iter_blocks(fname: str, blocksize: int = 65536,
+                cache_mode: str = 'normal',
+                prefetch: int = 0) -> Iterator[Block]:
+    """Yield successive blocks of file fname.
+
+    Args:
+        prefetch: Int. Number of buffers read ahead by a separate
+        reader thread. 0 reads in the calling thread.
+
+    With cache_mode 'direct', or when prefetching, the blocks are views
+    of a reused buffer, and are only valid until the next block is
+    requested.
+    """
+    if cache_mode not in CACHE_MODES:
+        raise ValueError(f'"{cache_mode}" is not a valid cache mode.')
+    if cache_mode != 'direct' and is_sparse(fname):
+        # Holes cost no I/O, so there is little to gain by prefetching.
+        yield from _iter_sparse(fname, blocksize, cache_mode == 'dontneed')
+        return
+    if prefetch > 0:
+        yield from _iter_prefetch(fname, blocksize, cache_mode, prefetch)
+        return
+    if cache_mode == 'direct' and hasattr(os, 'O_DIRECT'):
+        try:
+            fd = os.open(fname, os.O_RDONLY | os.O_DIRECT)
+        except OSError as err:
+            if err.errno != errno.EINVAL:
+                raise
+        else:
+            direct = _iter_direct(fd, aligned_size(blocksize))
+            first = next(direct, None)
+            if first is not None:
+                yield first
+                yield from direct
+                return
+            # O_DIRECT rejected, or empty file.
+        cache_mode = 'dontneed'
+    yield from _iter_buffered(fname, blocksize, cache_mode == 'dontneed')
+
+
+def is_sparse(fname: str) -> bool:
+    """Return True if regular file fname has fewer blocks allocated
+    than its size requires."""
+    if not hasattr(os, 'SEEK_HOLE'):
+        return False
+    stat = os.stat(fname)
+    blocks = getattr(stat, 'st_blocks', None)
+    return blocks is not None and blocks * 512 < stat.st_size
+
+
+def _iter_sparse(fname: str, blocksize: int,
+                 dontneed: bool) -> Iterator[Block]:
+    """Yield blocks of a sparse file. Data regions are read, and holes
+    are yielded as views of a block of zeros without reading."""
+    zeros = memoryview(bytes(blocksize))
+    with open(fname, 'rb', buffering=0) as file_:
+        fd = file_.fileno()
+        size = os.fstat(fd).st_size
+        offset = 0
+        while offset < size:
+            try:
+                data = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as err:
+                if err.errno == errno.ENXIO:
+                    data = size  # No more data. The rest is a hole.
+                elif err.errno == errno.EINVAL and offset == 0:
+                    # Filesystem does not support SEEK_DATA.
+                    yield from _iter_buffered(fname, blocksize, dontneed)
+                    return
+                else:
+                    raise
+            while offset < min(data, size):
+                length = min(blocksize, data - offset, size - offset)
+                yield zeros[:length]
+                offset += length
+            if offset >= size:
+                break
+            hole = min(os.lseek(fd, offset, os.SEEK_HOLE), size)
+            while offset < hole:
+                buf = os.pread(fd, min(blocksize, hole - offset), offset)
+                if not buf:
+                    return  # Truncated while reading.
+                yield buf
+                if dontneed:
+                    _fadvise(fd, offset, len(buf), 'POSIX_FADV_DONTNEED')
+                offset += len(buf)
+
+
+def _iter_buffered(fname: str, blocksize: int,
+                   dontneed: bool) -> Iterator[bytes]:
+    """Yield blocks using ordinary reads."""
+    with open(fname, 'rb', buffering=0) as file_:
+        fd = file_.fileno()
+        if dontneed:
+            _fadvise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+        offset = 0
+        while buf := file_.read(blocksize):
+            yield buf
+            if dontneed:
+                _fadvise(fd, offset, len(buf), 'POSIX_FADV_DONTNEED')
+            offset += len(buf)
+        if dontneed:
+            # Also drop pages brought in by read-ahead.
+            _fadvise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+
+
+def _iter_direct(fd: int, blocksize: int) -> Iterator[memoryview]:
+    """Yield blocks read with O_DIRECT into a page aligned buffer.
+
+    Yields nothing if the filesystem rejects O_DIRECT reads, so that
+    the caller can fall back to buffered reads.
+    """
+    # Anonymous mmap memory is page aligned.
+    buf = mmap.mmap(-1, blocksize)
+    view = memoryview(buf)
+    first = True
+    try:
+        while True:
+            try:
+                length = os.readv(fd, [buf])
+            except OSError as err:
+                if first and err.errno == errno.EINVAL:
+                    return
+                raise
+            first = False
+            if length == 0:
+                return
+            yield view[:length]
+            if length < blocksize:
+                # Short read at end of file. A further read would be
+                # at an unaligned offset.
+                return
+    finally:
+        os.close(fd)
+        view.release()
+        try:
+            buf.close()
+        except BufferError:
+            pass  # Consumer still holds a view. Freed when released.
+
+
+def _iter_prefetch(fname: str, blocksize: int, cache_mode: str,
+                   depth: int) -> Iterator[memoryview]:
+    """Yield blocks filled by a reader thread from a ring of buffers.
+
+    A buffer is returned to the reader when the next block is
+    requested, so at most `depth` blocks are held in memory.
+    """
+    if cache_mode == 'direct':
+        blocksize = aligned_size(blocksize)
+    # Anonymous mmap memory is page aligned, as O_DIRECT requires.
+    ring = [mmap.mmap(-1, blocksize) for _ in range(depth)]
+    free: 'queue.Queue[Optional[int]]' = queue.Queue()
+    filled: queue.Queue = queue.Queue()
+    stopped = threading.Event()
+    for idx in range(depth):
+        free.put(idx)
+
+    def reader() -> None:
+        try:
+            _fill_ring(fname, ring, free, filled, cache_mode, stopped)
+        except BaseException as err:  # pylint: disable=broad-except
+            # Re-raised in the consumer thread.
+            filled.put(err)
+        filled.put(None)
+
+    thread = threading.Thread(target=reader, name='ezchecksum-reader',
+                              daemon=True)
+    thread.start()
+    try:
+        while (item := filled.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            idx, length = item
+            yield memoryview(ring[idx])[:length]
+            free.put(idx)
+    finally:
+        stopped.set()
+        free.put(None)  # Wake the reader if it is waiting for a buffer.
+        thread.join()
+        for buf in ring:
+            try:
+                buf.close()
+            except BufferError:
+                pass  # Consumer still holds a view. Freed when released.
+
+
+def _fill_ring(fname: str, ring: 'list[mmap.mmap]',
+               free: 'queue.Queue[Optional[int]]', filled: queue.Queue,
+               cache_mode: str, stopped: threading.Event) -> None:
+    """Reader thread for _iter_prefetch(). Read blocks of fname into
+    free buffers and pass (index, length) to the consumer."""
+    direct = cache_mode == 'direct' and hasattr(os, 'O_DIRECT')
+    dontneed = cache_mode != 'normal'
+    fd = -1
+    if direct:
+        try:
+            fd = os.open(fname, os.O_RDONLY | os.O_DIRECT)
+        except OSError as err:
+            if err.errno != errno.EINVAL:
+                raise
+            direct = False
+    if fd == -1:
+        fd = os.open(fname, os.O_RDONLY)
+    try:
+        if dontneed and not direct:
+            _fadvise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+        offset = 0
+        while not stopped.is_set():
+            idx = free.get()
+            if idx is None:
+                return
+            try:
+                length = os.readv(fd, [ring[idx]])
+            except OSError as err:
+                if not (direct and offset == 0 and
+                        err.errno == errno.EINVAL):
+                    raise
+                # Filesystem rejects O_DIRECT reads.
+                os.close(fd)
+                fd = os.open(fname, os.O_RDONLY)
+                direct = False
+                length = os.readv(fd, [ring[idx]])
+            if length == 0:
+                return
+            filled.put((idx, length))
+            if dontneed and not direct:
+                _fadvise(fd, offset, length, 'POSIX_FADV_DONTNEED')
+            offset += length
+            if direct and length < len(ring[idx]):
+                return  # Short read at end of file.
+    finally:
+        if dontneed and not direct:
+            _fadvise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+        os.close(fd)
+
+
+def read_at(fd: int, buf: mmap.mmap, offset: int, retries: int = RETRIES,
+            delay: float = RETRY_DELAY) -> int:
+    """Fill buf from offset of fd. Return the number of bytes read,
+    which is less than len(buf) only at end of file.
+
+    Reads that fail with one of TRANSIENT_ERRNOS are retried, waiting
+    delay seconds before the first retry and doubling it each time.
+    """
+    view = memoryview(buf)
+    length = 0
+    try:
+        while length < len(buf):
+            try:
+                count = os.preadv(fd, [view[length:]], offset + length)
+            except OSError as err:
+                if retries <= 0 or err.errno not in TRANSIENT_ERRNOS:
+                    raise
+                time.sleep(delay)
+                retries -= 1
+                delay *= 2
+                continue
+            if count == 0:
+                break
+            length += count
+    finally:
+        view.release()
+    return length
+
+
+def iter_network(fname: str, blocksize: int = NETWORK_BLOCKSIZE,
+                 in_flight: int = NETWORK_IN_FLIGHT,
+                 retries: int = RETRIES) -> Iterator[memoryview]:
+    """Yield successive blocks of file fname, with in_flight reads of
+    blocksize issued at once by a pool of threads. See: read_at().
+
+    The blocks are views of reused buffers, and are only valid until
+    the next block is requested.
+    """
+    blocksize = aligned_size(blocksize)
+    ring = [mmap.mmap(-1, blocksize) for _ in range(max(1, in_flight))]
+    fd = os.open(fname, os.O_RDONLY)
+    pending: 'deque[tuple[mmap.mmap, Future]]' = deque()
+    offset = 0
+    try:
+        with ThreadPoolExecutor(len(ring),
+                                thread_name_prefix='ezchecksum-net') as pool:
+            try:
+                for buf in ring:
+                    pending.append((buf, pool.submit(
+                        read_at, fd, buf, offset, retries)))
+                    offset += blocksize
+                while pending:
+                    buf, future = pending.popleft()
+                    length = future.result()
+                    if length:
+                        yield memoryview(buf)[:length]
+                    if length < blocksize:
+                        return  # End of file.
+                    pending.append((buf, pool.submit(
+                        read_at, fd, buf, offset, retries)))
+                    offset += blocksize
+            finally:
+                for _, future in pending:
+                    future.cancel()
+    finally:
+        os.close(fd)
+        for buf in ring:
+            try:
+                buf.close()
+            except BufferError:
+                pass  # Consumer still holds a view. Freed when released.
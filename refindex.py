@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+"""Reference index of known checksums.
+
+Answers "which known file is this?" for a freshly calculated checksum,
+across any number of manifests.
+
+The index is a single file, used through mmap, so that it is loaded
+lazily on first lookup and holds millions of entries with little
+resident memory. Binary digests are stored sorted, with a table of
+offsets keyed by the first two bytes of the digest. A lookup therefore
+reads one table entry and then searches a bucket that averages fewer
+than a hundred entries, even with millions of checksums.
+
+File layout (little endian)::
+
+    header    magic, digest size, entry count, offsets of sections
+    buckets   65537 x uint64: first entry of each 2 byte prefix
+    digests   count x digest size bytes, sorted
+    labels    count + 1 x uint64 offsets, then UTF-8 label text
+
+Build an index from GNU format manifests::
+
+    python refindex.py build builds.idx build-41=b41.sha256 b42.sha256
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterable, Optional
+
+import manifest
+import validate
+
+
+MAGIC = b'EZREFIX1'
+# magic, digest size, reserved, count, digests offset, labels offset
+_HEADER = struct.Struct('<8sIIQQQ')
+_PREFIX_BYTES = 2
+_BUCKETS = (1 << (8 * _PREFIX_BYTES)) + 1
+
+
+class ReferenceIndexError(Exception):
+    """Raised for a missing or invalid reference index."""
+
+
+def parse_manifest_line(line: str) -> 'tuple[str, str] | None':
+    """Return (checksum, file name) from a GNU format line, or None."""
+    line = line.rstrip('\n')
+    escaped = line.startswith('\\')
+    if escaped:
+        line = line[1:]
+    checksum, _, fname = line.partition(' ')
+    if not fname or not validate.is_valid_hash(checksum):
+        return None
+    if fname[0] in ' *':
+        fname = fname[1:]
+    if escaped:
+        fname = manifest.unescape_name(fname)
+    return (checksum.lower(), fname)
+
+
+def read_manifest(path: str, label: str
+                  ) -> Iterable['tuple[bytes, str]']:
+    """Yield (binary digest, '<label>: <file name>') from manifest."""
+    with open(path, 'rt', encoding='utf8') as fp:
+        for line in fp:
+            entry = parse_manifest_line(line)
+            if entry is not None:
+                yield (bytes.fromhex(entry[0]), f'{label}: {entry[1]}')
+
+
+def build_index(path: str, entries: Iterable['tuple[bytes, str]']) -> int:
+    """Write index of (binary digest, label) entries to path.
+
+    All digests must be the same size. Return number of entries.
+    """
+    records = sorted(entries)
+    if not records:
+        raise ReferenceIndexError('No checksums to index.')
+    digest_size = len(records[0][0])
+    if any(len(digest) != digest_size for digest, _ in records):
+        raise ReferenceIndexError('All checksums in an index must be the '
+                                  'same length. Build one index per '
+                                  'algorithm.')
+    buckets = array('Q', bytes(8 * _BUCKETS))
+    for digest, _ in records:
+        buckets[int.from_bytes(digest[:_PREFIX_BYTES], 'big') + 1] += 1
+    for idx in range(1, _BUCKETS):
+        buckets[idx] += buckets[idx - 1]
+    digests_offset = _HEADER.size + 8 * _BUCKETS
+    labels_offset = digests_offset + digest_size * len(records)
+    label_offsets = array('Q', [0])
+    with manifest.atomic_open(path) as out:
+        out.write(_HEADER.pack(MAGIC, digest_size, 0, len(records),
+                               digests_offset, labels_offset))
+        out.write(buckets.tobytes())
+        for digest, _ in records:
+            out.write(digest)
+        encoded = [label.encode('utf8') for _, label in records]
+        for label in encoded:
+            label_offsets.append(label_offsets[-1] + len(label))
+        out.write(label_offsets.tobytes())
+        for label in encoded:
+            out.write(label)
+    return len(records)
+
+
+class ReferenceIndex:
+    """Read only view of an index file. The file is opened and mapped
+    on first lookup.
+
+    Args:
+        path: Str. Path of the index file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self.digest_size = 0
+        self.count = 0
+        self._buckets: Optional[memoryview] = None
+        self._digests = 0
+        self._label_offsets: Optional[memoryview] = None
+        self._labels = 0
+
+    def _load(self) -> mmap.mmap:
+        """Map the index file and check the header."""
+        if self._map is not None:
+            return self._map
+        try:
+            with open(self.path, 'rb') as file_:
+                mapped = mmap.mmap(file_.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as err:
+            raise ReferenceIndexError(
+                f'Cannot open index {self.path}: {err}') from err
+        try:
+            self._check(mapped)
+        except BaseException:
+            self._unmap(mapped)
+            raise
+        self._map = mapped
+        return mapped
+
+    def _check(self, mapped: mmap.mmap) -> None:
+        """Read the header of mapped, and check that the sections it
+        describes fit in the file. Raise ReferenceIndexError if not."""
+        if len(mapped) < _HEADER.size:
+            raise ReferenceIndexError(
+                f'{self.path} is not a reference index.')
+        (magic, self.digest_size, _, self.count, self._digests,
+         labels) = _HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ReferenceIndexError(
+                f'{self.path} is not a reference index.')
+        self._labels = labels + 8 * (self.count + 1)
+        if (self.digest_size == 0
+                or self._digests != _HEADER.size + 8 * _BUCKETS
+                or labels != self._digests + self.digest_size * self.count
+                or self._labels > len(mapped)):
+            raise ReferenceIndexError(f'{self.path} is corrupt.')
+        self._view = memoryview(mapped)
+        self._buckets = self._view[_HEADER.size:self._digests].cast('Q')
+        self._label_offsets = self._view[labels:self._labels].cast('Q')
+        if (self._buckets[-1] != self.count
+                or self._labels + self._label_offsets[-1] > len(mapped)):
+            raise ReferenceIndexError(f'{self.path} is corrupt.')
+
+    def _unmap(self, mapped: mmap.mmap) -> None:
+        """Release views of mapped, and close it."""
+        for view in (self._buckets, self._label_offsets, self._view):
+            if view is not None:
+                view.release()
+        self._buckets = self._label_offsets = self._view = None
+        mapped.close()
+
+    def _digest(self, idx: int) -> bytes:
+        start = self._digests + idx * self.digest_size
+        return self._load()[start:start + self.digest_size]
+
+    def label(self, idx: int) -> str:
+        """Return label of entry idx."""
+        mapped = self._load()
+        assert self._label_offsets is not None
+        start = self._labels + self._label_offsets[idx]
+        end = self._labels + self._label_offsets[idx + 1]
+        try:
+            return mapped[start:end].decode('utf8')
+        except UnicodeDecodeError as err:
+            raise ReferenceIndexError(f'{self.path} is corrupt.') from err
+
+    def lookup(self, digest: bytes) -> 'list[str]':
+        """Return labels of all entries with this binary digest."""
+        self._load()
+        assert self._buckets is not None
+        if len(digest) != self.digest_size:
+            return []
+        bucket = int.from_bytes(digest[:_PREFIX_BYTES], 'big')
+        low, high = self._buckets[bucket], self._buckets[bucket + 1]
+        # Binary search within the bucket for the first match.
+        while low < high:
+            mid = (low + high) // 2
+            if self._digest(mid) < digest:
+                low = mid + 1
+            else:
+                high = mid
+        labels = []
+        while low < self.count and self._digest(low) == digest:
+            labels.append(self.label(low))
+            low += 1
+        return labels
+
+    def lookup_hex(self, checksum: str) -> 'list[str]':
+        """Return labels of all entries with this hex checksum."""
+        try:
+            return self.lookup(bytes.fromhex(checksum))
+        except ValueError:
+            return []
+
+    def close(self) -> None:
+        """Unmap the index. It is mapped again if used."""
+        if self._map is not None:
+            self._unmap(self._map)
+            self._map = None
+
+
+def main(argv: 'list[str] | None' = None) -> int:
+    """Command line for building and querying indexes."""
+    parser = argparse.ArgumentParser(
+        prog='refindex', description='Build or query a reference index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser(
+        'build', help='Build index from GNU format manifests.')
+    build.add_argument('index')
+    build.add_argument('manifests', nargs='+', metavar='[LABEL=]MANIFEST',
+                       help='Manifest, optionally labelled. The default '
+                       'label is the manifest file name. A manifest path '
+                       'that contains "=" must be labelled.')
+    query = commands.add_parser('query', help='Look up checksums.')
+    query.add_argument('index')
+    query.add_argument('checksums', nargs='+')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'build':
+            def entries() -> Iterable['tuple[bytes, str]']:
+                for item in args.manifests:
+                    label, _, path = item.partition('=')
+                    if not path:
+                        label, path = '', item
+                    yield from read_manifest(
+                        path, label or os.path.basename(path))
+            count = build_index(args.index, entries())
+            print(f'{count} checksums indexed.')
+            return 0
+        index = ReferenceIndex(args.index)
+        status = 1
+        for checksum in args.checksums:
+            for label in index.lookup_hex(checksum.lower()):
+                print(f'{checksum}  {label}')
+                status = 0
+        return status
+    except (ReferenceIndexError, OSError) as err:
+        sys.stderr.write(f'{err}\n')
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Results of hashing, with digests held as raw bytes.
+
+Digests are carried through the engine as bytes, and only converted to
+hex for display and export. Comparing results is then a byte comparison,
+with no lower-casing or hex conversion.
+
+:py:class:`ResultStore` holds large numbers of results compactly: file
+names are packed into one UTF-8 buffer and digests into another, so a
+result costs its name, its digest and eight bytes, rather than a tuple
+and two str objects.
+"""
+
+from array import array
+from typing import Iterator, NamedTuple, Optional
+
+
+class Result(NamedTuple):
+    """Result of hashing one file.
+
+    Exactly one of digest and error is set.
+    """
+    fname: str
+    digest: Optional[bytes] = None
+    error: str = ''
+
+    @property
+    def hexdigest(self) -> str:
+        """Hex digest, or '' for an error result."""
+        return self.digest.hex() if self.digest is not None else ''
+
+
+class ResultStore:
+    """Compact, append only, store of results.
+
+    Args:
+        digest_size: Int. Size of digests in bytes. If 0, it is set by
+        the first digest added. All digests must be the same size.
+    """
+
+    def __init__(self, digest_size: int = 0) -> None:
+        self.digest_size = digest_size
+        self._digests = bytearray()
+        self._names = bytearray()
+        self._name_ends = array('Q')
+        # {result index: error message}
+        self._errors: 'dict[int, str]' = {}
+
+    def __len__(self) -> int:
+        return len(self._name_ends)
+
+    def __iter__(self) -> Iterator[Result]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, idx: int) -> Result:
+        if idx in self._errors:
+            return Result(self.name(idx), None, self._errors[idx])
+        return Result(self.name(idx), self.digest(idx))
+
+    def append(self, result: Result) -> None:
+        """Add a result."""
+        if result.digest is None:
+            self._errors[len(self)] = result.error
+            digest = bytes(self.digest_size)
+        else:
+            digest = result.digest
+            if not self.digest_size:
+                self.digest_size = len(digest)
+                # Errors added before the first digest.
+                self._digests.extend(bytes(self.digest_size * len(self)))
+            elif len(digest) != self.digest_size:
+                raise ValueError(f'Digest size {len(digest)} does not match '
+                                 f'store digest size {self.digest_size}.')
+        self._digests.extend(digest)
+        self._names.extend(result.fname.encode('utf8', 'surrogateescape'))
+        self._name_ends.append(len(self._names))
+
+    def name(self, idx: int) -> str:
+        """Return file name of result idx."""
+        start = self._name_ends[idx - 1] if idx > 0 else 0
+        return self._names[start:self._name_ends[idx]].decode(
+            'utf8', 'surrogateescape')
+
+    def digest(self, idx: int) -> Optional[bytes]:
+        """Return digest of result idx, or None for an error."""
+        if idx in self._errors:
+            return None
+        start = idx * self.digest_size
+        return bytes(self._digests[start:start + self.digest_size])
+
+    def matches(self, idx: int, expected: bytes) -> bool:
+        """Return True if result idx has digest expected."""
+        if idx in self._errors or len(expected) != self.digest_size:
+            return False
+        start = idx * self.digest_size
+        return memoryview(self._digests)[
+            start:start + self.digest_size] == expected
+
+    def sorted_indexes(self) -> 'list[int]':
+        """Return result indexes in file name order."""
+        return sorted(range(len(self)), key=self.name)
+
+    def clear(self) -> None:
+        """Remove all results."""
+        self._digests.clear()
+        self._names.clear()
+        self._name_ends = array('Q')
+        self._errors.clear()
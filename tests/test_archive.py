@@ -0,0 +1,68 @@
+"""Tests for archive."""
+
+import hashlib
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import hash_profiles as Hp
+import archive
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+MEMBERS = {'a.txt': b'alpha', 'dir/b.bin': bytes(range(256)) * 5000}
+
+
+def expected():
+    return {name: hashlib.sha256(data).digest()
+            for name, data in MEMBERS.items()}
+
+
+@pytest.mark.parametrize('suffix, mode', [('.tar', 'w'),
+                                          ('.tar.gz', 'w:gz'),
+                                          ('.tar.bz2', 'w:bz2'),
+                                          ('.tar.xz', 'w:xz')])
+def test_tar_members(tmp_path, suffix, mode):
+    path = tmp_path / f'bundle{suffix}'
+    with tarfile.open(path, mode) as tar:
+        directory = tarfile.TarInfo('dir')
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    progress = []
+    assert archive.is_archive(str(path))
+    assert dict(archive.iter_archive(str(path), SHA256,
+                                     progress.append)) == expected()
+    assert progress and progress[-1] <= path.stat().st_size
+
+
+def test_zip_members(tmp_path):
+    path = tmp_path / 'bundle.zip'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_:
+        zip_.writestr('dir/', b'')
+        for name, data in MEMBERS.items():
+            zip_.writestr(name, data)
+    assert dict(archive.iter_archive(str(path), SHA256)) == expected()
+
+
+def test_stop(tmp_path):
+    path = tmp_path / 'bundle.zip'
+    with zipfile.ZipFile(path, 'w') as zip_:
+        for name, data in MEMBERS.items():
+            zip_.writestr(name, data)
+    assert not list(archive.iter_archive(str(path), SHA256,
+                                         stop=lambda: True))
+
+
+def test_errors(tmp_path):
+    bad = tmp_path / 'bad.zip'
+    bad.write_bytes(b'not a zip')
+    with pytest.raises(archive.ArchiveError):
+        list(archive.iter_archive(str(bad), SHA256))
+    with pytest.raises(archive.ArchiveError):
+        archive.iter_archive(str(tmp_path / 'file.txt'), SHA256)
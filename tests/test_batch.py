@@ -0,0 +1,179 @@
+"""Tests for batch."""
+
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import hash_profiles as Hp
+import batch
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+
+
+@pytest.fixture(name='tree')
+def fixture_tree(tmp_path):
+    """Files of assorted sizes. Return {path: sha256 digest}."""
+    files = {}
+    for idx, size in enumerate((0, 1, 1000, batch.SMALL_FILE_LIMIT,
+                                batch.SMALL_FILE_LIMIT * 2 + 3)):
+        path = tmp_path / 'tree' / f'sub{idx % 2}' / f'file{idx}'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = os.urandom(size)
+        path.write_bytes(data)
+        files[str(path)] = hashlib.sha256(data).digest()
+    return files
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_hash_files(tree, backend):
+    results = list(batch.hash_files(tree, SHA256, 2, batch_size=2,
+                                    backend=backend))
+    assert {result.fname: result.digest for result in results} == tree
+    assert not any(result.error for result in results)
+
+
+def test_hash_files_reports_errors(tmp_path):
+    missing = str(tmp_path / 'missing')
+    [result] = batch.hash_files([missing], SHA256, backend='thread')
+    assert result.fname == missing
+    assert result.digest is None
+    assert 'No such file' in result.error
+
+
+def test_hash_path_reads_pipe_written_in_pieces(tmp_path):
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+
+    def writer():
+        with open(fifo, 'wb', buffering=0) as file_:
+            file_.write(b'part1\n')
+            time.sleep(0.2)
+            file_.write(b'part2\n')
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    digest = batch.hash_path(str(fifo), SHA256)
+    thread.join()
+    assert digest == hashlib.sha256(b'part1\npart2\n').digest()
+
+
+def test_iter_tree(tree, tmp_path):
+    (tmp_path / 'tree' / 'link').symlink_to(tmp_path / 'tree' / 'sub0')
+    assert sorted(batch.iter_tree(str(tmp_path / 'tree'))) == sorted(tree)
+
+
+
+def test_select_backend():
+    assert batch.select_backend(SHA256) == 'thread'
+    assert batch.select_backend(Hp.get_hash_index('XXH64')) == 'process'
+    assert batch.select_backend(SHA256, 'process') == 'process'
+    with pytest.raises(ValueError):
+        batch.select_backend(SHA256, 'bogus')
+
+
+def test_process_backend_xxhash(tree):
+    xxh64 = Hp.get_hash_index('XXH64')
+    expected = {}
+    for path in tree:
+        hasher = Hp.get_hash(xxh64).hasher.copy()
+        with open(path, 'rb') as file_:
+            hasher.update(file_.read())
+        expected[path] = hasher.digest()
+    assert {result.fname: result.digest for result in
+            batch.hash_files(tree, xxh64, 2)} == expected
+
+
+def test_hash_unique_reads_hard_links_once(tmp_path, monkeypatch):
+    root = tmp_path / 'tree'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'a').write_bytes(b'linked')
+    os.link(root / 'a', root / 'sub' / 'b')
+    os.link(root / 'a', root / 'c')
+    (root / 'd').write_bytes(b'single')
+    ids = dict(batch.iter_tree_ids(str(root)))
+    assert ids[str(root / 'd')] is None
+    assert len({ids[str(root / name)] for name in ('a', 'sub/b', 'c')}) == 1
+    read = []
+    hash_path = batch.hash_path
+
+    def recording_hash_path(fname, alg_id):
+        read.append(fname)
+        return hash_path(fname, alg_id)
+
+    monkeypatch.setattr(batch, 'hash_path', recording_hash_path)
+    results = list(batch.hash_unique(batch.iter_tree_ids(str(root)),
+                                     SHA256, 2, batch_size=1,
+                                     backend='thread'))
+    linked = hashlib.sha256(b'linked').digest()
+    assert {result.fname: result.digest for result in results} == {
+        str(root / 'a'): linked, str(root / 'sub' / 'b'): linked,
+        str(root / 'c'): linked,
+        str(root / 'd'): hashlib.sha256(b'single').digest()}
+    assert len(read) == 2
+
+
+def test_hash_files_ordered(tmp_path):
+    fnames = []
+    for idx in range(40):
+        path = tmp_path / f'file{idx}'
+        # Large files first, so that later batches finish first.
+        path.write_bytes(bytes((40 - idx) * 20000))
+        fnames.append(str(path))
+    results = list(batch.hash_files(fnames, SHA256, 4, batch_size=3,
+                                    backend='thread', ordered=True))
+    assert [result.fname for result in results] == fnames
+
+
+def test_iter_file_list_batches():
+    names = [f'name{idx}' for idx in range(10)]
+    data = io.BytesIO(('\n'.join(names) + '\n\n').encode())
+    batches = list(batch.iter_file_list(data, batch_size=4))
+    assert [len(item) for item in batches] == [4, 4, 2]
+    assert sum(batches, []) == names
+
+
+@pytest.mark.parametrize('separator, eol', [
+    (b'\n', b'\n'), (b'\n', b'\r\n'), (b'\0', b'\0')])
+def test_iter_file_list_chunk_boundary(separator, eol):
+    size = batch.LIST_CHUNK_SIZE
+    # The first end of line ends at the start of the second chunk (so
+    # CRLF straddles the boundary), the second name spans the next
+    # boundary, and the last name is not terminated.
+    names = [b'a' * (size - len(eol) + 1), b'b' * size, b'c']
+    data = eol.join(names)
+    assert data[size:size + 1] == eol[-1:]
+    items = sum(batch.iter_file_list(io.BytesIO(data), separator), [])
+    assert items == [name.decode() for name in names]
+
+
+def test_iter_file_list_keeps_carriage_return_with_nul():
+    data = io.BytesIO(b'name\r\0other\r\n\0')
+    assert sum(batch.iter_file_list(data, b'\0'), []) == ['name\r',
+                                                          'other\r\n']
+
+
+def test_iter_file_list_reads_as_consumed():
+    class Pipe(io.RawIOBase):
+        """Returns one name per read, as a slow writer would."""
+
+        def __init__(self, names):
+            self.names = list(names)
+            self.reads = 0
+
+        def readable(self):
+            return True
+
+        def read1(self, size=-1):
+            self.reads += 1
+            return self.names.pop(0) if self.names else b''
+
+    pipe = Pipe([b'one\n', b'two\n', b'three'])
+    batches = batch.iter_file_list(pipe)
+    assert next(batches) == ['one']
+    assert pipe.reads == 1
+    assert list(batches) == [['two'], ['three']]
@@ -0,0 +1,82 @@
+"""Tests for calc."""
+
+import hashlib
+import os
+
+import pytest
+
+import hash_profiles as Hp
+import calc
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+
+
+def test_quick_fingerprint_small_file(tmp_path):
+    path = tmp_path / 'small'
+    path.write_bytes(b'abc')
+    expected = hashlib.sha256(b'3abc').hexdigest()
+    assert calc.quick_fingerprint(str(path), SHA256) == \
+        f'{calc.QUICK_PREFIX}3:{expected}'
+
+
+def test_quick_fingerprint_samples_large_file(tmp_path):
+    path = tmp_path / 'large'
+    size = calc.QUICK_SAMPLES * calc.QUICK_BLOCKSIZE * 4
+    data = bytearray(size)
+    path.write_bytes(data)
+    before = calc.quick_fingerprint(str(path), SHA256)
+    # A change between sampled blocks is not seen...
+    data[calc.QUICK_BLOCKSIZE + 1] = 1
+    path.write_bytes(data)
+    assert calc.quick_fingerprint(str(path), SHA256) == before
+    # ...but a change in the last block is.
+    data[-1] = 1
+    path.write_bytes(data)
+    assert calc.quick_fingerprint(str(path), SHA256) != before
+
+
+def test_quick_fingerprint_rejects_pipe(tmp_path):
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+    with pytest.raises(ValueError):
+        calc.quick_fingerprint(str(fifo), SHA256)
+
+
+def test_quick_compare_escalates_when_fingerprints_match(tmp_path):
+    size = calc.QUICK_SAMPLES * calc.QUICK_BLOCKSIZE * 4
+    left = tmp_path / 'left'
+    right = tmp_path / 'right'
+    data = bytearray(size)
+    left.write_bytes(data)
+    data[calc.QUICK_BLOCKSIZE + 1] = 1
+    right.write_bytes(data)
+    assert calc.quick_compare(str(left), str(right), SHA256) == \
+        (False, True)
+    right.write_bytes(bytes(size))
+    assert calc.quick_compare(str(left), str(right), SHA256) == (True, True)
+
+
+def test_quick_compare_conclusive_difference(tmp_path):
+    left = tmp_path / 'left'
+    right = tmp_path / 'right'
+    left.write_bytes(b'a' * 10)
+    right.write_bytes(b'b' * 10)
+    assert calc.quick_compare(str(left), str(right), SHA256) == \
+        (False, False)
+
+
+def test_block_size_is_capped(tmp_path, monkeypatch):
+    path = tmp_path / 'huge'
+    with open(path, 'wb') as fp:
+        fp.truncate(100 * 1024 ** 3)
+    sizes = []
+
+    def recording_iter_blocks(fname, blocksize, cache_mode, prefetch):
+        sizes.append(blocksize)
+        return iter([b'data'])
+
+    monkeypatch.setattr(calc.readers, 'iter_blocks', recording_iter_blocks)
+    thread = calc.ChecksumThread(SHA256, None)
+    thread.get_hash(str(path))
+    assert sizes == [calc.readers.MAX_BLOCKSIZE]
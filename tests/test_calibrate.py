@@ -0,0 +1,55 @@
+"""Tests for calibrate."""
+
+import calibrate
+import calc
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'ezchecksum' / 'calibration.ini')
+    saved = calibrate.Calibration(262144, 8, 'SHA512')
+    calibrate.save(saved, path)
+    assert calibrate.load(path) == saved
+
+
+def test_load_missing_file(tmp_path):
+    assert calibrate.load(str(tmp_path / 'missing.ini')) is None
+
+
+def test_load_unknown_algorithm(tmp_path):
+    path = str(tmp_path / 'calibration.ini')
+    calibrate.save(calibrate.Calibration(65536, 4, 'NOPE256'), path)
+    assert calibrate.load(path) is None
+
+
+def test_load_invalid_values(tmp_path):
+    path = tmp_path / 'calibration.ini'
+    path.write_text('[calibration]\nblocksize = big\nworkers = 4\n'
+                    'fast_algorithm = SHA256\n')
+    assert calibrate.load(str(path)) is None
+    path.write_text('[other]\n')
+    assert calibrate.load(str(path)) is None
+
+
+def test_calibrate_thread_saves_result(tmp_path, monkeypatch):
+    result = calibrate.Calibration(1048576, 2, 'SHA256')
+    monkeypatch.setattr(calibrate, 'calibrate', lambda directory: result)
+    path = str(tmp_path / 'calibration.ini')
+    thread = calc.CalibrateThread(str(tmp_path), path)
+    emitted = []
+    thread.calibrated_sig.connect(emitted.append)
+    thread.run()
+    assert emitted == [result]
+    assert calibrate.load(path) == result
+
+
+def test_calibrate_thread_reports_errors(tmp_path, monkeypatch):
+    def fail(directory):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(calibrate, 'calibrate', fail)
+    thread = calc.CalibrateThread(str(tmp_path),
+                                  str(tmp_path / 'calibration.ini'))
+    errors = []
+    thread.error_sig.connect(errors.append)
+    thread.run()
+    assert errors == ['I/O error: 28\nNo space left on device']
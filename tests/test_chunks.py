@@ -0,0 +1,160 @@
+"""Tests for chunks."""
+
+import hashlib
+import os
+
+import pytest
+
+import hash_profiles as Hp
+import chunks
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+CHUNK = 4096
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / 'disk.img'
+    path.write_bytes(os.urandom(CHUNK * 5 + 100))
+    return str(path)
+
+
+def test_build(image):
+    built = chunks.build(image, SHA256, CHUNK, workers=2)
+    with open(image, 'rb') as fp:
+        data = fp.read()
+    assert built.size == len(data)
+    assert built.digests == [hashlib.sha256(data[idx:idx + CHUNK]).digest()
+                             for idx in range(0, len(data), CHUNK)]
+    assert built.chunk_range(5) == (CHUNK * 5, CHUNK * 5 + 100)
+
+
+def test_merkle_root_is_domain_separated():
+    leaves = [hashlib.sha256(bytes([idx])).digest() for idx in range(3)]
+
+    def sha(*parts):
+        return hashlib.sha256(b''.join(parts)).digest()
+
+    nodes = [sha(b'\x00', leaf) for leaf in leaves]
+    expected = sha(b'\x01', sha(b'\x01', nodes[0], nodes[1]), nodes[2])
+    assert chunks.merkle_root(leaves, SHA256) == expected
+    # A parent node cannot be passed off as the root of its children.
+    parent = sha(b'\x01', nodes[0], nodes[1])
+    assert chunks.merkle_root([parent], SHA256) != parent
+
+
+def test_sidecar_round_trip(tmp_path, image):
+    built = chunks.build(image, SHA256, CHUNK)
+    path = chunks.sidecar_path(image)
+    chunks.write_sidecar(path, built)
+    assert chunks.read_sidecar(path) == built
+
+
+@pytest.mark.parametrize('header, message', [
+    ('ezchunks 1', 'old format'),
+    ('ezchunks 9', 'bad header'),
+])
+def test_read_sidecar_bad_header(tmp_path, header, message):
+    path = tmp_path / 'file.ezchunks'
+    path.write_text(f'{header}\nalgorithm SHA256\nchunk_size 1\nsize 1\n'
+                    f'root 00\n00\n')
+    with pytest.raises(chunks.ChunkManifestError, match=message):
+        chunks.read_sidecar(str(path))
+
+
+def test_read_sidecar_unknown_algorithm(tmp_path, image):
+    path = chunks.sidecar_path(image)
+    chunks.write_sidecar(path, chunks.build(image, SHA256, CHUNK))
+    with open(path, encoding='ascii') as fp:
+        text = fp.read()
+    with open(path, 'w', encoding='ascii') as fp:
+        fp.write(text.replace('SHA256', 'NOPE256'))
+    with pytest.raises(chunks.ChunkManifestError, match='NOPE256'):
+        chunks.read_sidecar(path)
+
+
+def test_read_sidecar_damaged(image):
+    path = chunks.sidecar_path(image)
+    chunks.write_sidecar(path, chunks.build(image, SHA256, CHUNK))
+    with open(path, 'a', encoding='ascii') as fp:
+        fp.write('00' * 32 + '\n')
+    with pytest.raises(chunks.ChunkManifestError, match='damaged'):
+        chunks.read_sidecar(path)
+
+
+@pytest.mark.parametrize('idx, line, message', [
+    (2, 'chunk_size 0', 'bad chunk_size'),
+    (5, '00' * 16, 'not a SHA256 digest'),
+])
+def test_read_sidecar_bad_fields(image, idx, line, message):
+    path = chunks.sidecar_path(image)
+    chunks.write_sidecar(path, chunks.build(image, SHA256, CHUNK))
+    with open(path, encoding='ascii') as fp:
+        lines = fp.read().splitlines()
+    lines[idx] = line
+    with open(path, 'w', encoding='ascii') as fp:
+        fp.write('\n'.join(lines) + '\n')
+    with pytest.raises(chunks.ChunkManifestError, match=message):
+        chunks.read_sidecar(path)
+
+
+def test_build_rejects_zero_chunk_size(image, capsys):
+    with pytest.raises(SystemExit):
+        chunks.main(['build', '--chunk-mib', '0', image])
+    assert 'not a positive integer' in capsys.readouterr().err
+
+
+def test_verify(image):
+    built = chunks.build(image, SHA256, CHUNK)
+    assert chunks.verify(image, built) == []
+    with open(image, 'r+b') as fp:
+        fp.seek(CHUNK + 10)
+        fp.write(b'x')
+        fp.seek(CHUNK * 2 + 10)
+        fp.write(b'y')
+    assert chunks.verify(image, built) == [(CHUNK, CHUNK * 3)]
+
+
+def test_verify_size_change(image):
+    built = chunks.build(image, SHA256, CHUNK)
+    with open(image, 'ab') as fp:
+        fp.write(b'more')
+    assert chunks.verify(image, built) == [(CHUNK * 5, CHUNK * 5 + 104)]
+
+
+def test_update_rehashes_changed_chunks(image, monkeypatch):
+    built = chunks.build(image, SHA256, CHUNK)
+    with open(image, 'r+b') as fp:
+        fp.seek(CHUNK * 3 - 2)
+        fp.write(b'abcd')
+    hashed = []
+    hash_chunk = chunks.hash_chunk
+
+    def recording_hash_chunk(fname, alg_id, idx, chunk_size):
+        hashed.append(idx)
+        return hash_chunk(fname, alg_id, idx, chunk_size)
+
+    monkeypatch.setattr(chunks, 'hash_chunk', recording_hash_chunk)
+    updated = chunks.update(image, built, [(CHUNK * 3 - 2, CHUNK * 3 + 2)])
+    assert sorted(hashed) == [2, 3]
+    monkeypatch.undo()
+    assert updated == chunks.build(image, SHA256, CHUNK)
+
+
+def test_update_grown_file(image):
+    built = chunks.build(image, SHA256, CHUNK)
+    with open(image, 'ab') as fp:
+        fp.write(bytes(CHUNK))
+    assert chunks.update(image, built, []) == chunks.build(
+        image, SHA256, CHUNK)
+
+
+@pytest.mark.parametrize('ranges, expected', [
+    ([], []),
+    ([(5, 10), (0, 2)], [(0, 2), (5, 10)]),
+    ([(0, 5), (5, 10)], [(0, 10)]),
+    ([(0, 10), (2, 4), (8, 12)], [(0, 12)]),
+])
+def test_merge_ranges(ranges, expected):
+    assert chunks.merge_ranges(ranges) == expected
@@ -0,0 +1,134 @@
+"""Tests for cli."""
+
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import threading
+
+import hash_profiles as Hp
+import calc
+import cli
+
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'cli.py')
+
+
+def run_cli(*args, stdin=b''):
+    return subprocess.run([sys.executable, CLI, *args], input=stdin,
+                          capture_output=True, check=False)
+
+
+def test_stdin():
+    data = os.urandom(3 * calc.STREAM_BLOCKSIZE + 5)
+    proc = run_cli('-a', 'MD5', stdin=data)
+    assert proc.returncode == 0
+    assert proc.stdout.decode() == f'{hashlib.md5(data).hexdigest()}  -\n'
+
+
+def test_fifo(tmp_path):
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+    data = b'streamed ' * 1000
+
+    def writer():
+        with open(fifo, 'wb') as file_:
+            file_.write(data)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    digest = cli.hash_source(str(fifo), Hp.get_hash_index('SHA256'))
+    thread.join()
+    assert digest == hashlib.sha256(data).digest()
+
+
+def test_hash_stream_progress():
+    progress = []
+    digest, count = calc.hash_stream(io.BytesIO(b'x' * 10), 0, 4,
+                                     progress.append)
+    assert (digest, count) == (hashlib.md5(b'x' * 10).digest(), 10)
+    assert progress == [4, 8, 10]
+
+
+def test_missing_file_status(tmp_path):
+    proc = run_cli(str(tmp_path / 'missing'))
+    assert proc.returncode == 1
+    assert b'No such file' in proc.stderr
+
+
+def make_files(tmp_path, count=5):
+    files = {}
+    for idx in range(count):
+        path = tmp_path / f'file {idx}'
+        data = os.urandom(idx * 1000)
+        path.write_bytes(data)
+        files[str(path)] = hashlib.sha256(data).hexdigest()
+    return files
+
+
+def parse_output(stdout):
+    lines = stdout.decode().splitlines()
+    return [tuple(reversed(line.split('  ', 1))) for line in lines]
+
+
+def test_files_from_null_stdin(tmp_path):
+    files = make_files(tmp_path)
+    listing = b'\0'.join(os.fsencode(name) for name in files) + b'\0'
+    proc = run_cli('--files-from', '-', '-0', stdin=listing)
+    assert proc.returncode == 0
+    assert dict(parse_output(proc.stdout)) == files
+
+
+def test_files_from_crlf_in_input_order(tmp_path):
+    files = make_files(tmp_path, 20)
+    listing = tmp_path / 'list.txt'
+    listing.write_bytes(b''.join(os.fsencode(name) + b'\r\n'
+                                 for name in files))
+    proc = run_cli('--files-from', str(listing), '--order', 'input')
+    assert proc.returncode == 0
+    assert parse_output(proc.stdout) == list(files.items())
+
+
+def test_files_from_fifo(tmp_path):
+    files = make_files(tmp_path)
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+    with subprocess.Popen([sys.executable, CLI, '--files-from', str(fifo)],
+                          stdout=subprocess.PIPE) as proc:
+        with open(fifo, 'wb') as file_:
+            for name in files:
+                file_.write(os.fsencode(name) + b'\n')
+                file_.flush()
+        stdout, _ = proc.communicate(timeout=30)
+    assert proc.returncode == 0
+    assert dict(parse_output(stdout)) == files
+
+
+def test_files_from_lists_fifo(tmp_path):
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+    data = b'piece ' * 100000
+
+    def writer():
+        with open(fifo, 'wb') as file_:
+            for idx in range(0, len(data), 4096):
+                file_.write(data[idx:idx + 4096])
+                file_.flush()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    proc = run_cli('--files-from', '-', stdin=os.fsencode(str(fifo)))
+    thread.join()
+    assert proc.returncode == 0
+    assert parse_output(proc.stdout) == [
+        (str(fifo), hashlib.sha256(data).hexdigest())]
+
+
+def test_watch_append_error(tmp_path, capsys):
+    output = tmp_path / 'missing' / 'manifest.sha256'
+    status = cli.watch_dirs([str(tmp_path)], Hp.get_hash_index('SHA256'),
+                            str(output))
+    assert status == 2
+    assert 'No such file' in capsys.readouterr().err
@@ -0,0 +1,105 @@
+"""Tests for compare."""
+
+import os
+
+import pytest
+
+import hash_profiles as Hp
+import calc
+import compare
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+
+
+def make_trees(tmp_path, left_files, right_files):
+    roots = []
+    for name, files in (('left', left_files), ('right', right_files)):
+        root = tmp_path / name
+        for relpath, data in files.items():
+            path = root / relpath
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        roots.append(str(root))
+    return roots
+
+
+def statuses(comparisons):
+    return {item.relpath: item.status for item in comparisons}
+
+
+def test_quick_mode_escalates_matching_fingerprints(tmp_path):
+    size = calc.QUICK_SAMPLES * calc.QUICK_BLOCKSIZE * 4
+    changed = bytearray(size)
+    changed[calc.QUICK_BLOCKSIZE + 1] = 1
+    left, right = make_trees(
+        tmp_path,
+        {'same': bytes(size), 'hidden': bytes(size), 'end': bytes(size)},
+        {'same': bytes(size), 'hidden': bytes(changed),
+         'end': bytes(size - 1) + b'x'})
+    results = {item.relpath: item for item in
+               compare.compare_trees(left, right, SHA256, 'quick')}
+    assert results['same'].status == compare.SAME
+    assert results['hidden'].status == compare.DIFFERENT
+    assert results['hidden'].detail == 'full hash'
+    assert results['end'].detail == 'quick fingerprint'
+
+
+def test_first_difference(tmp_path):
+    left = tmp_path / 'left'
+    right = tmp_path / 'right'
+    left.write_bytes(b'abcdefgh' * 10)
+    right.write_bytes(b'abcdefgh' * 10)
+    assert compare.first_difference(str(left), str(right), 16) is None
+    right.write_bytes(b'abcdefgh' * 5 + b'X' + b'bcdefgh' + b'abcdefgh' * 4)
+    assert compare.first_difference(str(left), str(right), 16) == 40
+    right.write_bytes(b'abcdefgh' * 3)
+    assert compare.first_difference(str(left), str(right), 16) == 24
+
+
+@pytest.mark.parametrize('mode', ['hash', 'bytes'])
+def test_compare_trees(tmp_path, mode):
+    left, right = make_trees(
+        tmp_path,
+        {'same': b'data', 'changed': b'aaaa', 'size': b'a',
+         'sub/left': b'l'},
+        {'same': b'data', 'changed': b'aaab', 'size': b'ab',
+         'sub/right': b'r'})
+    results = {item.relpath: item for item in
+               compare.compare_trees(left, right, SHA256, mode, workers=2)}
+    assert statuses(results.values()) == {
+        'same': compare.SAME,
+        'changed': compare.DIFFERENT,
+        'size': compare.DIFFERENT,
+        os.path.join('sub', 'left'): compare.LEFT_ONLY,
+        os.path.join('sub', 'right'): compare.RIGHT_ONLY}
+    assert results['size'].detail == 'size 1 != 2'
+    if mode == 'bytes':
+        assert results['changed'].detail == 'first difference at byte 3'
+
+
+def test_trust_mtime(tmp_path):
+    left, right = make_trees(tmp_path, {'file': b'aaaa'}, {'file': b'bbbb'})
+    for root in (left, right):
+        os.utime(os.path.join(root, 'file'), ns=(0, 10 ** 9))
+    assert statuses(compare.compare_trees(
+        left, right, SHA256, trust_mtime=True)) == {'file': compare.SAME}
+    assert statuses(compare.compare_trees(
+        left, right, SHA256)) == {'file': compare.DIFFERENT}
+
+
+def test_invalid_mode(tmp_path):
+    left, right = make_trees(tmp_path, {}, {})
+    with pytest.raises(ValueError):
+        list(compare.compare_trees(left, right, SHA256, 'fast'))
+
+
+def test_report(capsys):
+    comparisons = [compare.Comparison('a', compare.SAME),
+                   compare.Comparison('b', compare.DIFFERENT, 'size 1 != 2'),
+                   compare.Comparison('c', compare.LEFT_ONLY)]
+    assert compare.report(comparisons) == 2
+    assert capsys.readouterr().out == ('different: b (size 1 != 2)\n'
+                                       'left only: c\n')
+    assert compare.report(comparisons, show_same=True) == 2
+    assert capsys.readouterr().out.startswith('same: a\n')
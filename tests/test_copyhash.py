@@ -0,0 +1,91 @@
+"""Tests for copyhash."""
+
+import hashlib
+import os
+import shutil
+
+import pytest
+
+import hash_profiles as Hp
+import copyhash
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+
+
+@pytest.fixture(name='source')
+def fixture_source(tmp_path):
+    path = tmp_path / 'source'
+    path.write_bytes(os.urandom(copyhash.BLOCKSIZE * 2 + 5))
+    os.chmod(path, 0o640)
+    os.utime(path, ns=(10 ** 9, 2 * 10 ** 9))
+    return path
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory)
+            if name.startswith('.ezchecksum-')]
+
+
+@pytest.mark.parametrize('verify', [False, True])
+def test_copy_and_hash(tmp_path, source, verify):
+    destination = tmp_path / 'out' / 'copy'
+    destination.parent.mkdir()
+    copied = []
+    result = copyhash.copy_and_hash(str(source), str(destination), SHA256,
+                                    verify, progress=copied.append)
+    data = source.read_bytes()
+    assert result.digest == hashlib.sha256(data).digest()
+    assert result.verified is (True if verify else None)
+    assert destination.read_bytes() == data
+    assert copied[-1] == len(data)
+    info = os.stat(destination)
+    assert info.st_mode & 0o777 == 0o640
+    assert info.st_mtime_ns == 2 * 10 ** 9
+    assert not leftovers(destination.parent)
+
+
+def test_failed_verification_keeps_destination(tmp_path, source,
+                                               monkeypatch):
+    destination = tmp_path / 'copy'
+    destination.write_bytes(b'old')
+    monkeypatch.setattr(copyhash.calc, 'hash_file',
+                        lambda *args: b'wrong')
+    result = copyhash.copy_and_hash(str(source), str(destination), SHA256,
+                                    verify=True)
+    assert result.verified is False
+    assert destination.read_bytes() == b'old'
+    assert not leftovers(tmp_path)
+
+
+def test_failed_copy_keeps_destination(tmp_path):
+    destination = tmp_path / 'copy'
+    destination.write_bytes(b'old')
+    with pytest.raises(OSError):
+        copyhash.copy_and_hash(str(tmp_path / 'missing'), str(destination),
+                               SHA256)
+    assert destination.read_bytes() == b'old'
+    assert not leftovers(tmp_path)
+
+
+def test_same_file(source):
+    with pytest.raises(shutil.SameFileError):
+        copyhash.copy_and_hash(str(source), str(source), SHA256)
+
+
+def test_main_copies_to_directory(tmp_path, source, capsys):
+    second = tmp_path / 'second'
+    second.write_bytes(b'second')
+    target = tmp_path / 'target'
+    target.mkdir()
+    assert copyhash.main([str(source), str(second), str(target),
+                          '--verify']) == 0
+    assert (target / 'second').read_bytes() == b'second'
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1] == (f'{hashlib.sha256(b"second").hexdigest()}  '
+                        f'{target / "second"}')
+
+
+def test_main_needs_directory_for_several_sources(tmp_path, source):
+    assert copyhash.main([str(source), str(source),
+                          str(tmp_path / 'missing')]) == 2
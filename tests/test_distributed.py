@@ -0,0 +1,158 @@
+"""Tests for distributed."""
+# pylint: disable=protected-access
+
+import hashlib
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+
+import pytest
+
+import hash_profiles as Hp
+import distributed
+
+
+SHA256 = Hp.get_hash_index('SHA256')
+KEY = b'test key'
+
+
+@pytest.fixture(name='store')
+def fixture_store(tmp_path):
+    """Files below tmp_path/store. Return {relative path: digest}."""
+    files = {}
+    for idx in range(7):
+        relpath = os.path.join(f'dir{idx % 2}', f'file{idx}')
+        path = tmp_path / 'store' / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = os.urandom(idx * 100)
+        path.write_bytes(data)
+        files[relpath] = hashlib.sha256(data).digest()
+    return files
+
+
+def test_is_below(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'out').symlink_to(tmp_path)
+    root = str(tmp_path / 'sub')
+    assert distributed.is_below(root, 'file')
+    assert distributed.is_below(root, os.path.join('a', '..', 'file'))
+    assert not distributed.is_below(root, os.path.join('..', 'file'))
+    assert not distributed.is_below(root, str(tmp_path / 'sub' / 'file'))
+    assert not distributed.is_below(root, os.path.join('out', 'file'))
+
+
+def test_hash_shard_rejects_paths_outside_root(tmp_path, store):
+    (tmp_path / 'secret').write_bytes(b'secret')
+    root = str(tmp_path / 'store')
+    results = {fname: (digest, error) for fname, digest, error in
+               distributed.hash_shard(
+                   ['../secret', str(tmp_path / 'secret'), 'dir0/file0'],
+                   SHA256, root)}
+    assert results['../secret'] == ('', 'Not below the root directory.')
+    assert results[str(tmp_path / 'secret')][0] == ''
+    assert results['dir0/file0'] == (store['dir0/file0'].hex(), '')
+
+
+def test_hash_shard_keeps_duplicates_in_order(tmp_path, store):
+    root = str(tmp_path / 'store')
+    files = ['dir0/file2', './dir0/file2', '../x', 'dir0/file2']
+    results = distributed.hash_shard(files, SHA256, root)
+    digest = store['dir0/file2'].hex()
+    assert results == [['dir0/file2', digest, ''],
+                       ['./dir0/file2', digest, ''],
+                       ['../x', '', 'Not below the root directory.'],
+                       ['dir0/file2', digest, '']]
+
+
+def test_hash_distributed(tmp_path, store):
+    root = str(tmp_path / 'store')
+    with distributed.local_cluster(2, KEY, root) as nodes:
+        results = list(distributed.hash_distributed(
+            list(store) + ['missing'], SHA256, nodes, KEY, shard_size=2))
+    assert {result.fname: result.digest for result in results
+            if not result.error} == store
+    assert [result.fname for result in results if result.error] == [
+        'missing']
+
+
+def test_worker_rejects_malformed_requests(tmp_path, store):
+    root = str(tmp_path / 'store')
+    with distributed.local_cluster(1, KEY, root) as nodes:
+        with Client(nodes[0], authkey=KEY) as conn:
+            conn.send_bytes(b'not json')
+            assert 'error' in distributed._recv(conn)
+            for request in ([], {'id': 1}, {'id': 2, 'algorithm': 'NOPE',
+                                            'files': []},
+                            {'id': 3, 'algorithm': 'SHA256',
+                             'files': [1]}):
+                distributed._send(conn, request)
+                reply = distributed._recv(conn)
+                assert 'error' in reply
+                assert reply['id'] == (request.get('id')
+                                       if request else None)
+            # The worker is still serving.
+            distributed._send(conn, {'id': 4, 'algorithm': 'SHA256',
+                                     'files': ['dir0/file0']})
+            assert distributed._recv(conn) == {
+                'id': 4, 'results': [['dir0/file0',
+                                      store['dir0/file0'].hex(), '']]}
+
+
+@pytest.mark.parametrize('failure', ['close', 'hang', 'error'])
+def test_failed_node_work_is_sent_elsewhere(tmp_path, store, failure,
+                                            capsys):
+    root = str(tmp_path / 'store')
+    stop = threading.Event()
+
+    def bad_node(listener):
+        with listener.accept() as conn:
+            if failure == 'error':
+                request = distributed._recv(conn)
+                distributed._send(conn, {'id': request['id'],
+                                         'error': 'Out of cheese.'})
+            elif failure == 'hang':
+                stop.wait(10)
+
+    with Listener(('127.0.0.1', 0), authkey=KEY) as listener, \
+            distributed.local_cluster(1, KEY, root) as nodes:
+        host, port = listener.address
+        thread = threading.Thread(target=bad_node, args=(listener,))
+        thread.start()
+        try:
+            results = list(distributed.hash_distributed(
+                store, SHA256, [listener.address] + nodes, KEY,
+                shard_size=1, timeout=1.0))
+        finally:
+            stop.set()
+            thread.join()
+    assert {result.fname: result.digest for result in results} == store
+    assert capsys.readouterr().err.startswith(f'{host}:{port}: ')
+
+
+def test_no_nodes_left(tmp_path):
+    with Listener(('127.0.0.1', 0), authkey=KEY) as listener:
+        thread = threading.Thread(
+            target=lambda: listener.accept().close())
+        thread.start()
+        with pytest.raises(distributed.DistributedError):
+            list(distributed.hash_distributed(
+                ['file'], SHA256, [listener.address], KEY))
+        thread.join()
+
+
+def test_main_local(tmp_path, store, capsys):
+    output = tmp_path / 'store.sha256'
+    assert distributed.main(['run', '--local', '2', '--root',
+                             str(tmp_path / 'store'), '--output',
+                             str(output), 'dir0', 'dir1']) == 0
+    lines = output.read_text().splitlines()
+    assert lines == [f'{store[relpath].hex()}  {relpath}'
+                     for relpath in sorted(store)]
+    assert distributed.main(['run', '--local', '1', '--root',
+                             str(tmp_path / 'store'), '--verify',
+                             str(output)]) == 0
+    (tmp_path / 'store' / 'dir0' / 'file0').write_bytes(b'changed')
+    assert distributed.main(['run', '--local', '1', '--root',
+                             str(tmp_path / 'store'), '--verify',
+                             str(output)]) == 1
+    assert 'dir0/file0: FAILED' in capsys.readouterr().out
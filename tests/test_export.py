@@ -0,0 +1,65 @@
+"""Tests for export."""
+
+import csv
+import io
+import json
+
+import pytest
+
+import export
+
+
+def export_text(exporter_class, results):
+    stream = io.StringIO()
+    exporter = exporter_class(stream)
+    for result in results:
+        exporter.write(*result)
+    text = stream.getvalue()
+    exporter.close()
+    return text
+
+
+RESULTS = [('a.txt', 'SHA256', '01ab'), ('dir/b, "c"', 'SHA256', '02cd')]
+
+
+def test_exporter_is_abstract():
+    with pytest.raises(TypeError):
+        # pylint: disable-next=abstract-class-instantiated
+        export.Exporter(io.StringIO())
+
+
+def test_json_lines():
+    lines = export_text(export.JsonLinesExporter, RESULTS).splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'file': name, 'algorithm': alg, 'checksum': checksum}
+        for name, alg, checksum in RESULTS]
+
+
+def test_csv_round_trip():
+    text = export_text(export.CsvExporter, RESULTS)
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows == [['file', 'algorithm', 'checksum']] + \
+        [list(result) for result in RESULTS]
+
+
+def test_gnu_and_bsd():
+    assert export_text(export.GnuExporter, RESULTS[:1]) == '01ab  a.txt\n'
+    assert export_text(export.BsdExporter, [('x\ny', 'MD5', 'ff')]) == \
+        '\\MD5 (x\\ny) = ff\n'
+
+
+def test_exporter_counts_and_flushes():
+    stream = io.StringIO()
+    exporter = export.GnuExporter(stream, flush=True)
+    exporter.write('a', 'MD5', '00')
+    assert exporter.count == 1
+    assert stream.getvalue() == '00  a\n'
+
+
+def test_open_exporter(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    with export.open_exporter(str(path), 'JSON Lines') as exporter:
+        exporter.write('a', 'MD5', '00')
+    assert json.loads(path.read_text())['file'] == 'a'
+    with pytest.raises(ValueError):
+        export.open_exporter(str(path), 'XML')
@@ -0,0 +1,71 @@
+"""Tests for manifest."""
+
+import os
+
+import pytest
+
+import manifest
+
+
+def test_escape_round_trip():
+    for name in ('plain.txt', 'back\\slash', 'new\nline', 'cr\rname'):
+        escaped, was_escaped = manifest.escape_name(name)
+        assert was_escaped == (name != 'plain.txt')
+        assert '\n' not in escaped
+        assert manifest.unescape_name(escaped) == name
+
+
+def test_format_line_escaped_prefix():
+    assert manifest.format_line('ab', 'a\nb') == '\\ab  a\\nb\n'
+    assert manifest.format_line('ab', 'file') == 'ab  file\n'
+
+
+def test_writer_sorts_and_publishes_on_close(tmp_path):
+    path = tmp_path / 'out.sha256'
+    writer = manifest.ManifestWriter(str(path))
+    writer.add('b', '02')
+    writer.add('a', '01')
+    assert not path.exists()
+    writer.close()
+    assert path.read_text() == '01  a\n02  b\n'
+    assert writer.count == 2
+    assert os.listdir(tmp_path) == ['out.sha256']
+
+
+def test_writer_unsorted_keeps_order(tmp_path):
+    path = tmp_path / 'out.md5'
+    with manifest.ManifestWriter(str(path), sort=False) as writer:
+        writer.add('b', '02')
+        writer.add('a', '01')
+    assert path.read_text() == '02  b\n01  a\n'
+
+
+def test_writer_abort_leaves_existing_file(tmp_path):
+    path = tmp_path / 'out.sha256'
+    path.write_text('old\n')
+    with pytest.raises(RuntimeError):
+        with manifest.ManifestWriter(str(path)) as writer:
+            writer.add('a', '01')
+            raise RuntimeError
+    assert path.read_text() == 'old\n'
+    assert os.listdir(tmp_path) == ['out.sha256']
+
+
+def test_add_after_close_raises(tmp_path):
+    writer = manifest.ManifestWriter(str(tmp_path / 'out'))
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.add('a', '01')
+
+
+def test_atomic_open_replaces_only_on_success(tmp_path):
+    path = tmp_path / 'data'
+    with manifest.atomic_open(str(path)) as file_:
+        file_.write(b'new')
+    assert path.read_bytes() == b'new'
+    with pytest.raises(OSError):
+        with manifest.atomic_open(str(path)) as file_:
+            file_.write(b'partial')
+            raise OSError('failed')
+    assert path.read_bytes() == b'new'
+    assert os.listdir(tmp_path) == ['data']
@@ -0,0 +1,55 @@
+"""Tests for profiler."""
+
+import threading
+
+import profiler
+import cli
+
+
+def busy():
+    return sum(range(10000))
+
+
+def test_session_profiles_threads(tmp_path):
+    path = str(tmp_path / 'report.txt')
+    profiler.start()
+    assert profiler.active()
+    thread = threading.Thread(target=busy)
+    thread.start()
+    thread.join()
+    busy()
+    report = profiler.stop(path)
+    assert not profiler.active()
+    assert report is not None and 'busy' in report
+    with open(path, encoding='utf8') as file_:
+        assert file_.readline().endswith('threads profiled.\n')
+    assert (tmp_path / 'report.txt.prof').stat().st_size > 0
+
+
+def test_stop_without_session(tmp_path):
+    assert profiler.stop(str(tmp_path / 'report.txt')) is None
+    assert not (tmp_path / 'report.txt').exists()
+
+
+def test_profile_thread_without_session():
+    with profiler.profile_thread():
+        busy()
+    assert not profiler.active()
+
+
+def test_cli_profile(tmp_path, capsys):
+    data = tmp_path / 'data'
+    data.write_bytes(b'data')
+    report = tmp_path / 'report.txt'
+    assert cli.main(['--profile', str(report), str(data)]) == 0
+    assert report.exists()
+    assert capsys.readouterr().err == f'Profile written to {report}\n'
+
+
+def test_cli_profile_write_error_keeps_status(tmp_path, capsys):
+    report = tmp_path / 'missing' / 'report.txt'
+    assert cli.main(['--profile', str(report),
+                     str(tmp_path / 'no such file')]) == 1
+    err = capsys.readouterr().err
+    assert f'{report}: No such file or directory' in err
+    assert not profiler.active()
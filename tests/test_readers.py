@@ -0,0 +1,151 @@
+"""Tests for readers."""
+
+import errno
+import hashlib
+import os
+import threading
+
+import pytest
+
+import readers
+
+
+SIZES = (0, 1, 4095, 4096, 65536 * 3 + 17)
+
+
+def digest(blocks):
+    hasher = hashlib.sha256()
+    for block in blocks:
+        hasher.update(block)
+    return hasher.digest()
+
+
+@pytest.fixture(name='make_file')
+def fixture_make_file(tmp_path):
+    def make_file(size, name='data'):
+        path = tmp_path / name
+        data = os.urandom(size)
+        path.write_bytes(data)
+        return str(path), hashlib.sha256(data).digest()
+    return make_file
+
+
+@pytest.mark.parametrize('cache_mode', readers.CACHE_MODES)
+@pytest.mark.parametrize('size', SIZES)
+def test_cache_modes(make_file, cache_mode, size):
+    path, expected = make_file(size)
+    assert digest(readers.iter_blocks(path, 65536, cache_mode)) == expected
+
+
+def test_direct_blocks_are_aligned(make_file):
+    path, _ = make_file(65536 * 2 + 1)
+    lengths = [len(block) for block in
+               readers.iter_blocks(path, 5000, 'direct')]
+    assert sum(lengths) == 65536 * 2 + 1
+    # Direct reads (where supported) use page aligned sizes.
+    assert lengths[0] in (5000, readers.aligned_size(5000))
+
+
+def test_aligned_size():
+    assert readers.aligned_size(1) == readers.ALIGNMENT
+    assert readers.aligned_size(readers.ALIGNMENT) == readers.ALIGNMENT
+    assert readers.aligned_size(readers.ALIGNMENT + 1) == \
+        2 * readers.ALIGNMENT
+
+
+def test_invalid_cache_mode(make_file):
+    path, _ = make_file(10)
+    with pytest.raises(ValueError):
+        list(readers.iter_blocks(path, 65536, 'bogus'))
+
+
+@pytest.mark.parametrize('cache_mode', readers.CACHE_MODES)
+@pytest.mark.parametrize('size', SIZES)
+def test_prefetch(make_file, cache_mode, size):
+    path, expected = make_file(size)
+    # Each block is hashed before the next is requested, as the views
+    # are of reused buffers.
+    assert digest(readers.iter_blocks(path, 4096, cache_mode, 3)) == \
+        expected
+
+
+def test_prefetch_stops_reader_when_closed_early(make_file):
+    path, _ = make_file(65536 * 8)
+    blocks = readers.iter_blocks(path, 4096, 'normal', 2)
+    next(blocks)
+    blocks.close()
+    assert not [thread for thread in threading.enumerate()
+                if thread.name == 'ezchecksum-reader']
+
+
+def test_prefetch_reader_error_is_raised(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(readers.iter_blocks(str(tmp_path / 'missing'), 4096,
+                                 'normal', 2))
+
+
+@pytest.mark.parametrize('size', SIZES + (readers.ALIGNMENT * 10 + 1,))
+def test_iter_network(make_file, size):
+    path, expected = make_file(size)
+    assert digest(readers.iter_network(path, 4096, 3)) == expected
+
+
+def test_read_at_retries_transient_errors(make_file, monkeypatch):
+    path, expected = make_file(100)
+    preadv = os.preadv
+    failures = [errno.EIO, errno.EAGAIN]
+
+    def flaky_preadv(fd, buffers, offset):
+        if failures:
+            raise OSError(failures.pop(), 'Transient')
+        return preadv(fd, buffers, offset)
+
+    monkeypatch.setattr(os, 'preadv', flaky_preadv)
+    assert digest(readers.iter_network(path, 4096, 1)) == expected
+    assert not failures
+
+
+def test_read_at_gives_up(make_file, monkeypatch):
+    path, _ = make_file(100)
+
+    def failing_preadv(fd, buffers, offset):
+        raise OSError(errno.EIO, 'Input/output error')
+
+    monkeypatch.setattr(os, 'preadv', failing_preadv)
+    monkeypatch.setattr(readers, 'RETRY_DELAY', 0.001)
+    with pytest.raises(OSError):
+        list(readers.iter_network(path, 4096, 1, retries=2))
+
+
+def test_read_at_does_not_retry_other_errors(make_file, monkeypatch):
+    path, _ = make_file(100)
+    calls = []
+
+    def failing_preadv(fd, buffers, offset):
+        calls.append(offset)
+        raise OSError(errno.EBADF, 'Bad file descriptor')
+
+    monkeypatch.setattr(os, 'preadv', failing_preadv)
+    with pytest.raises(OSError):
+        list(readers.iter_network(path, 4096, 1))
+    assert calls == [0]
+
+
+def test_sparse_file(tmp_path):
+    path = tmp_path / 'sparse'
+    with open(path, 'wb') as fp:
+        fp.write(b'start')
+        fp.seek(10 * 1024 * 1024)
+        fp.write(b'middle')
+        fp.truncate(20 * 1024 * 1024)
+    if not readers.is_sparse(str(path)):
+        pytest.skip('Filesystem does not support sparse files.')
+    expected = hashlib.sha256(path.read_bytes()).digest()
+    assert digest(readers.iter_blocks(str(path), 65536)) == expected
+    # pylint: disable-next=protected-access
+    assert digest(readers._iter_sparse(str(path), 4096, True)) == expected
+
+
+def test_is_sparse(make_file):
+    path, _ = make_file(100000)
+    assert not readers.is_sparse(path)
@@ -0,0 +1,85 @@
+"""Tests for refindex."""
+
+import hashlib
+
+import pytest
+
+import refindex
+
+
+def digest(text):
+    return hashlib.sha256(text.encode()).digest()
+
+
+@pytest.fixture(name='index_path')
+def fixture_index_path(tmp_path):
+    path = tmp_path / 'known.idx'
+    entries = [(digest(str(idx)), f'build: file{idx}') for idx in range(500)]
+    entries.append((digest('0'), 'other: copy of file0'))
+    assert refindex.build_index(str(path), entries) == 501
+    return str(path)
+
+
+def test_lookup(index_path):
+    index = refindex.ReferenceIndex(index_path)
+    assert sorted(index.lookup(digest('0'))) == ['build: file0',
+                                                 'other: copy of file0']
+    assert index.lookup(digest('499')) == ['build: file499']
+    assert index.lookup(digest('missing')) == []
+    assert index.lookup(b'short') == []
+    assert index.lookup_hex(digest('7').hex()) == ['build: file7']
+    assert index.lookup_hex('not hex') == []
+    index.close()
+    # Mapped again on use.
+    assert index.lookup(digest('1')) == ['build: file1']
+    index.close()
+
+
+@pytest.mark.parametrize('fraction', [0.0, 0.01, 0.5, 0.99])
+def test_truncated_index(index_path, fraction):
+    with open(index_path, 'rb') as file_:
+        data = file_.read()
+    with open(index_path, 'wb') as file_:
+        file_.write(data[:int(len(data) * fraction)])
+    index = refindex.ReferenceIndex(index_path)
+    with pytest.raises(refindex.ReferenceIndexError):
+        index.lookup(digest('0'))
+    # pylint: disable-next=protected-access
+    assert index._map is None
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / 'other'
+    path.write_bytes(b'x' * 1000)
+    with pytest.raises(refindex.ReferenceIndexError):
+        refindex.ReferenceIndex(str(path)).lookup(digest('0'))
+    with pytest.raises(refindex.ReferenceIndexError):
+        refindex.ReferenceIndex(str(tmp_path / 'missing')).lookup(b'')
+
+
+def test_mixed_digest_sizes(tmp_path):
+    with pytest.raises(refindex.ReferenceIndexError):
+        refindex.build_index(str(tmp_path / 'idx'),
+                             [(b'1' * 16, 'a'), (b'2' * 32, 'b')])
+
+
+def test_parse_manifest_line():
+    checksum = 'A' * 64
+    assert refindex.parse_manifest_line(f'{checksum}  file\n') == \
+        (checksum.lower(), 'file')
+    assert refindex.parse_manifest_line(f'{checksum} *bin\n') == \
+        (checksum.lower(), 'bin')
+    assert refindex.parse_manifest_line(f'\\{checksum}  a\\nb\n') == \
+        (checksum.lower(), 'a\nb')
+    assert refindex.parse_manifest_line('nonsense\n') is None
+
+
+def test_main_labels_paths_with_equals(tmp_path, capsys):
+    manifest_path = tmp_path / 'a=b.sha256'
+    manifest_path.write_text(f'{digest("x").hex()}  x.bin\n')
+    index_path = str(tmp_path / 'known.idx')
+    assert refindex.main(['build', index_path,
+                          f'rel={manifest_path}']) == 0
+    capsys.readouterr()
+    assert refindex.main(['query', index_path, digest('x').hex()]) == 0
+    assert capsys.readouterr().out.endswith('  rel: x.bin\n')
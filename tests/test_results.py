@@ -0,0 +1,60 @@
+"""Tests for results."""
+
+import pytest
+
+from results import Result, ResultStore
+
+
+def test_result_hexdigest():
+    assert Result('a', b'\x01\xff').hexdigest == '01ff'
+    assert Result('a', error='Failed.').hexdigest == ''
+
+
+def test_store_round_trip():
+    store = ResultStore()
+    results = [Result('b', b'\x02' * 4), Result('café', b'\x01' * 4),
+               Result('bad\udcff', b'\x03' * 4), Result('', b'\x00' * 4)]
+    for result in results:
+        store.append(result)
+    assert len(store) == 4
+    assert list(store) == results
+    assert store.name(2) == 'bad\udcff'
+    assert store.sorted_indexes() == [3, 0, 2, 1]
+
+
+def test_store_errors_before_and_after_first_digest():
+    store = ResultStore()
+    store.append(Result('early', error='Unreadable.'))
+    store.append(Result('ok', b'\xaa' * 2))
+    store.append(Result('late', error='Gone.'))
+    assert store.digest_size == 2
+    assert list(store) == [Result('early', None, 'Unreadable.'),
+                           Result('ok', b'\xaa' * 2),
+                           Result('late', None, 'Gone.')]
+    assert store.digest(0) is None
+
+
+def test_store_matches():
+    store = ResultStore()
+    store.append(Result('a', b'\x01\x02'))
+    store.append(Result('b', error='Failed.'))
+    assert store.matches(0, b'\x01\x02')
+    assert not store.matches(0, b'\x01\x03')
+    assert not store.matches(0, b'\x01')
+    assert not store.matches(1, bytes(2))
+
+
+def test_store_rejects_mixed_sizes():
+    store = ResultStore(4)
+    with pytest.raises(ValueError):
+        store.append(Result('a', b'\x01'))
+
+
+def test_store_clear():
+    store = ResultStore()
+    store.append(Result('a', b'\x01'))
+    store.append(Result('b', error='x'))
+    store.clear()
+    assert len(store) == 0
+    store.append(Result('c', b'\x02'))
+    assert list(store) == [Result('c', b'\x02')]
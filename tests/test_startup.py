@@ -0,0 +1,31 @@
+"""Tests that the GUI defers loading modules not needed at start up."""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY = ('calc', 'calibrate', 'dialogs', 'export', 'manifest', 'profiler',
+        'refindex')
+
+SHOW_WINDOW = '''
+import sys
+from PyQt6.QtWidgets import QApplication
+import ezchecksum
+app = QApplication([])
+window = ezchecksum.ShaApp()
+window.show()
+app.processEvents()
+# A lazy module becomes a plain module when first used.
+print(' '.join(name for name in {lazy!r}
+               if type(sys.modules[name]).__name__ != '_LazyModule'))
+'''
+
+
+def test_lazy_modules_not_loaded_at_start_up():
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, '-c', SHOW_WINDOW.format(lazy=LAZY)], cwd=ROOT,
+        env=env, capture_output=True, text=True, check=True, timeout=60)
+    assert proc.stdout.split() == []
@@ -0,0 +1,105 @@
+"""Tests for throttle."""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import throttle
+
+
+def test_token_bucket_paces_to_rate():
+    bucket = throttle.TokenBucket(1e6)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.consume(50000)
+    assert time.monotonic() - start >= 0.19
+
+
+def test_cpu_limiter_sleeps_for_cpu_used():
+    wall = time.monotonic()
+    cpu = time.thread_time()
+    limiter = throttle.CpuLimiter(0.5)
+    while time.thread_time() < cpu + 0.05:
+        pass
+    used = time.thread_time() - cpu
+    limiter.pace()
+    # Elapsed time may exceed CPU time on a loaded machine, so check
+    # the total rather than the sleep.
+    assert time.monotonic() - wall >= used / 0.5 - 0.01
+
+
+def test_throttled_bandwidth():
+    blocks = [b'x' * 100000] * 3
+    start = time.monotonic()
+    assert list(throttle.throttled(
+        blocks, throttle.Limits(bandwidth=1.0))) == blocks
+    assert time.monotonic() - start >= 0.29
+
+
+def test_unlimited_is_not_wrapped():
+    blocks = iter([b'a', b'b'])
+    assert list(throttle.throttled(blocks, throttle.Limits())) == [b'a',
+                                                                    b'b']
+
+
+def test_apply_priority_lowers_thread_nice():
+    if not sys.platform.startswith('linux'):
+        pytest.skip('per thread priorities are Linux only')
+    seen = []
+
+    def worker():
+        throttle.apply_priority(throttle.Limits(nice=5))
+        seen.append(throttle.os.getpriority(
+            throttle.os.PRIO_PROCESS, threading.get_native_id()))
+
+    before = throttle.os.getpriority(throttle.os.PRIO_PROCESS, 0)
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert seen[0] >= 5
+    assert throttle.os.getpriority(throttle.os.PRIO_PROCESS, 0) == before
+
+
+def test_apply_priority_does_nothing_off_linux(monkeypatch):
+    calls = []
+    monkeypatch.setattr(throttle.sys, 'platform', 'darwin')
+    monkeypatch.setattr(throttle.os, 'setpriority',
+                        lambda *args: calls.append(args), raising=False)
+    monkeypatch.setattr(throttle, '_set_ioprio', calls.append)
+    throttle.apply_priority(throttle.Limits(io_class='idle', nice=5))
+    assert not calls
+
+
+@pytest.mark.parametrize('machine, pointer, expected', [
+    ('x86_64', 8, 251),
+    # 32 bit interpreter on a 64 bit kernel.
+    ('x86_64', 4, 289),
+    ('i686', 4, 289),
+    ('aarch64', 8, 30),
+    ('aarch64', 4, 314),
+    ('armv7l', 4, 314),
+    ('mips64', 8, None),
+])
+def test_ioprio_syscall(monkeypatch, machine, pointer, expected):
+    uname = throttle.os.uname()
+    monkeypatch.setattr(
+        throttle.os, 'uname',
+        lambda: type(uname)(uname[:4] + (machine,)))
+    monkeypatch.setattr(throttle.struct, 'calcsize', lambda fmt: pointer)
+    # pylint: disable-next=protected-access
+    assert throttle._ioprio_syscall() == expected
+
+
+def test_ioprio_falls_back_to_ionice(monkeypatch):
+    calls = []
+    monkeypatch.setattr(throttle, '_ioprio_syscall', lambda: None)
+    monkeypatch.setattr(throttle.shutil, 'which', lambda name: '/ionice')
+    monkeypatch.setattr(subprocess, 'run',
+                        lambda args, **kwargs: calls.append(args))
+    # pylint: disable-next=protected-access
+    throttle._set_ioprio('idle')
+    assert calls == [['/ionice', '-c', '3', '-p',
+                      str(threading.get_native_id())]]
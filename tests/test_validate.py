@@ -0,0 +1,111 @@
+"""Tests for validate."""
+
+import time
+
+import pytest
+
+import hash_profiles as Hp
+import validate
+
+
+MD5 = Hp.get_hash_index('MD5')
+SHA256 = Hp.get_hash_index('SHA256')
+XXH32 = Hp.get_hash_index('XXH32')
+
+
+def test_hash_index():
+    assert validate.hash_index('A' * 64) == SHA256
+    assert validate.hash_index('a' * 63) is None
+    assert validate.hash_index('g' * 64) is None
+    assert validate.is_valid_hash('0' * 32)
+
+
+def test_find_hashes_formats():
+    text = (f'Release notes, 2024\n'
+            f'SHA256 (ez-1.0.tar.gz) = {"A" * 64}\n'
+            f'{"b" * 64}  ez-1.0.zip\r\n'
+            f'{"c" * 8} *small.bin\n'
+            f'\\{"d" * 32}  new\\nline\n'
+            f'Checksum: {"e" * 32}\n')
+    assert validate.find_hashes(text) == [
+        validate.HashCandidate(SHA256, 'a' * 64, 'ez-1.0.tar.gz'),
+        validate.HashCandidate(SHA256, 'b' * 64, 'ez-1.0.zip'),
+        validate.HashCandidate(XXH32, 'c' * 8, 'small.bin'),
+        validate.HashCandidate(MD5, 'd' * 32, 'new\nline'),
+        validate.HashCandidate(MD5, 'e' * 32, ''),
+    ]
+
+
+def test_short_tokens_need_context():
+    text = 'Built 20240101 from 0123456789abcdef at 12345678.\n'
+    assert validate.find_hashes(text) == []
+
+
+def test_find_hashes_is_linear():
+    def scan_time(count):
+        text = 'deadbeef20240101 ' * count + 'f' * 64
+        start = time.perf_counter()
+        assert len(validate.find_hashes(text)) == 1
+        return time.perf_counter() - start
+    scan_time(1000)
+    # Quadratic scanning would take about 16 times as long.
+    assert scan_time(80000) < scan_time(20000) * 8
+
+
+def test_select_hash():
+    candidates = [validate.HashCandidate(MD5, 'a' * 32, 'other.iso'),
+                  validate.HashCandidate(SHA256, 'b' * 64, 'dir/file.iso'),
+                  validate.HashCandidate(SHA256, 'c' * 64, '')]
+    assert validate.select_hash(candidates, 'file.iso').checksum == 'b' * 64
+    assert validate.select_hash(candidates, 'x', SHA256).checksum == \
+        'b' * 64
+    assert validate.select_hash(candidates, 'x', XXH32).checksum == 'a' * 32
+    assert validate.select_hash([]) is None
+
+
+def test_validate_many_all_valid():
+    checksums = ['0123456789abcdef' * 4, 'ABCDEF01' * 4, 'deadbeef']
+    result = validate.validate_many(checksums)
+    assert result.valid == [True, True, True]
+    assert result.candidates == [(SHA256,), (MD5,), (XXH32,)]
+    assert result.digests == [bytes.fromhex(item) for item in checksums]
+
+
+def test_validate_many_mixed_falls_back():
+    checksums = ['a' * 64, 'g' * 64, 'b' * 63, 'c' * 30 + ' c',
+                 'not a checksum', 'd' * 32]
+    result = validate.validate_many(checksums)
+    assert result.valid == [True, False, False, False, False, True]
+    assert result.candidates == [(SHA256,), (), (), (), (), (MD5,)]
+    assert result.digests == [bytes.fromhex('a' * 64), None, None, None,
+                              None, bytes.fromhex('d' * 32)]
+
+
+def test_validate_many_alg_id():
+    result = validate.validate_many(['a' * 64, 'b' * 32], SHA256)
+    assert result.valid == [True, False]
+    with pytest.raises(ValueError):
+        validate.validate_many(['a' * 64], len(Hp.HASH_TYPES))
+
+
+def test_validate_many_strict():
+    assert validate.validate_many(['a' * 64], strict=True).valid == [True]
+    with pytest.raises(validate.InvalidChecksumError) as info:
+        validate.validate_many(['a' * 64, 'b' * 32, 'x' * 32, 'y'],
+                               strict=True)
+    assert (info.value.position, info.value.checksum) == (2, 'x' * 32)
+
+
+def test_validate_many_type_error():
+    with pytest.raises(TypeError):
+        validate.validate_many(['a' * 64, b'b' * 64])
+
+
+def test_validate_many_empty():
+    assert validate.validate_many([]) == validate.BulkValidation([], [], [])
+
+
+def test_find_hashes_short_hex_before_checksum():
+    text = f'1234  sha256: {"a" * 64}\n{"b" * 10}  not-a-checksum\n'
+    assert validate.find_hashes(text) == [
+        validate.HashCandidate(SHA256, 'a' * 64, '')]
@@ -0,0 +1,185 @@
+"""Tests for watch (Linux only)."""
+
+import errno
+import hashlib
+import queue
+import sys
+import threading
+import time
+
+import pytest
+
+import hash_profiles as Hp
+import throttle
+import watch
+
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'),
+                                reason='inotify is Linux only')
+
+SHA256 = Hp.get_hash_index('SHA256')
+LIMITS = throttle.Limits(bandwidth=100.0)
+
+
+@pytest.fixture(name='watcher')
+def fixture_watcher(tmp_path):
+    """Watch tmp_path. Yield a queue of results."""
+    results: queue.Queue = queue.Queue()
+    errors: list = []
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=watch.watch,
+        args=([str(tmp_path)], SHA256, results.put, stop),
+        kwargs={'debounce': 0.2, 'onerror': errors.append,
+                'limits': LIMITS})
+    thread.start()
+    try:
+        # Rewrite a file until the watch has been added and it is seen.
+        for _ in range(50):
+            (tmp_path / 'ready').write_bytes(b'')
+            try:
+                results.get(timeout=0.3)
+                break
+            except queue.Empty:
+                pass
+        # Let results of earlier rewrites arrive, and discard them.
+        time.sleep(0.5)
+        while not results.empty():
+            results.get()
+        yield results
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not errors
+
+
+def test_hashes_written_file(watcher, tmp_path):
+    (tmp_path / 'new').write_bytes(b'data')
+    result = watcher.get(timeout=5)
+    assert result.fname == str(tmp_path / 'new')
+    assert result.digest == hashlib.sha256(b'data').digest()
+
+
+def test_debounces_rewrites(watcher, tmp_path):
+    for count in range(5):
+        (tmp_path / 'busy').write_bytes(b'x' * count)
+    result = watcher.get(timeout=5)
+    assert result.digest == hashlib.sha256(b'x' * 4).digest()
+    with pytest.raises(queue.Empty):
+        watcher.get(timeout=0.5)
+
+
+def test_new_directory(watcher, tmp_path):
+    subdir = tmp_path / 'sub'
+    subdir.mkdir()
+    (subdir / 'file').write_bytes(b'nested')
+    result = watcher.get(timeout=5)
+    assert result.fname == str(subdir / 'file')
+    assert result.digest == hashlib.sha256(b'nested').digest()
+
+
+def test_applies_limits(watcher, tmp_path, monkeypatch):
+    used = []
+    throttled = throttle.throttled
+
+    def recording_throttled(blocks, limits):
+        used.append(limits)
+        return throttled(blocks, limits)
+
+    monkeypatch.setattr(throttle, 'throttled', recording_throttled)
+    (tmp_path / 'new').write_bytes(b'data')
+    assert watcher.get(timeout=5).digest == hashlib.sha256(b'data').digest()
+    assert used == [LIMITS]
+
+
+def start(tmp_path, write, stop, **kwargs):
+    """Watch tmp_path in a thread. Return the thread and a list that
+    receives an exception raised by watch."""
+    raised: list = []
+
+    def run():
+        try:
+            watch.watch([str(tmp_path)], SHA256, write, stop,
+                        debounce=0.1, **kwargs)
+        except Exception as err:  # pylint: disable=broad-except
+            raised.append(err)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, raised
+
+
+def test_write_error_is_reported(tmp_path):
+    calls: list = []
+    errors: list = []
+    stop = threading.Event()
+
+    def write(result):
+        calls.append(result)
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    thread, raised = start(tmp_path, write, stop, onerror=errors.append)
+    try:
+        # Keep writing until the watch survives a second failed write.
+        for _ in range(50):
+            (tmp_path / 'file').write_bytes(b'data')
+            time.sleep(0.3)
+            if len(calls) >= 2:
+                break
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert len(calls) >= 2
+    assert [err.errno for err in errors] == [errno.ENOSPC] * len(calls)
+    assert not raised
+
+
+def test_write_exception_stops_watch(tmp_path):
+    stop = threading.Event()
+
+    def write(_result):
+        raise RuntimeError('broken sink')
+
+    thread, raised = start(tmp_path, write, stop)
+    for _ in range(50):
+        (tmp_path / 'file').write_bytes(b'data')
+        thread.join(timeout=0.3)
+        if not thread.is_alive():
+            break
+    stop.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert [str(err) for err in raised] == ['broken sink']
+
+
+def test_stop_drops_queued_files(tmp_path):
+    calls: list = []
+    entered = threading.Event()
+    release = threading.Event()
+    stop = threading.Event()
+
+    def write(result):
+        calls.append(result)
+        entered.set()
+        release.wait()
+
+    thread, raised = start(tmp_path, write, stop, max_queue=1)
+    try:
+        for _ in range(50):
+            (tmp_path / 'first').write_bytes(b'data')
+            if entered.wait(timeout=0.3):
+                break
+        # Fill the queue, and leave the watch waiting to queue more.
+        for count in range(5):
+            (tmp_path / f'file{count}').write_bytes(b'data')
+        time.sleep(0.5)
+        stop.set()
+        time.sleep(0.2)
+    finally:
+        release.set()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert len(calls) == 1
+    assert not raised
@@ -0,0 +1,167 @@
+"""Limits on the I/O and CPU used by hashing, for background work.
+
+    Limits:
+
+    - Bandwidth: Reads are paced to an average rate in MB/s.
+    - I/O class: ``low`` (lowest best-effort priority) or ``idle``
+      (only when the disk is otherwise idle). Linux only.
+    - Nice: CPU scheduling priority, 0 to 19. Linux only.
+    - CPU share: Percentage of one CPU that the hashing thread may use.
+      The thread sleeps after each block until its CPU time is within
+      the share of the elapsed time.
+
+Priorities are applied to the calling thread only (see:
+:py:func:`apply_priority`), so a GUI thread keeps its priority, and are
+inherited by threads that it starts. They can only be lowered, and
+failures are ignored, as they are hints rather than requirements.
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, NamedTuple
+
+if TYPE_CHECKING:
+    from readers import Block
+
+
+IO_CLASSES: tuple[str, ...] = ('normal', 'low', 'idle')
+
+# ioprio_set() arguments from <linux/ioprio.h>
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO = {'low': (2 << _IOPRIO_CLASS_SHIFT) | 7,  # Best effort, level 7
+           'idle': 3 << _IOPRIO_CLASS_SHIFT}
+# ioprio_set system call number by (architecture, pointer bits) of the
+# interpreter. A 32 bit interpreter on a 64 bit kernel uses the 32 bit
+# numbers, although uname() reports the 64 bit machine.
+_IOPRIO_SET = {('x86', 64): 251, ('x86', 32): 289, ('arm', 64): 30,
+               ('arm', 32): 314, ('riscv', 64): 30, ('ppc', 64): 273,
+               ('ppc', 32): 273, ('s390', 64): 282, ('s390', 32): 282}
+# Architecture by prefix of the machine name.
+_ARCHITECTURES = (('x86', 'x86'), ('i386', 'x86'), ('i686', 'x86'),
+                  ('amd64', 'x86'), ('aarch64', 'arm'), ('arm', 'arm'),
+                  ('riscv', 'riscv'), ('ppc', 'ppc'), ('s390', 's390'))
+# ionice arguments for each I/O class.
+_IONICE = {'low': ['-c', '2', '-n', '7'], 'idle': ['-c', '3']}
+
+
+class Limits(NamedTuple):
+    """Limits on the resources used by a hashing thread. The defaults
+    are unlimited."""
+    bandwidth: float = 0.0  # MB/s. 0 is unlimited.
+    io_class: str = 'normal'  # One of IO_CLASSES.
+    nice: int = 0
+    cpu_share: int = 100  # Percent of one CPU.
+
+
+class TokenBucket:
+    """Pace reads to an average of rate bytes per second. May be shared
+    by several threads."""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, nbytes: int) -> None:
+        """Account for nbytes read, sleeping if ahead of the rate."""
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(now, self._next) + nbytes / self.rate
+            delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CpuLimiter:
+    """Limit the CPU time of the calling thread to share (0 to 1) of the
+    elapsed time."""
+
+    def __init__(self, share: float) -> None:
+        self.share = share
+        self._cpu = time.thread_time()
+        self._wall = time.monotonic()
+
+    def pace(self) -> None:
+        """Sleep until CPU use is within the share."""
+        cpu = time.thread_time() - self._cpu
+        delay = cpu / self.share - (time.monotonic() - self._wall)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _ioprio_syscall() -> 'int | None':
+    """Return the ioprio_set system call number for this interpreter,
+    or None if not known."""
+    machine = os.uname().machine
+    bits = struct.calcsize('P') * 8
+    for prefix, arch in _ARCHITECTURES:
+        if machine.startswith(prefix):
+            return _IOPRIO_SET.get((arch, bits))
+    return None
+
+
+def _set_ioprio(io_class: str) -> None:
+    """Set I/O priority of the calling thread with ioprio_set(), or
+    with the ionice command if the system call number is not known."""
+    if io_class not in _IOPRIO:
+        return
+    number = _ioprio_syscall()
+    if number is not None:
+        import ctypes  # pylint: disable=import-outside-toplevel
+        libc = ctypes.CDLL(None, use_errno=True)
+        # who = 0 is the calling thread.
+        libc.syscall(number, _IOPRIO_WHO_PROCESS, 0, _IOPRIO[io_class])
+        return
+    ionice = shutil.which('ionice')
+    if ionice is not None:
+        try:
+            subprocess.run([ionice, *_IONICE[io_class], '-p',
+                            str(threading.get_native_id())],
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=False)
+        except OSError:
+            pass
+
+
+def apply_priority(limits: Limits) -> None:
+    """Lower the CPU and I/O priority of the calling thread.
+    Only Linux has per thread priorities, so elsewhere this does
+    nothing."""
+    if not sys.platform.startswith('linux'):
+        return
+    if limits.nice > 0:
+        tid = threading.get_native_id()
+        try:
+            current = os.getpriority(os.PRIO_PROCESS, tid)
+            os.setpriority(os.PRIO_PROCESS, tid,
+                           max(current, min(19, limits.nice)))
+        except OSError:
+            pass
+    if limits.io_class != 'normal':
+        _set_ioprio(limits.io_class)
+
+
+def throttled(blocks: Iterable['Block'], limits: Limits
+              ) -> Iterator['Block']:
+    """Yield blocks, pacing them to the bandwidth and CPU limits. The
+    time taken to hash each block is included."""
+    bucket = (TokenBucket(limits.bandwidth * 1e6)
+              if limits.bandwidth > 0 else None)
+    cpu = (CpuLimiter(limits.cpu_share / 100)
+           if 0 < limits.cpu_share < 100 else None)
+    if bucket is None and cpu is None:
+        yield from blocks
+        return
+    for buf in blocks:
+        length = len(buf)
+        yield buf
+        if bucket is not None:
+            bucket.consume(length)
+        if cpu is not None:
+            cpu.pace()
@@ -3,13 +3,76 @@
 """Validate module contains functions handling validation / verification."""
 
 import os
-from typing import Optional
+import stat
+from itertools import compress
+from typing import Iterable, NamedTuple, Optional
 import re
 import hash_profiles as Hp
 
 
+# Precompiled once for all hash types. The per-profile regexes match
+# the same strings, but require a lookup and a search per call.
+_HEX = re.compile(r'[0-9a-f]+', re.I)
+_IDX_FROM_LENGTH: 'dict[int, int]' = {
+    alg.length: idx for idx, alg in enumerate(Hp.HASH_TYPES)}
+# {hex length: indexes of all HASH_TYPES of that length}
+_CANDIDATES: 'dict[int, tuple[int, ...]]' = {
+    length: tuple(idx for idx, alg in enumerate(Hp.HASH_TYPES)
+                  if alg.length == length)
+    for length in _IDX_FROM_LENGTH}
+# Candidate checksums in arbitrary text, as one pattern so that the
+# text is scanned once. A GNU or BSD line is matched whole, so a line
+# is not searched again for its file name.
+_DIGEST = '(?:' + '|'.join(
+    f'[0-9a-f]{{{length}}}' for length in sorted(_IDX_FROM_LENGTH,
+                                                 reverse=True)) + ')'
+_SCANNER = re.compile(
+    # BSD tag: 'SHA256 (file name) = <hash>'
+    r'^[ \t]*[\w-]+[ \t]*\((?P<bsd_name>[^\n]*)\)[ \t]*=[ \t]*'
+    rf'(?P<bsd_hash>{_DIGEST})[ \t]*$'
+    # GNU: '<hash>  <file name>' or '<hash> *<file name>', with a
+    # leading backslash if the file name is escaped. Only hashes of a
+    # valid length, so that other lines are searched for tokens.
+    rf'|^(?P<escaped>\\)?(?P<gnu_hash>{_DIGEST}) [ *](?P<gnu_name>[^\n]+)'
+    # Any other hex token. Word boundaries as the profile regexes.
+    r'|\b(?P<token>[0-9a-f]+)\b', re.I | re.M)
+# Shorter hex tokens (XXH32 and XXH64), such as dates and build
+# numbers, are common in text, so are only taken from GNU or BSD lines.
+_MIN_TOKEN_LENGTH = 32
+
+
+HashCandidate = NamedTuple('HashCandidate', [('index', int),
+                                             ('checksum', str),
+                                             ('fname', str)])
+
+
+class BulkValidation(NamedTuple):
+    """Results of validate_many(), one item per checksum."""
+    valid: 'list[bool]'
+    # HASH_TYPES indexes that each checksum could be.
+    candidates: 'list[tuple[int, ...]]'
+    # Raw digests, or None where invalid.
+    digests: 'list[bytes | None]'
+
+
+class InvalidChecksumError(ValueError):
+    """Raised by validate_many(strict=True) for an invalid checksum."""
+
+    def __init__(self, position: int, checksum: str) -> None:
+        super().__init__(f'Invalid checksum at {position}: "{checksum}"')
+        self.position = position
+        self.checksum = checksum
+
+
+def hash_index(text: str) -> Optional[int]:
+    """Return HASH_TYPES index if text is a valid checksum, else None."""
+    idx = _IDX_FROM_LENGTH.get(len(text))
+    if idx is not None and _HEX.fullmatch(text):
+        return idx
+    return None
+
+
 def hash_from_line(line: str) -> 'tuple[int, str] | None':
-    # TODO: We only really need the index.
     """Extract hash string from line of text.
 
     Return
@@ -17,32 +80,143 @@ def hash_from_line(line: str) -> 'tuple[int, str] | None':
         tuple or None
             Tuple in the form: (index, hash)
     """
-    _idx = Hp.hash_idx_from_length(len(line))
-    if is_valid_hash(line):
+    _idx = hash_index(line)
+    if _idx is not None:
         return (_idx, line)
+    return None
 
 
 def set_validator(parent, text: str) -> None:
     """Sets and disables the hashChoiceButton and
     parent.has_validator: bool
     """
-    parent.has_validator = False
-    if Hp.is_valid_hash_length(len(text)):
-        hash_tuple: 'tuple[int, str] | None' = hash_from_line(text)
-        if hash_tuple:
-            parent.hashChoiceButton.setCurrentIndex(hash_tuple[0])
-            # Ensure that we have a clean hex string
-            parent.validateLineEdit.setText(hash_tuple[1])
-            parent.has_validator = True
+    _idx = hash_index(text)
+    parent.has_validator = _idx is not None
+    if _idx is not None:
+        parent.hashChoiceButton.setCurrentIndex(_idx)
 
 
 def is_valid_hash(chksum: str) -> bool:
     """Return True if chksum could be a valid checksum."""
-    if Hp.is_valid_hash_length(len(chksum)):
-        _idx = Hp.hash_idx_from_length(len(chksum))
-        _match = Hp.HASH_TYPES[_idx].regex.search(chksum)
-        return bool(_match)
-    return False
+    return hash_index(chksum) is not None
+
+
+def _unhex(text: str) -> Optional[bytes]:
+    """Return bytes of hex string text, or None if not all hex."""
+    try:
+        raw = bytes.fromhex(text)
+    except ValueError:
+        return None
+    # fromhex() skips whitespace.
+    return raw if len(raw) * 2 == len(text) else None
+
+
+def validate_many(checksums: Iterable[str], alg_id: Optional[int] = None,
+                  strict: bool = False) -> BulkValidation:
+    """Validate many checksums, such as a manifest column, at once.
+
+    Checksums of a valid length are joined, and checked for hex digits
+    with one bytes.fromhex(). Only if the joined text is not all hex is
+    each checksum checked alone. Unlike
+    hash_profiles.get_hash_name(), errors raise rather than exit.
+
+    Args:
+        alg_id: Int. If given, only checksums of that HASH_TYPES index
+        are valid.
+        strict: Bool. Raise InvalidChecksumError for the first invalid
+        checksum.
+
+    Raises
+    ------
+        TypeError
+            If a checksum is not a str.
+        ValueError
+            If alg_id is not a HASH_TYPES index.
+    """
+    items = list(checksums)
+    for position, item in enumerate(items):
+        if not isinstance(item, str):
+            raise TypeError(f'Checksum at {position} is not a str: '
+                            f'{type(item).__name__}.')
+    if alg_id is None:
+        lengths = _CANDIDATES
+    elif 0 <= alg_id < len(Hp.HASH_TYPES):
+        lengths = {Hp.HASH_TYPES[alg_id].length: (alg_id,)}
+    else:
+        raise ValueError(f'"{alg_id}" is not a HASH_TYPES index.')
+    candidates = [lengths.get(len(item), ()) for item in items]
+    raw = _unhex(''.join(compress(items, candidates)))
+    digests: 'list[bytes | None]'
+    if raw is not None:
+        # Slice each digest from the joined bytes.
+        digests = []
+        offset = 0
+        for item, found in zip(items, candidates):
+            if found:
+                end = offset + len(item) // 2
+                digests.append(raw[offset:end])
+                offset = end
+            else:
+                digests.append(None)
+    else:
+        digests = [_unhex(item) if found else None
+                   for item, found in zip(items, candidates)]
+    valid = [digest is not None for digest in digests]
+    candidates = [found if ok else ()
+                  for found, ok in zip(candidates, valid)]
+    if strict and not all(valid):
+        position = valid.index(False)
+        raise InvalidChecksumError(position, items[position])
+    return BulkValidation(valid, candidates, digests)
+
+
+def find_hashes(text: str) -> 'list[HashCandidate]':
+    """Return every candidate checksum in a block of text, such as a
+    release page listing several files and checksums.
+
+    Text is scanned once. Hex tokens are classified by length, and the
+    file name is taken from lines in GNU (``<hash>  <file>``) or BSD
+    (``ALG (<file>) = <hash>``) format. Other tokens have no file name,
+    and must be at least as long as an MD5 checksum.
+    """
+    candidates = []
+    for match in _SCANNER.finditer(text):
+        checksum, fname = match.group('token'), ''
+        if checksum is None:
+            if match.group('bsd_hash') is not None:
+                checksum, fname = match.group('bsd_hash', 'bsd_name')
+            else:
+                checksum, fname = match.group('gnu_hash', 'gnu_name')
+                fname = fname.rstrip()
+                if match.group('escaped'):
+                    # Imported here, as manifest is not needed at start up.
+                    import manifest  # pylint: disable=import-outside-toplevel
+                    fname = manifest.unescape_name(fname)
+        elif len(checksum) < _MIN_TOKEN_LENGTH:
+            continue
+        idx = _IDX_FROM_LENGTH.get(len(checksum))
+        if idx is not None:
+            candidates.append(HashCandidate(idx, checksum.lower(), fname))
+    return candidates
+
+
+def select_hash(candidates: 'list[HashCandidate]', fname: str = '',
+                alg_id: Optional[int] = None) -> Optional[HashCandidate]:
+    """Return the best candidate for file fname.
+
+    Preference is for a candidate naming the file, then for one of
+    algorithm alg_id, then the first candidate.
+    """
+    if not candidates:
+        return None
+    if fname:
+        for candidate in candidates:
+            if candidate.fname and os.path.basename(candidate.fname) == fname:
+                return candidate
+    for candidate in candidates:
+        if candidate.index == alg_id:
+            return candidate
+    return candidates[0]
 
 
 def file_exists(fname: str, path: Optional[str] = None) -> bool:
@@ -50,3 +224,12 @@ def file_exists(fname: str, path: Optional[str] = None) -> bool:
     if path:
         fname = os.path.join(path, fname)
     return os.path.isfile(fname)
+
+
+def is_stream(fname: str) -> bool:
+    """Return True if fname is a pipe or character device."""
+    try:
+        mode = os.stat(fname).st_mode
+    except OSError:
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISCHR(mode)
@@ -0,0 +1,225 @@
+"""Continuous verification of directories using Linux inotify.
+
+Files are hashed once they are closed after writing (or moved into a
+watched directory), and the results appended to a manifest. Rapid
+rewrites of a file are debounced, so that a file is only hashed once it
+has been quiet for a short time. Files waiting to be hashed are held in
+a bounded queue. When the queue is full, reading of events pauses and
+the kernel buffers them.
+
+inotify is used through ctypes, so no additional package is required.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+import batch
+import calc
+import readers
+import throttle
+from results import Result
+
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+# struct inotify_event: wd, mask, cookie, len, followed by name.
+_EVENT = struct.Struct('iIII')
+
+# Seconds a file must be unchanged before it is hashed.
+DEBOUNCE = 1.0
+# Maximum number of files waiting to be hashed.
+MAX_QUEUE = 1024
+
+
+class Inotify:
+    """Minimal wrapper of the inotify API.
+
+    Args:
+        onerror: Called with an OSError for each directory that cannot
+        be watched, and on event queue overflow.
+    """
+
+    def __init__(self,
+                 onerror: Optional[Callable[[OSError], None]] = None) -> None:
+        self.onerror = onerror
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        # {watch descriptor: directory}
+        self._dirs: 'dict[int, str]' = {}
+
+    def add_watch(self, directory: str) -> None:
+        """Watch directory, reporting failures to onerror."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                          _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            self._error(OSError(err, os.strerror(err), directory))
+            return
+        self._dirs[wd] = directory
+
+    def add_tree(self, root: str) -> None:
+        """Watch root and all directories below it."""
+        self.add_watch(root)
+        for dirpath, dirnames, _ in os.walk(root, onerror=self._error):
+            for name in dirnames:
+                self.add_watch(os.path.join(dirpath, name))
+
+    def read(self) -> 'list[tuple[str, int]]':
+        """Return available events as [(path, mask), ...]."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._error(OSError(0, 'inotify event queue overflow. '
+                                    'Some files may not be hashed.'))
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is not None:
+                events.append((os.path.join(directory, name), mask))
+        return events
+
+    def _error(self, err: OSError) -> None:
+        if self.onerror is not None:
+            self.onerror(err)
+
+    def close(self) -> None:
+        """Close the inotify file descriptor."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def watch(roots: Iterable[str], alg_id: int,
+          write: Callable[[Result], None],
+          stop: threading.Event,
+          debounce: float = DEBOUNCE, max_queue: int = MAX_QUEUE,
+          onerror: Optional[Callable[[OSError], None]] = None,
+          limits: throttle.Limits = throttle.Limits(),
+          blocksize: int = calc.STREAM_BLOCKSIZE) -> None:
+    """Hash files in roots as they are written, until stop is set.
+
+    Files still waiting to be hashed when stop is set are dropped.
+
+    Args:
+        write: Called with each Result, from the hashing thread. An
+        OSError that it raises (such as a full disk) is passed to
+        onerror, and watching continues. Any other exception stops
+        watching, and is raised.
+        stop: Set to stop watching.
+        debounce: Float. Seconds a file must be unchanged before it is
+        hashed.
+        max_queue: Int. Maximum number of files waiting to be hashed.
+        limits: throttle.Limits applied to the hashing thread.
+        blocksize: Int. Read size.
+    """
+    notify = Inotify(onerror)
+    jobs: 'queue.Queue[Optional[str]]' = queue.Queue(max_queue)
+    # Set when watching ends, so that the hasher drops queued files.
+    done = threading.Event()
+    # Exception that stopped the hasher.
+    failed: 'list[BaseException]' = []
+
+    def hasher() -> None:
+        throttle.apply_priority(limits)
+        while (fname := jobs.get()) is not None:
+            if done.is_set():
+                continue
+            try:
+                digest, _ = calc.hash_blocks(throttle.throttled(
+                    readers.iter_blocks(fname, blocksize), limits), alg_id)
+                result = Result(fname, digest)
+            except OSError as err:
+                result = Result(fname, error=f'{err.strerror}.')
+            try:
+                write(result)
+            except OSError as err:
+                if onerror is not None:
+                    onerror(err)
+            except BaseException as err:  # pylint: disable=broad-except
+                failed.append(err)
+                return
+
+    def put(item: Optional[str]) -> bool:
+        """Queue item, unless the hasher has stopped, or (for a file)
+        watching is stopped while the queue is full."""
+        while worker.is_alive():
+            if item is not None and stop.is_set():
+                return False
+            try:
+                jobs.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    worker = threading.Thread(target=hasher, name='ezchecksum-watch')
+    worker.start()
+    # {path: time when it may be hashed}, in order of deadline.
+    pending: 'OrderedDict[str, float]' = OrderedDict()
+    try:
+        for root in roots:
+            notify.add_tree(root)
+        while not stop.is_set() and worker.is_alive():
+            timeout = 0.5
+            if pending:
+                timeout = min(timeout, max(
+                    0.0, next(iter(pending.values())) - time.monotonic()))
+            ready, _, _ = select.select([notify.fd], [], [], timeout)
+            if ready:
+                for path, mask in notify.read():
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            # Watch new directory, and hash files that
+                            # arrived before the watch was added.
+                            notify.add_tree(path)
+                            for fname in batch.iter_tree(path, onerror):
+                                pending[fname] = time.monotonic() + debounce
+                        continue
+                    if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        pending.pop(path, None)
+                        pending[path] = time.monotonic() + debounce
+            now = time.monotonic()
+            while pending and next(iter(pending.values())) <= now:
+                path, _ = pending.popitem(last=False)
+                # Waits while the queue is full.
+                if not put(path):
+                    break
+    finally:
+        done.set()
+        put(None)
+        worker.join()
+        notify.close()
+    if failed:
+        raise failed[0]